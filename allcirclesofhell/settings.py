@@ -129,6 +129,58 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Limits of live game instances cache (see game.mechanics.game_manager.GameManager)
+GAME_MANAGER = {
+    'MAX_GAMES': 1000,
+    'MAX_WEIGHT': 200000,  # summary weight of cached games, see GameInstance.weight
+    'IDLE_TIMEOUT': 30 * 60,  # seconds
+    'DB_WORKERS': 4,  # threads making db queries of game requests, 0 to make them in request thread
+}
+
+# Store of live games snapshots, shared between worker processes (see game.mechanics.session_store).
+# LocalMemoryStore shares games between threads of single process only. For several workers use
+# FileStore with OPTIONS {'path': ...} or SocketStore with OPTIONS {'address': ...} and `manage.py run_session_store`
+GAME_SESSION_STORE = {
+    'BACKEND': 'game.mechanics.session_store.LocalMemoryStore',
+    'OPTIONS': {},
+}
+
+# Process-wide cache of handbook models (see game.mechanics.handbook)
+GAME_HANDBOOK = {
+    'CHECK_INTERVAL': 5,  # seconds between checks, whether handbook was changed by another process
+}
+
+# Background saving of changed games (see game.mechanics.autosave)
+GAME_AUTOSAVE = {
+    'DELAY': 10,  # seconds, changes of the game within the delay are written at once
+    'BATCH_SIZE': 100,  # games written by single query
+    'WORKERS': 2,
+    'INLINE': False,
+    'MAX_ATTEMPTS': 3,  # failed writes of the game, after which its changes are dropped
+}
+
+# Per-game actors, running requests for live games (see game.mechanics.actors)
+GAME_ACTORS = {
+    'WORKERS': 8,  # games processed in parallel
+    'MAILBOX_SIZE': 100,  # requests waiting for single game, extra requests are rejected
+    'TIMEOUT': 30,  # seconds to wait for request result
+    'INLINE': False,
+}
+
+# Server of turn streams over persistent connections (see game.mechanics.turn_stream), run by
+# `manage.py run_turn_stream`
+GAME_TURN_STREAM = {
+    'HOST': '127.0.0.1',
+    'PORT': 8001,
+}
+
+# Timing of request phases (see game.mechanics.instrumentation), available at /stats/ for admins
+GAME_INSTRUMENTATION = {
+    'SAMPLE_RATE': 0.01,  # part of requests, which are measured
+    'COUNT_QUERIES': True,  # count db queries of every phase
+    'LOG_INTERVAL': 0,  # seconds between printing of histograms, 0 to disable
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',  # <-- And here
@@ -14,5 +14,7 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('admin/', admin.site.urls),
     path('api-token-auth/', auth_views.obtain_auth_token),
+    path('stats/', views.StatsView.as_view(), name='stats'),
+    path('game/batch/', views.GameBatchAction.as_view(), name='game_batch_action'),
     url('game/', views.GameAction.as_view(), name='game_action')
 ]
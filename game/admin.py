@@ -1,8 +1,10 @@
 from django.contrib import admin
 from .models import HeroModel, ItemModel, SpellModel, EffectModel, SkillModel, GameModel, UnitModel, SpellEffectModel, \
-    GameStructureModel, ItemEffectModel, SkillEffectModel
+    GameStructureModel, ItemEffectModel, SkillEffectModel, TurnRecordModel, GameSnapshotModel
 
 admin.site.register(GameModel)
+admin.site.register(TurnRecordModel)
+admin.site.register(GameSnapshotModel)
 admin.site.register(HeroModel)
 admin.site.register(EffectModel)
 admin.site.register(ItemModel)
@@ -0,0 +1,42 @@
+import json
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.turn_log import load_snapshot, load_turns
+from game.models import GameModel
+
+
+class Command(BaseCommand):
+    help = 'Reconstruct game from turn log up to given turn, measuring every replayed turn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_id', type=int)
+        parser.add_argument('--turn', type=int, default=None, help='Last turn to replay, the latest one by default')
+        parser.add_argument('--top', type=int, default=5, help='Number of the slowest turns to show')
+
+    def handle(self, *args, **options):
+        try:
+            game = GameInstance.load(options['game_id'])
+        except GameModel.DoesNotExist:
+            raise CommandError(f'Game {options["game_id"]} not found')
+        snapshot = load_snapshot(options['game_id'], options['turn'])
+        if snapshot is None:
+            raise CommandError('There is no snapshot of the game to start replay from')
+        snapshot_turn, state_data = snapshot
+        game.restore_snapshot(state_data)
+        timings = []
+        for record in load_turns(options['game_id'], snapshot_turn, options['turn']):
+            started = perf_counter()
+            if not game.replay_turns([record]):
+                self.stderr.write(f'Replay stopped at turn {record.turn}')
+                break
+            timings.append((perf_counter() - started, record))
+
+        total = sum(seconds for seconds, _ in timings)
+        self.stdout.write(f'Replayed {len(timings)} turns from snapshot of turn {snapshot_turn} '
+                          f'up to turn {game.turn} in {total * 1000:.2f} ms')
+        for seconds, record in sorted(timings, key=lambda timing: timing[0], reverse=True)[:options['top']]:
+            self.stdout.write(f'  turn {record.turn}: {seconds * 1000:.2f} ms {json.dumps(record.action)}')
+        self.stdout.write(json.dumps(game.dump_state()))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.mechanics.benchmarks import DEFAULT_RADII, DEFAULT_UNITS, DEFAULT_THRESHOLD, run_benchmarks, compare, \
+    save_baseline, load_baseline
+
+
+def int_list(value: str) -> list:
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark board, actions, state and full turn hot paths. Can save and compare with baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--radii', type=int_list, default=list(DEFAULT_RADII), help='Comma separated radii')
+        parser.add_argument('--units', type=int_list, default=list(DEFAULT_UNITS), help='Comma separated counts')
+        parser.add_argument('--filter', default='', help='Run only cases, which names contain this string')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of measurements of every case')
+        parser.add_argument('--save', metavar='PATH', help='Save results as baseline json')
+        parser.add_argument('--compare', metavar='PATH', help='Compare results with baseline json')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative slowdown, reported as regression')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(options['radii'], options['units'], options['filter'], options['repeat'])
+        if options['save']:
+            save_baseline(results, options['save'])
+        if not options['compare']:
+            for result in results:
+                self.stdout.write(f'{result.name:<80} {result.seconds * 1e6:>12.2f}us')
+            return
+
+        comparisons = compare(results, load_baseline(options['compare']), options['threshold'])
+        for comparison in comparisons:
+            baseline = f'{comparison.baseline * 1e6:>12.2f}us' if comparison.baseline is not None else ' ' * 14
+            ratio = f'{comparison.ratio:>6.2f}x' if comparison.ratio is not None else ' ' * 7
+            line = f'{comparison.name:<80} {comparison.seconds * 1e6:>12.2f}us {baseline} {ratio} {comparison.status}'
+            self.stdout.write(self.style.ERROR(line) if comparison.status == 'regression' else line)
+        regressions = [comparison.name for comparison in comparisons if comparison.status == 'regression']
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions found')
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.mechanics.session_store import SessionStoreServer
+
+
+class Command(BaseCommand):
+    help = 'Run session store server for SocketStore backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', help='Path to unix socket. Taken from GAME_SESSION_STORE by default')
+
+    def handle(self, *args, **options):
+        address = options['address'] or settings.GAME_SESSION_STORE.get('OPTIONS', {}).get('address')
+        if not address:
+            self.stderr.write('Socket address is not set')
+            return
+        with SessionStoreServer(address) as server:
+            self.stdout.write(f'Session store is listening {address}')
+            server.serve_forever()
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.mechanics.turn_stream import TurnStreamServer
+
+
+class Command(BaseCommand):
+    help = 'Run server, streaming game turns over persistent connections'
+
+    def add_arguments(self, parser):
+        options = getattr(settings, 'GAME_TURN_STREAM', {})
+        parser.add_argument('--host', default=options.get('HOST', '127.0.0.1'))
+        parser.add_argument('--port', type=int, default=options.get('PORT', 8001))
+
+    def handle(self, *args, **options):
+        with TurnStreamServer((options['host'], options['port'])) as server:
+            self.stdout.write(f'Turn stream is listening {options["host"]}:{options["port"]}')
+            server.serve_forever()
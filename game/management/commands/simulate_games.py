@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from game.mechanics.simulation import DEFAULT_FIXTURE, POLICIES, run_simulation
+
+
+class Command(BaseCommand):
+    help = 'Play games headlessly, with handbook loaded from fixture instead of db, and report performance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100)
+        parser.add_argument('--processes', type=int, default=None, help='Number of processes. CPU count by default')
+        parser.add_argument('--policy', choices=sorted(POLICIES), default='aggressive', help='Hero policy')
+        parser.add_argument('--max-turns', type=int, default=200, help='Turns limit of single game')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the first game. Next games get next seeds')
+        parser.add_argument('--hero', type=int, default=None, help='Pk of fixture hero to copy. New hero by default')
+        parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='Fixture with handbook models')
+        parser.add_argument('--json', action='store_true', help='Print report as json')
+
+    def handle(self, *args, **options):
+        report = run_simulation(options['games'], processes=options['processes'], policy=options['policy'],
+                                max_turns=options['max_turns'], first_seed=options['seed'],
+                                hero_pk=options['hero'], fixture_path=options['fixture'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{report['games']} games, {report['turns']} turns in {report['elapsed']:.2f}s: "
+                          f"{report['turns_per_sec']:.0f} turns/sec")
+        self.stdout.write(f"hero died in {report['games_over']} games, "
+                          f"rounds reached: mean {report['rounds_mean']:.1f}, max {report['rounds_max']}")
+        latency = report['latency_ms']
+        self.stdout.write(f"turn latency: p50 {latency['p50']:.3f}ms, p90 {latency['p90']:.3f}ms, "
+                          f"p99 {latency['p99']:.3f}ms")
@@ -5,8 +5,8 @@ from collections import defaultdict
 from typing import List, Dict, TYPE_CHECKING
 
 from game.mechanics.game_sturctures import Exit, Sanctuary
-from game.models import SpellModel
-from game.mechanics.constants import slotEmpty, slotObstacle
+from game.mechanics.handbook import Handbook
+from game.mechanics.constants import slotEmpty, slotObstacle, slotCodes
 from game.mechanics.game_objects import Hero, BaseGameObject, BaseUnitObject
 
 if TYPE_CHECKING:
@@ -81,8 +81,7 @@ class Move(Action):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject'):
-        targets = game.get_hexes_in_range(unit.position, unit.move_range, allowed=[slotEmpty])
-        return list(targets.values())
+        return list(game.iter_hexes_in_range(unit.position, unit.move_range, allowed=[slotEmpty]))
 
     def execute(self) -> Dict[str, List]:
         if self.source.position.id == self.target_hex:
@@ -104,8 +103,7 @@ class Attack(Action):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject'):
-        targets = game.get_hexes_in_range(unit.position, unit.attack_range, allowed=[str(unit.enemy_target)])
-        return list(targets.values())
+        return list(game.iter_hexes_in_range(unit.position, unit.attack_range, allowed=[str(unit.enemy_target)]))
 
     def execute(self) -> Dict[str, List]:
         if self.game.distance(self.source.position, self.target_hex) > self.source.attack_range:
@@ -128,12 +126,14 @@ class RangeAttack(Action):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject'):
-        targets = game.get_hexes_in_range(unit.position, unit.attack_range + 1, allowed=[str(unit.enemy_target)])
-        return list(targets.values())
+        return list(game.iter_visible_hexes(unit.position, unit.attack_range + 1,
+                                            allowed=[str(unit.enemy_target)]))
 
     def execute(self) -> Dict[str, List]:
         if self.game.distance(self.source.position, self.target_hex) > self.source.attack_range + 1:
             raise RuntimeError('Target is too far')
+        if not self.game.has_line_of_sight(self.source.position, self.target_hex):
+            raise RuntimeError('Target is behind obstacle')
         damage_dealt = self.game.deal_damage(self.target_hex, self.source.damage)
         action_step = {'target_hex': self.target_hex}
         if damage_dealt:
@@ -151,11 +151,9 @@ class SpellAction(Action):
         if not isinstance(action_data['source'], BaseUnitObject):
             raise RuntimeError(f'This game object is muggle')
         super().__init__(game, action_data)
-        try:
-            self.spell = self.source.spells.get(code_name=self.action_name)
-        except SpellModel.DoesNotExist:
+        if not self.source.has_spell(self.action_name):
             raise RuntimeError('Action not allowed')
-        self.spell_effects = {item.effect.code_name: item.value for item in self.spell.spelleffectmodel_set.all()}
+        self.spell_effects = Handbook.instance().get_spell_effects(self.action_name)
 
     def execute(self) -> Dict[str, List]:
         raise NotImplementedError
@@ -170,36 +168,28 @@ class PathOfFire(SpellAction):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject') -> 'List[Hex]':
-        try:
-            spell = unit.spells.get(code_name=cls.action_name)
-        except SpellModel.DoesNotExist:
+        if not unit.has_spell(cls.action_name):
             raise RuntimeError('No such spell')
-        spell_effects = {item.effect.code_name: item.value for item in spell.spelleffectmodel_set.all()}
-        targets = game.get_hexes_in_range(unit.position, spell_effects['radius'], restricted=[slotObstacle]).values()
-        targets = [_hex for _hex in targets if unit.position != _hex]
-        return targets
+        spell_effects = Handbook.instance().get_spell_effects(cls.action_name)
+        targets = game.iter_hexes_in_range(unit.position, int(spell_effects['radius']), restricted=[slotObstacle])
+        return [_hex for _hex in targets if unit.position != _hex]
 
     def execute(self) -> Dict[str, List]:
         if self.game.distance(self.source.position, self.target_hex) > self.spell_effects['radius']:
             raise RuntimeError('Target is too far')
 
         action_steps: list = []
-        q, r = map(int, self.target_hex.split(';'))
-        dq, dr = q - self.source.position.q, r - self.source.position.r
-        try:
-            for i in range(int(self.spell_effects['path_length'])):
-                hex_id = f"{q + dq * i};{r + dr * i}"
-                hex_slot = self.game.get_object_by_position(hex_id)
-                if str(hex_slot) == slotObstacle:
-                    break
-                action_step = {'target_hex': hex_id}
-                damage_dealt = self.game.deal_damage(hex_id, self.spell_effects['damage'])
-                if damage_dealt:
-                    action_step['damage'] = damage_dealt
-                action_steps.append(action_step)
-        except KeyError:
-            # reached end of the board
-            pass
+        target = self.game.get_hex(self.target_hex)
+        dq, dr = target.q - self.source.position.q, target.r - self.source.position.r
+        # line is cut by the end of the board
+        for _hex in self.game.iter_line(target, dq, dr, int(self.spell_effects['path_length'])):
+            if _hex.slot_code == slotCodes[slotObstacle]:
+                break
+            action_step = {'target_hex': _hex.id}
+            damage_dealt = self.game.deal_damage(_hex.id, self.spell_effects['damage'])
+            if damage_dealt:
+                action_step['damage'] = damage_dealt
+            action_steps.append(action_step)
         return {self.action_name: action_steps}
 
 
@@ -212,14 +202,11 @@ class ShieldBash(SpellAction):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject') -> 'List[Hex]':
-        try:
-            spell = unit.spells.get(code_name=cls.action_name)
-        except SpellModel.DoesNotExist:
+        if not unit.has_spell(cls.action_name):
             raise RuntimeError('No such spell')
-        spell_effects = {item.effect.code_name: item.value for item in spell.spelleffectmodel_set.all()}
-        targets = game.get_hexes_in_range(unit.position, spell_effects['radius']).values()
-        targets = [_hex for _hex in targets if unit.position != _hex]
-        return targets
+        spell_effects = Handbook.instance().get_spell_effects(cls.action_name)
+        targets = game.iter_hexes_in_range(unit.position, int(spell_effects['radius']))
+        return [_hex for _hex in targets if unit.position != _hex]
 
     def execute(self) -> Dict[str, List]:
         target_distance = self.game.distance(self.source.position, self.target_hex)
@@ -227,27 +214,26 @@ class ShieldBash(SpellAction):
             raise RuntimeError('Target is too far')
 
         action_steps = []
-        # find hexes affected by spell (target itself and two neighbours
-        source_area = self.game.get_hexes_in_range(self.source.position, target_distance)
-        affected_hexes = {hex_id: source_area[hex_id] for hex_id in set(source_area).intersection(
-            self.game.get_hexes_in_range(self.game.get_hex(self.target_hex), 1))}
+        # find hexes affected by spell (target itself and two neighbours)
+        affected_hexes = {_hex.id: _hex for _hex in self.game.iter_hexes_intersection(
+            self.source.position, target_distance, self.game.get_hex(self.target_hex), 1)}
         # define hex where bash comes from. For spell range 1 its hero himself
-        distances = {hex_id: self.game.distance(self.source.position, hex_id) for hex_id in affected_hexes}
-        bash_source = affected_hexes.pop(min(distances, key=distances.get))
+        distances = self.game.get_distances(self.source.position, affected_hexes.values())
+        bash_source = affected_hexes.pop(min(zip(distances, affected_hexes))[1])
 
         for hex_id in sorted(affected_hexes):
             hex_slot = self.game.get_object_by_position(hex_id)
             action_step = {'target_hex': hex_id}
             if isinstance(hex_slot, BaseUnitObject):
-                dq = source_area[hex_id].q - bash_source.q
-                dr = source_area[hex_id].r - bash_source.r
-                hex_behind = f"{source_area[hex_id].q + dq};{source_area[hex_id].r + dr}"
-                if not self.game.get_hex(hex_behind) or self.game.get_object_by_position(hex_behind) != slotEmpty:
+                dq = affected_hexes[hex_id].q - bash_source.q
+                dr = affected_hexes[hex_id].r - bash_source.r
+                hex_behind = self.game.get_hex_at(affected_hexes[hex_id].q + dq, affected_hexes[hex_id].r + dr)
+                if hex_behind is None or hex_behind.slot_code != slotCodes[slotEmpty]:
                     action_step['damage'] = self.spell_effects['damage'] * 2
                 else:
                     action_step['damage'] = self.spell_effects['damage']
-                    self.game.move_object(hex_slot, hex_behind)
-                    action_step['pushed_to'] = hex_behind
+                    self.game.move_object(hex_slot, hex_behind.id)
+                    action_step['pushed_to'] = hex_behind.id
                 self.game.deal_damage(hex_id, action_step['damage'])
             if hex_id == self.target_hex:
                 action_step['main_target'] = True
@@ -268,13 +254,10 @@ class Blink(SpellAction):
 
     @classmethod
     def available_targets(cls, game: 'GameInstance', unit: 'BaseUnitObject'):
-        try:
-            spell = unit.spells.get(code_name=cls.action_name)
-        except SpellModel.DoesNotExist:
+        if not unit.has_spell(cls.action_name):
             raise RuntimeError('No such spell')
-        spell_effects = {item.effect.code_name: item.value for item in spell.spelleffectmodel_set.all()}
-        targets = game.get_hexes_in_range(unit.position, spell_effects['radius'], allowed=[slotEmpty])
-        return list(targets.values())
+        spell_effects = Handbook.instance().get_spell_effects(cls.action_name)
+        return list(game.iter_hexes_in_range(unit.position, int(spell_effects['radius']), allowed=[slotEmpty]))
 
     def execute(self) -> Dict[str, List]:
         if self.game.distance(self.source.position, self.target_hex) > self.spell_effects['radius']:
@@ -326,7 +309,7 @@ class EnterSanctuary(Action):
             raise RuntimeError('Target is too far')
         structure = self.game.get_object_by_position(self.target_hex)
         if isinstance(structure, Sanctuary):
-            structure.generate_assortment()
+            structure.generate_assortment(self.game.rng)
             return {self.action_name: [{'assortment': structure.assortment}]}
         raise RuntimeError('Failed to enter structure')
 
@@ -375,6 +358,13 @@ class ActionManager:
         'exit_sanctuary': ExitSanctuary,
     }
 
+    @classmethod
+    def get_action_class(cls, action_name: str) -> Action.__class__:
+        """Class of action with given name"""
+        if action_name in cls._actions:
+            return cls._actions[action_name]
+        raise RuntimeError('No such action')
+
     @classmethod
     def get_action(cls, game: 'GameInstance', action_data: dict) -> Action:
         """Create action instance from given data"""
@@ -0,0 +1,119 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from django.db import close_old_connections
+
+from game.mechanics.instrumentation import Instrumentation
+
+# max number of messages, processed by actor in a row before other actors get the worker
+ACTOR_BATCH = 16
+
+
+class MailboxFull(Exception):
+    """Raised when too many requests for the same game are waiting"""
+
+
+class ActorTimeout(Exception):
+    """Raised when request is not processed in time"""
+
+
+class GameActors:
+    """
+    Runs requests for live games, one actor per game
+
+    Every game has a mailbox of requests, which are processed in order of arrival, one at a time.
+    Actors of different games are run in parallel by bounded pool of worker threads. Busy actor gives the worker
+    back after <ACTOR_BATCH> requests, so games with many requests don't starve others.
+    Handlers must not call actor of the same game, as they would wait for themselves.
+    In inline mode handlers are run in caller thread, which is handy for tests.
+    """
+    def __init__(self, workers: int = 8, mailbox_size: int = 100, timeout: Optional[float] = 30, inline=False):
+        self.workers = workers
+        self.mailbox_size = mailbox_size
+        self.timeout = timeout
+        self.inline = inline
+        self._lock = Lock()
+        self._mailboxes: Dict[str, Deque[Tuple[Future, Callable, tuple]]] = {}
+        # games, which actors are scheduled or running now
+        self._running: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {'processed': 0, 'rejected': 0, 'max_queued': 0}
+
+    def submit(self, game_id: str, handler: Callable, *args) -> Future:
+        """Put request into game mailbox. Returns future of handler result"""
+        game_id = str(game_id)
+        future = Future()
+        if self.inline:
+            try:
+                future.set_result(handler(*args))
+            except BaseException as err:
+                future.set_exception(err)
+            return future
+        handler = Instrumentation.instance().bind(handler)
+        with self._lock:
+            mailbox = self._mailboxes.setdefault(game_id, deque())
+            if len(mailbox) >= self.mailbox_size:
+                self.stats['rejected'] += 1
+                raise MailboxFull(f'Too many requests for game {game_id}')
+            mailbox.append((future, handler, args))
+            self.stats['max_queued'] = max(self.stats['max_queued'], len(mailbox))
+            schedule = game_id not in self._running
+            self._running.add(game_id)
+        if schedule:
+            self._get_executor().submit(self._run, game_id)
+        return future
+
+    def call(self, game_id: str, handler: Callable, *args) -> Any:
+        """
+        Run handler by game actor and wait for its result. Exceptions of handler are raised in caller.
+        Request, which waits in the mailbox longer than timeout, is cancelled, so it's not made after the caller
+        gave up. ActorTimeout is raised then, as well as when handler doesn't finish in time
+        """
+        future = self.submit(game_id, handler, *args)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise ActorTimeout(f'Request for game {game_id} is cancelled, as it was not started in time')
+            raise ActorTimeout(f'Request for game {game_id} is not finished in time')
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'active': len(self._running),
+                    'queued': sum(len(mailbox) for mailbox in self._mailboxes.values())}
+
+    def shutdown(self):
+        """Wait for all queued requests and stop workers"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _run(self, game_id: str):
+        """Process requests of game mailbox"""
+        for _ in range(ACTOR_BATCH):
+            with self._lock:
+                mailbox = self._mailboxes[game_id]
+                if not mailbox:
+                    del self._mailboxes[game_id]
+                    self._running.discard(game_id)
+                    return
+                future, handler, args = mailbox.popleft()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(handler(*args))
+                except BaseException as err:
+                    future.set_exception(err)
+                finally:
+                    # worker threads are not request threads, so Django doesn't manage their connections
+                    close_old_connections()
+            with self._lock:
+                self.stats['processed'] += 1
+        self._get_executor().submit(self._run, game_id)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='game-actor')
+            return self._executor
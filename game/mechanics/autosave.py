@@ -0,0 +1,274 @@
+import atexit
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from threading import Condition, Timer
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.game_objects import write_abilities
+from game.mechanics.turn_log import build_snapshot_model, build_turn_models, delete_turns_after
+from game.models import GameModel, HeroModel, GameSnapshotModel, TurnRecordModel
+
+# values of model fields, written by autosave (see GameInstance.dump_save). <attempts> is the number of failed writes
+SaveRecord = namedtuple('SaveRecord', ['game_id', 'hero_id', 'round', 'turn', 'state_data', 'snapshot_turn',
+                                       'hero_health', 'hero_abilities', 'turns', 'attempts'])
+
+
+def merge_records(older: SaveRecord, newer: SaveRecord) -> SaveRecord:
+    """Single record with turns of both records, the latest snapshot and abilities of hero"""
+    if newer.state_data is None:
+        newer = newer._replace(state_data=older.state_data, snapshot_turn=older.snapshot_turn)
+    if newer.hero_abilities is None:
+        newer = newer._replace(hero_abilities=older.hero_abilities)
+    return newer._replace(turns=older.turns + newer.turns, attempts=older.attempts)
+
+
+class AutosaveManager(object):
+    """
+    Singleton class to save game instances in background
+
+    Changed games are scheduled with <schedule>. State of the game is taken at that moment, so it's safe to change
+    the game after. Several changes of the game, scheduled within the delay, are coalesced into single write.
+    Pending games are flushed by timer, on eviction from GameManager and on process exit. Writes are made in
+    batches by bounded pool of worker threads. Options are taken from GAME_AUTOSAVE setting.
+    In inline mode there is no timer and games are written in caller thread on flush, which is handy for tests.
+    """
+    __instance = None
+
+    @staticmethod
+    def instance():
+        """Static access method"""
+        if AutosaveManager.__instance is None:
+            AutosaveManager()
+        return AutosaveManager.__instance
+
+    def __init__(self):
+        if AutosaveManager.__instance is not None:
+            raise Exception("This class is a singleton!")
+        else:
+            AutosaveManager.__instance = self
+        options = getattr(settings, 'GAME_AUTOSAVE', {})
+        self.delay: float = options.get('DELAY', 10)
+        self.batch_size: int = options.get('BATCH_SIZE', 100)
+        self.workers: int = options.get('WORKERS', 2)
+        self.inline: bool = options.get('INLINE', False)
+        self.max_attempts: int = options.get('MAX_ATTEMPTS', 3)
+
+        self._pending: Dict[int, SaveRecord] = {}
+        # games, which writes are not finished yet. They are not written again until then, to keep writes order
+        self._in_flight: Set[int] = set()
+        self._condition = Condition()
+        self._timer: Optional[Timer] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {'scheduled': 0, 'coalesced': 0, 'written': 0, 'batches': 0, 'failures': 0, 'dropped': 0,
+                      'stale': 0}
+        atexit.register(self.shutdown)
+
+    def schedule(self, game_instance: GameInstance):
+        """Schedule saving of current state of the game"""
+        record = SaveRecord(attempts=0, **game_instance.dump_save())
+        with self._condition:
+            self.stats['scheduled'] += 1
+            previous = self._pending.get(record.game_id)
+            if previous is not None:
+                record = merge_records(previous, record)
+                self.stats['coalesced'] += 1
+            self._pending[record.game_id] = record
+            game_instance.dirty = False
+            self._start_timer()
+
+    def save(self, game_instance: GameInstance):
+        """Save the game immediately and wait until it's written"""
+        self.schedule(game_instance)
+        self.wait_saved(game_instance._game.pk)
+
+    def wait_saved(self, game_id: int):
+        """Write pending changes of the game, if there are any, and wait until they are written"""
+        game_id = int(game_id)
+        with self._condition:
+            if game_id not in self._pending and game_id not in self._in_flight:
+                return
+            self._condition.wait_for(lambda: game_id not in self._in_flight)
+        self.flush([game_id], wait=True)
+        # game could be taken by timer flush in the meantime
+        with self._condition:
+            self._condition.wait_for(lambda: game_id not in self._in_flight)
+
+    def discard(self, game_id: int):
+        """
+        Forget pending changes of the game, like when it's deleted.
+        Changes, which are being written, are dropped by writer, if the game is deleted
+        """
+        with self._condition:
+            self._pending.pop(int(game_id), None)
+
+    def is_pending(self, game_id: int) -> bool:
+        with self._condition:
+            return int(game_id) in self._pending
+
+    def flush(self, game_ids: Iterable[int] = None, wait: bool = False):
+        """
+        Write pending games (all of them, if <game_ids> not passed).
+        Games, which previous write is not finished, are left pending
+        """
+        with self._condition:
+            if game_ids is None:
+                game_ids = list(self._pending)
+            records = [self._pending.pop(game_id) for game_id in game_ids
+                       if game_id in self._pending and game_id not in self._in_flight]
+            self._in_flight.update(record.game_id for record in records)
+        futures = []
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            if self.inline:
+                self._write(batch)
+            else:
+                futures.append(self._get_executor().submit(self._write, batch))
+        if wait:
+            wait_futures(futures)
+
+    def shutdown(self):
+        """Write all pending games and stop workers"""
+        with self._condition:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._condition.wait_for(lambda: not self._in_flight)
+            # thread pools don't accept new tasks on interpreter exit, so the rest is written in this thread
+            self.inline = True
+        self.flush(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def get_stats(self) -> dict:
+        """Counters of autosave usage"""
+        with self._condition:
+            return {**self.stats, 'pending': len(self._pending), 'in_flight': len(self._in_flight)}
+
+    def _write(self, records: List[SaveRecord]):
+        """
+        Write batch of games to db. If batch fails, its games are written one by one, so a broken game doesn't
+        hold up others. Games, deleted since they were scheduled, are dropped. Failed games are retried with
+        later flushes, up to MAX_ATTEMPTS times
+        """
+        try:
+            try:
+                written = self._write_records(records)
+                failed = []
+                with self._condition:
+                    self.stats['batches'] += 1
+            except Exception as err:
+                print(f'Failed to autosave games {[record.game_id for record in records]}: {err}')
+                written, failed = self._write_separately(records)
+            with self._condition:
+                self.stats['written'] += written
+                self.stats['failures'] += len(failed)
+                for record in failed:
+                    self._retry(record._replace(attempts=record.attempts + 1))
+        finally:
+            with self._condition:
+                self._in_flight.difference_update(record.game_id for record in records)
+                self._condition.notify_all()
+                if self._pending:
+                    self._start_timer()
+            if not self.inline:
+                connection.close()
+
+    def _write_separately(self, records: List[SaveRecord]) -> Tuple[int, List[SaveRecord]]:
+        """
+        Write games of failed batch one by one.
+        Returns number of written records and records, which failed again
+        """
+        try:
+            existing = set(GameModel.objects.filter(pk__in=[record.game_id for record in records])
+                           .values_list('pk', flat=True))
+        except Exception as err:
+            print(f'Failed to autosave games {[record.game_id for record in records]}: {err}')
+            return 0, records
+        written, failed = 0, []
+        for record in records:
+            if record.game_id not in existing:
+                print(f'Autosave of game {record.game_id} is dropped, as the game is deleted')
+                with self._condition:
+                    self.stats['dropped'] += 1
+                continue
+            try:
+                written += self._write_records([record])
+            except Exception as err:
+                print(f'Failed to autosave game {record.game_id}: {err}')
+                failed.append(record)
+        return written, failed
+
+    def _retry(self, record: SaveRecord):
+        """Put failed record back to pending, together with later changes of the game. Called under condition lock"""
+        if record.attempts >= self.max_attempts:
+            print(f'Autosave of game {record.game_id} is dropped after {record.attempts} attempts')
+            self.stats['dropped'] += 1
+            return
+        newer = self._pending.get(record.game_id)
+        self._pending[record.game_id] = record if newer is None else merge_records(record, newer)
+
+    def _write_records(self, records: List[SaveRecord]) -> int:
+        """
+        Write records in single transaction. Returns number of written records.
+        Game could be continued and saved by another process, so records older than saved state of their games
+        are skipped, not to overwrite newer state and turns
+        """
+        with transaction.atomic():
+            saved_turns = dict(GameModel.objects.select_for_update()
+                               .filter(pk__in=[record.game_id for record in records]).values_list('pk', 'turn'))
+            stale = [record.game_id for record in records if saved_turns.get(record.game_id, 0) > record.turn]
+            records = [record for record in records if record.game_id not in stale]
+            snapshots = [record for record in records if record.state_data is not None]
+            turns_only = [record for record in records if record.state_data is None]
+            if snapshots:
+                GameModel.objects.bulk_update(
+                    [GameModel(pk=record.game_id, round=record.round, turn=record.turn, state='{}',
+                               state_data=record.state_data) for record in snapshots],
+                    ['round', 'turn', 'state', 'state_data'])
+                GameSnapshotModel.objects.bulk_create(
+                    [build_snapshot_model(record.game_id, record.snapshot_turn, record.state_data)
+                     for record in snapshots])
+                delete_turns_after((record.game_id, record.snapshot_turn) for record in snapshots)
+            if turns_only:
+                GameModel.objects.bulk_update(
+                    [GameModel(pk=record.game_id, round=record.round, turn=record.turn) for record in turns_only],
+                    ['round', 'turn'])
+            # turns could be written already by another process, which continued the game
+            TurnRecordModel.objects.bulk_create(
+                [model for record in records for model in build_turn_models(record.game_id, record.turns)],
+                ignore_conflicts=True)
+            HeroModel.objects.bulk_update(
+                [HeroModel(pk=record.hero_id, health=record.hero_health) for record in records], ['health'])
+            for record in records:
+                if record.hero_abilities is not None:
+                    write_abilities(HeroModel(pk=record.hero_id), record.hero_abilities)
+        if stale:
+            print(f'Autosave of games {stale} is skipped, as newer state of them is saved')
+            with self._condition:
+                self.stats['stale'] += len(stale)
+        return len(records)
+
+    def _start_timer(self):
+        """Start timer to flush pending games, if it's not started yet. Called under condition lock"""
+        if self.inline or self._timer is not None:
+            return
+        self._timer = Timer(self.delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._condition:
+            self._timer = None
+        self.flush()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._condition:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='autosave')
+            return self._executor
+
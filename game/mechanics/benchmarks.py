@@ -0,0 +1,178 @@
+import json
+from collections import namedtuple
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from game.mechanics.actions import ActionManager
+from game.mechanics.board import Board
+from game.mechanics.constants import slotEmpty
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.game_objects import Unit
+from game.mechanics.handbook import Handbook
+from game.mechanics.simulation import build_game, init_worker
+from game.mechanics.state_codec import decode_state, encode_state
+from game.serializers import GameInstanceSerializer
+
+DEFAULT_RADII = (6, 10, 15)
+DEFAULT_UNITS = (5, 20, 50)
+# relative slowdown against baseline, which is reported as regression
+DEFAULT_THRESHOLD = 0.2
+# minimal time of single measurement, calls are repeated until it's reached
+MIN_MEASURE_TIME = 0.02
+# limit of single measurement time, including setup, for cases with slow setup
+MAX_MEASURE_TIME = 0.2
+
+BenchmarkCase = namedtuple('BenchmarkCase', ['name', 'func', 'setup'])
+BenchmarkResult = namedtuple('BenchmarkResult', ['name', 'seconds', 'calls'])
+Comparison = namedtuple('Comparison', ['name', 'seconds', 'baseline', 'ratio', 'status'])
+
+
+def measure(func: Callable, setup: Optional[Callable] = None, repeat: int = 5) -> BenchmarkResult:
+    """
+    Best time of single <func> call from <repeat> measurements.
+    <setup> is called before every call of <func> and is not timed, it's used to reset mutated state
+    """
+    calls = 1
+    best = float('inf')
+    for _ in range(repeat):
+        elapsed = 0.0
+        done = 0
+        deadline = perf_counter() + MAX_MEASURE_TIME
+        while done < calls or elapsed < MIN_MEASURE_TIME and perf_counter() < deadline:
+            if setup is not None:
+                setup()
+            started = perf_counter()
+            func()
+            elapsed += perf_counter() - started
+            done += 1
+        calls = done
+        best = min(best, elapsed / done)
+    return BenchmarkResult('', best, calls)
+
+
+def build_benchmark_game(radius: int, units_count: int, seed: int = 0) -> GameInstance:
+    """Game with hero in the center and <units_count> units of level 1 on random hexes"""
+    game = build_game(seed, hero_pk=2, radius=radius)
+    game.rng.seed(seed)
+    game.start_round()
+    for unit in list(game.units.values()):
+        game.destroy_unit(unit)
+    free_hexes = [_hex.id for _hex in game._board.iter_by_slots([slotEmpty])
+                  if game.distance(game.hero.position, _hex.id) > 1]
+    game.rng.shuffle(free_hexes)
+    template = Handbook.instance().get_unit_template(1)
+    for pk in range(min(units_count, len(free_hexes))):
+        unit = Unit(template, pk=pk)
+        game.move_object(unit, free_hexes[pk])
+        game.units[pk] = unit
+    game.update_moves()
+    game.reset_changes()
+    return game
+
+
+def iter_cases(radii: Sequence[int] = DEFAULT_RADII, units: Sequence[int] = DEFAULT_UNITS) -> Iterator[BenchmarkCase]:
+    """All benchmark cases for given board radii and unit counts"""
+    for radius in radii:
+        yield BenchmarkCase(f'board_init[r={radius}]', lambda radius=radius: Board(radius), None)
+        board = Board(radius)
+        center = board.get('0;0')
+        for _range in sorted({1, 3, radius - 1}):
+            yield BenchmarkCase(f'get_hexes_in_range[r={radius},range={_range}]',
+                                lambda board=board, center=center, _range=_range:
+                                board.get_hexes_in_range(center, _range), None)
+
+        for units_count in units:
+            game = build_benchmark_game(radius, units_count)
+            state = game.dump_state()
+            params = f'r={radius},units={len(game.units)}'
+
+            def reset_moves(game=game):
+                for unit in [game.hero, *game.units.values()]:
+                    unit.moves_origin = None
+
+            def restore(game=game, state=state):
+                game.restore_state(state)
+
+            yield BenchmarkCase(f'update_moves[{params}]', game.update_moves, reset_moves)
+            yield BenchmarkCase(f'dump_state[{params}]',
+                                lambda game=game: encode_state(game.dump_state(), radius), None)
+            encoded = encode_state(state, radius)
+            yield BenchmarkCase(f'restore_state[{params}]',
+                                lambda game=game, encoded=encoded: game.restore_state(decode_state(encoded)), None)
+            yield BenchmarkCase(f'serializer[{params}]', lambda game=game: GameInstanceSerializer(game).data, None)
+            yield BenchmarkCase(f'make_turn[{params}]',
+                                lambda game=game: game.make_turn({'action': 'idle'}), restore)
+            yield from iter_action_cases(game, params, restore)
+
+
+def iter_action_cases(game: GameInstance, params: str, restore: Callable) -> Iterator[BenchmarkCase]:
+    """Cases for <available_targets> and <execute> of every action, available for hero and units"""
+    # sources are looked up on every call, because restoring of the state recreates units
+    getters = [lambda: game.hero]
+    if game.units:
+        unit_pk = next(iter(game.units))
+        getters.append(lambda: game.units[unit_pk])
+    for get_source in getters:
+        for action_name in get_source().actions:
+            # previous execute cases leave the game changed
+            restore()
+            source = get_source()
+            action_class = ActionManager.get_action_class(action_name)
+            name = f'{action_name}[{params},source={source}]'
+            yield BenchmarkCase(f'available_targets:{name}',
+                                lambda action_class=action_class, get_source=get_source:
+                                action_class.available_targets(game, get_source()), None)
+            targets = action_class.available_targets(game, source)
+            if not targets:
+                continue
+
+            def execute(action_name=action_name, get_source=get_source, target_hex=targets[0].id):
+                action_data = {'action': action_name, 'source': get_source(), 'target_hex': target_hex}
+                try:
+                    ActionManager.get_action(game, action_data).execute()
+                except RuntimeError:
+                    pass
+            yield BenchmarkCase(f'execute:{name}', execute, restore)
+
+
+def run_benchmarks(radii: Sequence[int] = DEFAULT_RADII, units: Sequence[int] = DEFAULT_UNITS,
+                   name_filter: str = '', repeat: int = 5) -> List[BenchmarkResult]:
+    """Run benchmark cases, which names contain <name_filter>"""
+    init_worker()
+    results = []
+    for case in iter_cases(radii, units):
+        if name_filter not in case.name:
+            continue
+        result = measure(case.func, case.setup, repeat)
+        results.append(result._replace(name=case.name))
+    return results
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, float],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Comparison]:
+    """Compare results with baseline. Cases slower by more than <threshold> are marked as regressions"""
+    comparisons = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            comparisons.append(Comparison(result.name, result.seconds, None, None, 'new'))
+            continue
+        ratio = result.seconds / base if base else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparisons.append(Comparison(result.name, result.seconds, base, ratio, status))
+    return comparisons
+
+
+def save_baseline(results: List[BenchmarkResult], path: str):
+    with open(path, 'w') as baseline_file:
+        json.dump({result.name: result.seconds for result in results}, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
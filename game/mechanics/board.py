@@ -1,7 +1,9 @@
-from random import random
-from typing import TYPE_CHECKING, Dict, List
-from game.mechanics.constants import BOARD_RADIUS, slotEmpty, slotObstacle, slotStructure
+import random
+from random import Random
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from game.mechanics.constants import BOARD_RADIUS, slotEmpty, slotObstacle, slotCodes, slotCodeOther
 from game.mechanics.game_objects import Obstacle
+from game.mechanics.geometry import NEIGHBOR_OFFSETS, HexGeometry, get_geometry
 
 if TYPE_CHECKING:
     from game.mechanics.game_objects import BaseGameObject
@@ -9,12 +11,39 @@ if TYPE_CHECKING:
 # chances in percents
 OBSTACLE_CHANCE = 15
 
+# slots, which block line of sight
+SIGHT_BLOCKING_SLOTS = (slotObstacle,)
+# max number of cached visibility bitsets. 0 disables the cache
+VISIBILITY_CACHE_SIZE = 256
+
+EMPTY_CODE = slotCodes[slotEmpty]
+OBSTACLE_CODE = slotCodes[slotObstacle]
+
+
+def get_slot_code(slot) -> int:
+    """Integer code of given slot value or game object"""
+    return slotCodes.get(str(slot), slotCodeOther)
+
+
+_disk_offsets: Dict[int, List[Tuple[int, int]]] = {}
+
+
+def get_disk_offsets(_range: int) -> List[Tuple[int, int]]:
+    """Relative axial offsets of all hexes in <_range> around some hex, including hex itself. Cached per range"""
+    if _range not in _disk_offsets:
+        _disk_offsets[_range] = [
+            (q, r)
+            for q in range(-_range, _range + 1)
+            for r in range(max(-_range, -q - _range), min(_range, -q + _range) + 1)
+        ]
+    return _disk_offsets[_range]
+
 
 class Hex:
     """
     Hex object, used in board
     """
-    def __init__(self, q: int, r: int, slot: 'BaseGameObject' = slotEmpty):
+    def __init__(self, q: int, r: int, slot: 'BaseGameObject' = slotEmpty, hex_id: str = None):
         self.q = q
         self.r = r
 
@@ -22,12 +51,27 @@ class Hex:
         self.y = -q - r
         self.z = r
 
+        # hex id is used at api boundary only, so it's built once
+        self.id = hex_id or f'{q};{r}'
+        # position of hex in board storage and the board itself. Set when hex is added to board
+        self.index: Optional[int] = None
+        self.board: Optional['Board'] = None
+
+        self.slot_code = slotCodeOther
         self.slot = slot
 
     @property
-    def id(self) -> str:
-        """Hex id"""
-        return f'{self.q};{self.r}'
+    def slot(self) -> 'BaseGameObject':
+        """Object occupying the hex"""
+        return self._slot
+
+    @slot.setter
+    def slot(self, value: 'BaseGameObject'):
+        slot_code = get_slot_code(value)
+        if self.board is not None:
+            self.board.update_occupancy(self, slot_code)
+        self._slot = value
+        self.slot_code = slot_code
 
     def distance_from_center(self) -> int:
         """Distance from current hex to the center of board"""
@@ -47,41 +91,68 @@ class Hex:
 class Board:
     """
     Game board, made of hexes, positioned in hexagonal form
+
+    Hexes are stored in flat list, indexed by axial offset of hex (see <index_of>).
+    String hex ids are accepted at api boundary only, all inner lookups use indexes.
+    For every slot code board keeps occupancy bitset, where bit number is the index of hex with such slot.
+    Bitsets are updated by hexes on every slot change, so filtering by slots is a bitwise intersection.
+    Changed hexes are also collected in <dirty_mask> and <changes_mask> until they are popped
+    by moves update and state versioning of the game respectively.
+    Topology of the board (ids, neighbors, distances and areas) is shared by all boards of the same radius,
+    board itself keeps only hexes with their slots and occupancy bitsets.
     """
-    position_biases = [
-        (1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)
-    ]
+    position_biases = list(NEIGHBOR_OFFSETS)
 
     def __init__(self, radius: int = BOARD_RADIUS):
+        self.radius = radius
+        # hexes of board are in range [-offset, offset] by each axis
+        self._offset = radius - 1
+        self._width = max(2 * radius - 1, 0)
+        # distances, disks, rings, lines and neighbors of hexes, clipped to the board
+        self.geometry: HexGeometry = get_geometry(radius)
+        self._index_by_id: Dict[str, int] = self.geometry.index_by_id
+        self._neighbors: List[Tuple[int, ...]] = self.geometry.neighbors
 
-        def create_neighbors(_hex: Hex):
-            """
-            Method generating grid of hexes in board
-            """
-            for bias in self.position_biases:
-                new_pos = [sum(x) for x in zip((_hex.q, _hex.r), bias)]
-                new_id = f'{new_pos[0]};{new_pos[1]}'
-                if new_id in self.__hexes:
-                    continue
-                new_hex = Hex(*new_pos)
-                if self.add(new_hex):
-                    create_neighbors(new_hex)
+        self._hexes: List[Optional[Hex]] = [None] * self.geometry.size
+        coordinates, ids = self.geometry.coordinates, self.geometry.ids
+        for index in self.geometry.indexes:
+            q, r = coordinates[index]
+            _hex = self._hexes[index] = Hex(q, r, hex_id=ids[index])
+            _hex.index = index
+            _hex.board = self
+        self._occupancy: List[int] = [0] * (slotCodeOther + 1)
+        self._occupancy[EMPTY_CODE] = self.geometry.mask
+        self.dirty_mask = self.geometry.mask
+        self.changes_mask = self.geometry.mask
 
-        self.radius = radius
-        self.__hexes = {}
-        start_hex = Hex(0, 0)
-        self.add(start_hex)
-        create_neighbors(start_hex)
+        # visible hexes bitsets, keyed by (origin index, range, bitset of blocking hexes).
+        # Any change of blocking hexes gives new key, so cached values never get stale
+        self.visibility_cache_size = VISIBILITY_CACHE_SIZE
+        self._visibility: Dict[Tuple[int, int, int], int] = {}
 
     def __getitem__(self, key: str) -> Hex:
-        return self.__hexes[key]
+        return self._hexes[self._index_by_id[key]]
 
     def __contains__(self, _hex: str) -> bool:
-        return _hex in self.__hexes
+        return _hex in self._index_by_id
+
+    def __len__(self) -> int:
+        return len(self._index_by_id)
 
     def __iter__(self):
-        for _hex in self.__hexes:
-            yield _hex
+        for _hex in self.values():
+            yield _hex.id
+
+    @property
+    def storage_size(self) -> int:
+        """Size of board storage. Hex indexes are less than it"""
+        return len(self._hexes)
+
+    def index_of(self, q: int, r: int) -> int:
+        """Index of hex with given axial coordinates in board storage. Returns -1 if hex is out of board"""
+        if max(abs(q), abs(r), abs(q + r)) > self._offset:
+            return -1
+        return (q + self._offset) * self._width + r + self._offset
 
     def add(self, _hex: Hex) -> bool:
         """
@@ -89,67 +160,235 @@ class Board:
         Returns success of operation
         """
         if isinstance(_hex, Hex) and _hex.distance_from_center() < self.radius:
-            self.__hexes[f'{_hex.q};{_hex.r}'] = _hex
+            index = self.index_of(_hex.q, _hex.r)
+            replaced_hex = self._hexes[index]
+            if replaced_hex is not None:
+                self._occupancy[replaced_hex.slot_code] &= ~(1 << index)
+                replaced_hex.board = None
+            _hex.index = index
+            _hex.board = self
+            self._occupancy[_hex.slot_code] |= 1 << index
+            self.dirty_mask |= 1 << index
+            self.changes_mask |= 1 << index
+            self._hexes[index] = _hex
             return True
         return False
 
+    def update_occupancy(self, _hex: Hex, slot_code: int):
+        """Move hex to the occupancy bitset of new <slot_code>. Called by hex on it's slot change"""
+        bit = 1 << _hex.index
+        self._occupancy[_hex.slot_code] &= ~bit
+        self._occupancy[slot_code] |= bit
+        self.dirty_mask |= bit
+        self.changes_mask |= bit
+
+    def pop_dirty_mask(self) -> int:
+        """Returns bitset of hexes, changed since previous call"""
+        dirty_mask, self.dirty_mask = self.dirty_mask, 0
+        return dirty_mask
+
+    def pop_changes_mask(self) -> int:
+        """Returns bitset of hexes, changed since previous call. Independent of <pop_dirty_mask>"""
+        changes_mask, self.changes_mask = self.changes_mask, 0
+        return changes_mask
+
+    def get_slots_mask(self, slots: list) -> int:
+        """Bitset of hexes, occupied by any of given slot values"""
+        mask = 0
+        for slot_code in {get_slot_code(slot) for slot in slots}:
+            mask |= self._occupancy[slot_code]
+        return mask
+
+    def iter_mask(self, mask: int) -> Iterator[Hex]:
+        """Iterate over hexes, which bits are set in <mask>, in order of their indexes"""
+        hexes = self._hexes
+        while mask:
+            lowest_bit = mask & -mask
+            yield hexes[lowest_bit.bit_length() - 1]
+            mask ^= lowest_bit
+
+    def iter_by_slots(self, slots: list) -> Iterator[Hex]:
+        """Iterate over hexes, occupied by any of given slot values"""
+        return self.iter_mask(self.get_slots_mask(slots))
+
     def get(self, key: str, default_value=None) -> Hex:
         """Returns hex by its key."""
-        return self.__hexes.get(key, default_value)
+        index = self._index_by_id.get(key)
+        if index is None:
+            return default_value
+        return self._hexes[index]
+
+    def get_at(self, q: int, r: int) -> Optional[Hex]:
+        """Returns hex by its axial coordinates. None if there is no such hex in board"""
+        index = self.index_of(q, r)
+        if index < 0:
+            return None
+        return self._hexes[index]
+
+    def get_by_index(self, index: int) -> Optional[Hex]:
+        """Returns hex by its index in board storage"""
+        return self._hexes[index]
 
-    def items(self):
-        """Returns items of dict with all hexes in board"""
-        return self.__hexes.items()
+    def get_neighbor_indexes(self, index: int) -> Tuple[int, ...]:
+        """Indexes of neighbors of hex with given index"""
+        return self._neighbors[index]
+
+    def values(self) -> List[Hex]:
+        """Returns all hexes in board"""
+        return [_hex for _hex in self._hexes if _hex is not None]
+
+    def items(self) -> List[Tuple[str, Hex]]:
+        """Returns pairs of hex id and hex for all hexes in board"""
+        return [(_hex.id, _hex) for _hex in self.values()]
 
     def load_state(self, hexes: list):
         """Load board from saved state"""
         for _hex_data in hexes:
-            _hex = Hex(_hex_data['q'], _hex_data['r'])
-            if _hex_data['slot'] == slotObstacle:
-                _hex.slot = Obstacle()
-            self.add(_hex)
+            _hex = self.get_at(_hex_data['q'], _hex_data['r'])
+            if _hex is None:
+                continue
+            _hex.slot = Obstacle() if _hex_data['slot'] == slotObstacle else slotEmpty
 
     def get_neighbors(self, _hex: Hex) -> List[Hex]:
         """
         Get neighboring hexes.
         Up to 6 neighbors for given hex (Could be on the edge of board and will have less neighbors)
         """
-        _neighbors = []
-        for bias in self.position_biases:
-            _neighbor = self.get(f"{_hex.q + bias[0]};{_hex.r + bias[1]}")
-            if _neighbor:
-                _neighbors.append(_neighbor)
-        return _neighbors
+        index = self.index_of(_hex.q, _hex.r)
+        if index < 0:
+            return []
+        return [self._hexes[neighbor] for neighbor in self._neighbors[index]]
+
+    def get_disk(self, start_hex: Hex, _range: int) -> Tuple[int, ...]:
+        """Indexes of board hexes in <_range> away from <start_hex>, including <start_hex> itself"""
+        # any range wider than board diameter gives the same disk
+        _range = max(min(_range, 2 * self._offset), 0)
+        index = self.index_of(start_hex.q, start_hex.r)
+        if index < 0:
+            indexes = (self.index_of(start_hex.q + q, start_hex.r + r) for q, r in get_disk_offsets(_range))
+            return tuple(index for index in indexes if index >= 0)
+        return self.geometry.get_disk(index, _range)
+
+    def get_disk_mask(self, start_hex: Hex, _range: int) -> int:
+        """Bitset of board hexes in <_range> away from <start_hex>, including <start_hex> itself"""
+        index = self.index_of(start_hex.q, start_hex.r)
+        if index < 0:
+            mask = 0
+            for index in self.get_disk(start_hex, _range):
+                mask |= 1 << index
+            return mask
+        return self.geometry.get_disk_mask(index, max(min(_range, 2 * self._offset), 0))
+
+    def get_ring(self, start_hex: Hex, _range: int) -> Tuple[int, ...]:
+        """Indexes of board hexes exactly <_range> away from <start_hex>"""
+        index = self.index_of(start_hex.q, start_hex.r)
+        if index < 0:
+            return tuple(index for index in self.get_disk(start_hex, _range)
+                         if self.distance(start_hex, self._hexes[index]) == _range)
+        return self.geometry.get_ring(index, _range)
+
+    def get_line(self, start_hex: Hex, dq: int, dr: int, length: int) -> Tuple[int, ...]:
+        """Indexes of up to <length> board hexes, starting from <start_hex> and stepping by (<dq>, <dr>)"""
+        return self.geometry.get_line(start_hex.index, dq, dr, length)
+
+    def has_line_of_sight(self, source: Hex, target: Hex, blocking_slots: Sequence = SIGHT_BLOCKING_SLOTS) -> bool:
+        """Whether no hex between <source> and <target> is occupied by <blocking_slots>"""
+        between_mask = self.geometry.get_between_mask(source.index, target.index)
+        return not between_mask & self.get_slots_mask(blocking_slots)
+
+    def get_visible_mask(self, source: Hex, _range: int, blocking_slots: Sequence = SIGHT_BLOCKING_SLOTS) -> int:
+        """Bitset of hexes in <_range> away from <source>, which are in line of sight from it"""
+        _range = max(min(_range, 2 * self._offset), 0)
+        blocked_mask = self.get_slots_mask(blocking_slots)
+        key = (source.index, _range, blocked_mask)
+        visible_mask = self._visibility.get(key)
+        if visible_mask is None:
+            visible_mask = 0
+            for index in self.geometry.get_disk(source.index, _range):
+                if not self.geometry.get_between_mask(source.index, index) & blocked_mask:
+                    visible_mask |= 1 << index
+            if self.visibility_cache_size:
+                if len(self._visibility) >= self.visibility_cache_size:
+                    self._visibility.clear()
+                self._visibility[key] = visible_mask
+        return visible_mask
+
+    def iter_visible(self, source: Hex, _range: int, blocking_slots: Sequence = SIGHT_BLOCKING_SLOTS,
+                     **kwargs) -> Iterator[Hex]:
+        """
+        Iterate over hexes in <_range> away from <source>, which are in line of sight from it.
+        Hexes can be filtered by <allowed> and <restricted> slots in kwargs
+        """
+        return self.iter_mask(self._filter_mask(self.get_visible_mask(source, _range, blocking_slots), **kwargs))
+
+    def get_distance(self, hex_a: Hex, hex_b: Hex) -> int:
+        """Get distance between two hexes of the board. Faster than <distance>, but only for hexes of this board"""
+        return self.geometry.get_distance_row(hex_a.index)[hex_b.index]
+
+    def iter_hexes_in_range(self, start_hex: Hex, _range: int, **kwargs) -> Iterator[Hex]:
+        """
+        Iterate over hexes in <_range> away from <start_hex>, including <start_hex> itself.
+        Hexes can be filtered by <allowed> and <restricted> slots in kwargs
+        """
+        if 'allowed' in kwargs or 'restricted' in kwargs:
+            return self.iter_mask(self._filter_mask(self.get_disk_mask(start_hex, _range), **kwargs))
+        hexes = self._hexes
+        return (hexes[index] for index in self.get_disk(start_hex, _range))
+
+    def iter_ring(self, start_hex: Hex, _range: int, **kwargs) -> Iterator[Hex]:
+        """
+        Iterate over hexes exactly <_range> away from <start_hex>.
+        Hexes can be filtered by <allowed> and <restricted> slots in kwargs
+        """
+        if 'allowed' in kwargs or 'restricted' in kwargs:
+            mask = self.get_disk_mask(start_hex, _range)
+            if _range > 0:
+                mask &= ~self.get_disk_mask(start_hex, _range - 1)
+            return self.iter_mask(self._filter_mask(mask, **kwargs))
+        hexes = self._hexes
+        return (hexes[index] for index in self.get_ring(start_hex, _range))
+
+    def _filter_mask(self, mask: int, **kwargs) -> int:
+        """Intersect <mask> with occupancy of <allowed> slots and exclude occupancy of <restricted> slots"""
+        if 'allowed' in kwargs:
+            mask &= self.get_slots_mask(kwargs['allowed'])
+        if 'restricted' in kwargs:
+            mask &= ~self.get_slots_mask(kwargs['restricted'])
+        return mask
 
     def get_hexes_in_range(self, start_hex: Hex, _range: int, **kwargs) -> Dict[str, Hex]:
         """
         Get hexes in <_range> away from <start_hex>. <start_hex> hex itself doesn't count in range
         Can specify allowed hex occupation in kwargs, or filter them separately with according method
         """
-        hexes_in_range = {}
-        for q in range(-_range, _range + 1):
-            for r in range(max(-_range, -q - _range), min(_range, -q + _range) + 1):
-                _hex_id = f"{q + start_hex.q};{r + start_hex.r}"
-                hexes_in_range[_hex_id] = self.get(_hex_id)
-        return self.filter(hexes_in_range, **kwargs)
+        return {_hex.id: _hex for _hex in self.iter_hexes_in_range(start_hex, _range, **kwargs)}
 
     def filter(self, hexes: Dict[str, Hex], **kwargs) -> Dict[str, Hex]:
         """Filter passed hexes by their slots"""
-        for hex_id in list(hexes.keys()):
-            if hex_id not in self.__hexes:
-                del hexes[hex_id]
+        allowed, restricted = self._slot_codes_filter(**kwargs)
+        return {
+            hex_id: _hex for hex_id, _hex in hexes.items()
+            if hex_id in self._index_by_id
+            and (allowed is None or _hex.slot_code in allowed)
+            and (restricted is None or _hex.slot_code not in restricted)
+        }
+
+    @staticmethod
+    def _slot_codes_filter(**kwargs) -> Tuple[Optional[Set[int]], Optional[Set[int]]]:
+        """Convert <allowed> and <restricted> slot values from kwargs to sets of slot codes"""
+        allowed = restricted = None
         if 'allowed' in kwargs:
-            hexes = {hex_id: _hex for hex_id, _hex in hexes.items() if str(_hex.slot) in kwargs['allowed']}
+            allowed = {get_slot_code(slot) for slot in kwargs['allowed']}
         if 'restricted' in kwargs:
-            hexes = {hex_id: _hex for hex_id, _hex in hexes.items() if str(_hex.slot) not in kwargs['restricted']}
-        return hexes
+            restricted = {get_slot_code(slot) for slot in kwargs['restricted']}
+        return allowed, restricted
 
     def place_game_object(self, game_object: 'BaseGameObject', hex_id: str):
         """Place game object in board according to it's position"""
-        _hex = self.__hexes[hex_id]
+        _hex = self[hex_id]
         if _hex.slot == game_object:
             return
-        if _hex.slot != slotEmpty:
+        if _hex.slot_code != EMPTY_CODE:
             raise RuntimeError('Cant move there. Hex occupied by another game object')
         # if game_object already placed somewhere, set it's previous position to empty
         if game_object.position:
@@ -157,19 +396,25 @@ class Board:
         game_object.position = _hex
         _hex.slot = game_object
 
+    def remove_game_object(self, game_object: 'BaseGameObject'):
+        """Remove game object from board. Object keeps reference to it's last position"""
+        if game_object.position is not None and game_object.position.slot is game_object:
+            game_object.position.slot = slotEmpty
+
     def clear_board(self):
         """Clear board from units, hero, game objects. Re-generate obstacles"""
-        for _hex in self.__hexes.values():
-            if _hex.slot != slotEmpty:
+        for _hex in self.values():
+            if _hex.slot_code != EMPTY_CODE:
                 _hex.slot.position = None
             _hex.slot = slotEmpty
 
-    def set_obstacles(self):
-        """Generates obstacles on board"""
+    def set_obstacles(self, rng: Random = None):
+        """Generates obstacles on board. Global random generator is used, if <rng> is not passed"""
         # todo write algorithms for obstacles generating
-        for _hex in self.__hexes.values():
-            if _hex.slot == slotEmpty:
-                if int(random() * 100) < OBSTACLE_CHANCE:
+        rng = rng or random
+        for _hex in self.values():
+            if _hex.slot_code == EMPTY_CODE:
+                if int(rng.random() * 100) < OBSTACLE_CHANCE:
                     _hex.slot = Obstacle()
 
     @staticmethod
@@ -179,4 +424,4 @@ class Board:
 
     def get_state(self) -> dict:
         """Get serialized board state"""
-        return {'radius': self.radius, 'hexes': {k: v.as_dict() for k, v in self.items()}}
+        return {'radius': self.radius, 'hexes': {_hex.id: _hex.as_dict() for _hex in self.values()}}
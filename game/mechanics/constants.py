@@ -7,4 +7,15 @@ slotObstacle = 'obstacle'
 slotEmpty = 'empty'
 slotStructure = 'structure'
 
+# Integer codes of hex slot values. Board compares codes instead of calling str() on slot objects
+slotCodes = {
+    slotEmpty: 0,
+    slotObstacle: 1,
+    slotUnit: 2,
+    slotHero: 3,
+    slotStructure: 4,
+}
+# code for slot objects, that are not listed above
+slotCodeOther = len(slotCodes)
+
 BOARD_RADIUS = 6
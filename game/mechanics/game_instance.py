@@ -1,31 +1,73 @@
 import json
+import logging
 import math
-from random import shuffle
-from typing import Dict
+from collections import deque, namedtuple
+from random import Random
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
 
 from game.mechanics.actions import ActionManager, Action, ActionResponse
-from game.mechanics.game_objects import Hero, BaseGameObject, BaseUnitObject, Unit
+from game.mechanics.game_objects import Hero, BaseGameObject, BaseUnitObject, Unit, write_abilities
 from game.mechanics.game_sturctures import StructuresManager
-from game.models import User, GameModel, UnitModel, HeroModel, ItemModel, GameStructureModel, HandbookModel, \
-    AbilityModel, SpellModel, SkillModel
+from game.mechanics.handbook import Handbook
+from game.mechanics.instrumentation import phase
+from game.mechanics.pathfinding import Pathfinder
+from game.mechanics.state_codec import ABILITY_TYPES, encode_state, decode_state
+from game.mechanics.turn_log import (SNAPSHOT_INTERVAL, TurnRecord, build_snapshot_model, build_turn_models,
+                                     delete_turns_after, load_turns, make_record)
+from game.mechanics.turns import TurnPlanner
+from game.models import User, GameModel, HeroModel, TurnRecordModel
 from game.mechanics.board import Board, Hex
-from game.mechanics.constants import slotHero, slotEmpty, slotUnit, slotObstacle
+from game.mechanics.constants import BOARD_RADIUS, slotHero, slotEmpty, slotUnit, slotObstacle
+
+logger = logging.getLogger(__name__)
+
+# number of last state versions, which changes are kept for delta responses
+CHANGES_HISTORY_SIZE = 16
+
+StateChanges = namedtuple('StateChanges', ['version', 'hexes_mask', 'units', 'removed_units', 'hero_fields'])
+# step of the turn, see GameInstance.iter_turn. <kind> is one of 'hero', 'unit', 'moves'
+TurnEvent = namedtuple('TurnEvent', ['kind', 'data'])
 
 
 class GameInstance:
     """
     Class to manage single game instance
     """
-    def __init__(self, game_model: GameModel):
+    def __init__(self, game_model: GameModel, radius: int = BOARD_RADIUS):
         """Loading board from passed game model or generating new"""
         self._game = game_model
-        self._board = Board()
+        self._board = Board(radius)
+        self.pathfinder = Pathfinder(self._board)
         self._hero = Hero(self._game.hero)
 
         # round-wise game objects
         self.units = {}
         self.structures = {}
 
+        # version of game snapshot in session store, this instance is synced with (see GameManager)
+        self.snapshot_version = 0
+        # game was changed since it was saved or scheduled for autosave
+        self.dirty = False
+        # abilities, kept by hero, differ from ones of hero model, so they are written on save
+        self._abilities_changed = False
+
+        # state version, increased by every turn, and changes made in last versions. Used for delta responses
+        self.state_version = 0
+        self._changes_base_version = 0
+        self._changes: Deque[StateChanges] = deque(maxlen=CHANGES_HISTORY_SIZE)
+        self._committed_hero: dict = {}
+        self._committed_units: Dict[int, dict] = {}
+
+        # random generator of the game. It's reseeded at the start of every turn, so turns can be replayed
+        self.rng = Random()
+        # number of turns made, turns not saved yet and turns saved after the latest snapshot (see <dump_save>)
+        self.turn = game_model.turn
+        self.turn_log: List[TurnRecord] = []
+        self._saved_turns: List[TurnRecord] = []
+        # turn of the latest snapshot. None if the state was changed outside of turns, so snapshot is needed
+        self.snapshot_turn: Optional[int] = None
+        self._in_turn = False
+
     # region instance managing
     @classmethod
     def new(cls, user: User, hero_data: dict):
@@ -33,66 +75,209 @@ class GameInstance:
         Create new game but not save
         Returns game id and game instance itself
         """
+        handbook = Handbook.instance()
         hero_model = HeroModel.objects.create(name=hero_data['name'],
-                                              suit=ItemModel.objects.get(name='Cuirass'),
-                                              weapon=ItemModel.objects.get(name='Sword'))
+                                              suit=handbook.get_item_by_name('Cuirass'),
+                                              weapon=handbook.get_item_by_name('Sword'))
         _game = GameModel.objects.create(user=user, hero=hero_model)
         _instance = cls(_game)
         return _game.pk, _instance
 
     @classmethod
     def load(cls, game_id: int):
-        """Load already created game"""
+        """Load already created game with turns, made after its latest snapshot"""
         _game = GameModel.objects.get(pk=game_id)
         if _game:
-            return cls(_game)
+            _instance = cls(_game)
+            if _game.state_data:
+                _instance._saved_turns = load_turns(_game.pk, decode_state(_game.state_data).get('turn', 0))
+            return _instance
 
-    def save_state(self):
-        """Save state of the game"""
+    def dump_state(self) -> dict:
+        """Get state of the game, enough to restore it with <restore_state>"""
         # need to save hero spells/skills/items too
         game_state = {
             'round': self._game.round,
-            'hero': {'health': self.hero.health, 'position': self.hero.position.id},
+            'turn': self.turn,
+            'hero': {'health': self.hero.health, 'position': self.hero.position.id, **self._dump_abilities()},
             'hexes': [],
             'units': [],
             'structures': [],
         }
-        for hex_id, _hex in self._board.items():
-            if str(_hex.slot) == slotObstacle:
-                game_state['hexes'].append({'q': _hex.q, 'r': _hex.r, 'slot': slotObstacle})
+        for _hex in self._board.iter_by_slots([slotObstacle]):
+            game_state['hexes'].append({'q': _hex.q, 'r': _hex.r, 'slot': slotObstacle})
         for unit_id, unit in self.units.items():
-            game_state['units'].append({'level': unit.level, 'health': unit.health, 'position': unit.position.id})
+            game_state['units'].append({'pk': unit_id, 'level': unit.level, 'health': unit.health,
+                                        'position': unit.position.id})
         for code_name, structure in self.structures.items():
-            game_state['structures'].append({'code_name': code_name, 'position': structure.position.id})
-        self._game.state = json.dumps(game_state)
-        self._game.save()
+            game_state['structures'].append({'code_name': code_name, 'position': structure.position.id,
+                                             'assortment': structure.dump_assortment()})
+        return game_state
 
-    def load_state(self):
-        """Load saved state of the game"""
-        game_state = json.loads(self._game.state)
+    def _dump_abilities(self) -> dict:
+        """Pks of hero abilities and of abilities, which are not kept by hero yet (see Hero.unsaved_abilities)"""
+        handbook = Handbook.instance()
+        return {
+            'abilities': {
+                'spell': [handbook.get_ability('spell', code_name).pk for code_name in self.hero.spell_names],
+                'skill': list(self.hero.skill_ids),
+                'item': list(self.hero.item_ids),
+            },
+            'unsaved_abilities': {ability_type: [ability.pk for ability in abilities]
+                                  for ability_type, abilities in self.hero.unsaved_abilities.items()},
+        }
+
+    def _dump_kept_abilities(self) -> Dict[str, List[int]]:
+        """Pks of hero abilities, except ones not kept by hero yet. They are written to hero model on save"""
+        abilities = self._dump_abilities()
+        return {ability_type: [pk for pk in pks if pk not in abilities['unsaved_abilities'][ability_type]]
+                for ability_type, pks in abilities['abilities'].items()}
 
+    def _restore_abilities(self, hero_state: dict):
+        handbook = Handbook.instance()
+        abilities, unsaved_abilities = [
+            {ability_type: [handbook.get_ability_by_pk(ability_type, pk) for pk in hero_state[key][ability_type]]
+             for ability_type in ABILITY_TYPES}
+            for key in ['abilities', 'unsaved_abilities']]
+        kept_abilities = self._dump_kept_abilities()
+        self.hero.restore_abilities(abilities, unsaved_abilities)
+        if self._dump_kept_abilities() != kept_abilities:
+            self._abilities_changed = True
+
+    def restore_state(self, game_state: dict):
+        """Restore game from state, got by <dump_state>"""
         self._game.round = game_state.get('round', self._game.round)
+        self.turn = game_state.get('turn', self.turn)
+        # turns, made before the restored state, can't be replayed after it
+        self.turn_log.clear()
+        self._saved_turns = []
+        self.snapshot_turn = None
         self.units.clear()
         self.structures.clear()
         self._board.clear_board()
+        if 'state_version' in game_state:
+            # versions continue from the restored one, so that number of version means the same state in every
+            # instance of the game. Version of this instance is never decreased, so it's not repeated either
+            self.state_version = max(self.state_version, game_state['state_version'] - 1)
         hero = game_state.get('hero', {})
         self.hero.set_health(hero.get('health', self.hero.health))
+        if 'abilities' in hero:
+            # states of old formats have no abilities, hero keeps his own then
+            self._restore_abilities(hero)
         self._board.place_game_object(self._hero, hero.get('position', f'0;{self._board.radius // 2}'))
         self._board.load_state(game_state.get('hexes', []))
         if 'structures' in game_state:
             for structure_data in game_state.get('structures', []):
-                structure_model = GameStructureModel.objects.get(code_name=structure_data['code_name'])
+                structure_model = Handbook.instance().get_structure(structure_data['code_name'])
                 structure = StructuresManager.build(self, structure_model, structure_data['position'])
+                structure.restore_assortment(structure_data.get('assortment', []))
                 self.structures[structure_model.code_name] = structure
         if 'units' in game_state:
             for unit_data in game_state.get('units', []):
-                unit = UnitModel.objects.get(level=unit_data['level'])
-                unit.pk = len(self.units)
-                unit.health = unit_data['health']
-                unit = Unit(unit)
+                unit = Unit(Handbook.instance().get_unit_template(unit_data['level']),
+                            pk=unit_data.get('pk', len(self.units)))
+                unit.set_health(unit_data['health'])
                 self._board.place_game_object(unit, unit_data['position'])
                 self.units[unit.pk] = unit
         self.update_moves()
+        self.reset_changes()
+
+    def dump_snapshot(self) -> bytes:
+        """Get encoded state of the game"""
+        return self._encode_state(compress=False)
+
+    def _encode_state(self, compress: bool = True) -> bytes:
+        """Encoded state of the game with its state version"""
+        return encode_state({**self.dump_state(), 'state_version': self.state_version}, self._board.radius,
+                            compress=compress)
+
+    def restore_snapshot(self, snapshot: bytes):
+        """Restore game from encoded state, got by <dump_snapshot>"""
+        self.restore_state(decode_state(snapshot))
+
+    def save_state(self):
+        """Save state of the game with snapshot and turns, made since the last save"""
+        save = self.dump_save(snapshot=True)
+        # old json state is replaced by binary one
+        self._game.state = '{}'
+        self._game.save()
+        delete_turns_after([(self._game.pk, save['snapshot_turn'])])
+        TurnRecordModel.objects.bulk_create(build_turn_models(self._game.pk, save['turns']), ignore_conflicts=True)
+        build_snapshot_model(self._game.pk, save['snapshot_turn'], save['state_data']).save()
+        self.hero.write_back()
+        self._game.hero.save(update_fields=['health'])
+        if save['hero_abilities'] is not None:
+            write_abilities(self._game.hero, save['hero_abilities'])
+        self.dirty = False
+
+    def dump_save(self, snapshot: bool = False) -> dict:
+        """
+        Values of model fields, written by <save_state>. Used to save the game in background (see autosave).
+        Turns, made since the last save, are taken from turn log. Full state is dumped only if <snapshot> is set,
+        game was changed without turns or SNAPSHOT_INTERVAL turns are made since the latest snapshot,
+        otherwise <state_data> is None. Abilities of hero are dumped only if they were changed, otherwise
+        <hero_abilities> is None
+        """
+        turns, self.turn_log = self.turn_log, []
+        snapshot = (snapshot or not turns or self.snapshot_turn is None
+                    or self.turn - self.snapshot_turn >= SNAPSHOT_INTERVAL)
+        if snapshot:
+            self._game.state_data = self._encode_state()
+            self._game.turn = self.snapshot_turn = self.turn
+            self._saved_turns = []
+        else:
+            self._saved_turns.extend(turns)
+        hero_abilities = self._dump_kept_abilities() if self._abilities_changed else None
+        self._abilities_changed = False
+        return {
+            'game_id': self._game.pk,
+            'hero_id': self._game.hero_id,
+            'round': self._game.round,
+            'turn': self.turn,
+            'state_data': self._game.state_data if snapshot else None,
+            'snapshot_turn': self.snapshot_turn,
+            'hero_health': self.hero.health,
+            'hero_abilities': hero_abilities,
+            'turns': turns,
+        }
+
+    def load_state(self):
+        """Load saved state of the game: the latest snapshot and turns, made after it"""
+        if self._game.state_data:
+            saved_turns = self._saved_turns
+            self.restore_state(decode_state(self._game.state_data))
+            self.snapshot_turn = self.turn
+            replayed = self.replay_turns(saved_turns)
+            self._saved_turns = saved_turns[:replayed]
+            if replayed < len(saved_turns):
+                # the rest of turns is replaced by snapshot of the state, which is reached. Their numbers are
+                # skipped, so the snapshot is not older than saved turns (see autosave)
+                self.turn = saved_turns[-1].turn
+                self.snapshot_turn = None
+                self.dirty = True
+        else:
+            self.restore_state(json.loads(self._game.state))
+
+    def replay_turns(self, records: Iterable[TurnRecord]) -> int:
+        """
+        Make turns of turn log again. Game must be in the state right before the first of them.
+        Replay stops at the first turn, which can't be made. Returns number of replayed turns
+        """
+        replayed = 0
+        for record in records:
+            if record.turn != self.turn + 1:
+                print(f'Turn {record.turn} can\'t be replayed after turn {self.turn}')
+                break
+            try:
+                for _ in self.iter_turn(dict(record.action), seed=record.seed):
+                    pass
+            except Exception as err:
+                print(f'Replay of turn {record.turn} failed: {err}')
+                break
+            replayed += 1
+        # replayed turns are in the log already
+        self.turn_log.clear()
+        return replayed
 
     def before_closed(self):
         """
@@ -110,6 +295,16 @@ class GameInstance:
     @property
     def hero(self) -> Hero:
         return self._hero
+
+    @property
+    def has_saved_state(self) -> bool:
+        """Whether the game was saved, so it can be restored with <load_state>"""
+        return bool(self._game.state_data) or self._game.state not in ('', '{}')
+
+    @property
+    def weight(self) -> int:
+        """Approximate memory footprint of the game, measured in number of hexes and game objects"""
+        return len(self._board) + len(self.units) + len(self.structures) + 1
     # endregion properties
 
     # region round managing
@@ -129,9 +324,13 @@ class GameInstance:
         self.move_object(self._hero, f'0;{self._board.radius // 2}')
 
         StructuresManager.place_structures(self, self.get_available_hexes(), f'{0};-{self._board.radius - 2}')
-        self._board.set_obstacles()
+        self._board.set_obstacles(self.rng)
         self.place_units()
         self.update_moves()
+        self.reset_changes()
+        if not self._in_turn:
+            # state can't be reproduced by replay of turns
+            self.snapshot_turn = None
 
     def get_available_hexes(self) -> list:
         """
@@ -140,11 +339,12 @@ class GameInstance:
         """
         # secure fixed place for exit
         exit_pos = f'{0};-{self._board.radius - 2}'
-        available_hexes = {_id for _id, _hex in self._board.items() if _hex.slot == slotEmpty and _id != exit_pos}
+        available_hexes = {_hex.id for _hex in self._board.iter_by_slots([slotEmpty]) if _hex.id != exit_pos}
         safe_range = max(self._board.radius // 2 - self._game.round // 8, 1)
-        safe_hexes = self._board.get_hexes_in_range(self._hero.position, safe_range, allowed=[slotEmpty, slotHero])
-        available_hexes = list(available_hexes - safe_hexes.keys())
-        shuffle(available_hexes)
+        safe_hexes = {_hex.id for _hex in self._board.iter_hexes_in_range(self._hero.position, safe_range,
+                                                                         allowed=[slotEmpty, slotHero])}
+        available_hexes = list(available_hexes - safe_hexes)
+        self.rng.shuffle(available_hexes)
         return available_hexes
 
     def place_units(self):
@@ -157,10 +357,9 @@ class GameInstance:
             Recursive call for units of lower level
             """
             u_count = points if unit_level == 1 else round((points // 2) / unit_level)
+            unit_template = Handbook.instance().get_unit_template(unit_level)
             for i in range(u_count):
-                unit = UnitModel.objects.get(level=unit_level)
-                unit.pk = len(self.units)
-                unit = Unit(unit)
+                unit = Unit(unit_template, pk=len(self.units))
                 self._board.place_game_object(unit, _available_hexes.pop())
                 self.units[unit.pk] = unit
             points_remain = int(points - u_count * unit_level)
@@ -171,56 +370,176 @@ class GameInstance:
         place_by_unit_level(self._game.round, max_unit_level, self.get_available_hexes())
 
     def update_moves(self):
-        """Update available moves and attack hexes of hero and units"""
-        self._hero.moves = list(
-            self.get_hexes_in_range(self._hero.position, self._hero.move_range, allowed=[slotEmpty]).keys())
-        self._hero.attack_hexes = list(self.get_hexes_in_range(self._hero.position, self._hero.attack_range,
-                                                               allowed=[slotEmpty, slotUnit]).keys())
+        """
+        Update available moves and attack hexes of hero and units.
+        Only objects, that moved or have changed hexes in their move/attack ranges since last update, are recomputed
+        """
+        dirty_mask = self._board.pop_dirty_mask()
+        self._update_object_moves(self._hero, [slotEmpty, slotUnit], dirty_mask)
         for unit in self.units.values():
-            unit.moves = list(self.get_hexes_in_range(unit.position, unit.move_range, allowed=[slotEmpty]).keys())
-            unit.attack_hexes = list(self.get_hexes_in_range(unit.position, unit.attack_range,
-                                                             allowed=[slotEmpty, slotHero]).keys())
+            self._update_object_moves(unit, [slotEmpty, slotHero], dirty_mask)
+
+    def _update_object_moves(self, unit: BaseUnitObject, attack_slots: list, dirty_mask: int):
+        """Recompute moves and attack hexes of given unit if they could have changed"""
+        origin = (unit.position.index, unit.move_range, unit.attack_range)
+        if origin == unit.moves_origin and not unit.moves_area & dirty_mask:
+            return
+        unit.moves = [_hex.id for _hex in self._board.iter_hexes_in_range(
+            unit.position, unit.move_range, allowed=[slotEmpty])]
+        unit.attack_hexes = [_hex.id for _hex in self._board.iter_hexes_in_range(
+            unit.position, unit.attack_range, allowed=attack_slots)]
+        unit.moves_origin = origin
+        unit.moves_area = self._board.get_disk_mask(unit.position, max(unit.move_range, unit.attack_range))
 
     def make_turn(self, action_data: dict) -> ActionResponse:
-        """Make game turn. First goes hero, then units"""
+        """Make game turn. First goes hero, then units. Every turn closes a state version"""
         response = ActionResponse(action_data['action'])
+        for _ in self.iter_turn(action_data, response):
+            pass
+        return response
+
+    def make_turns(self, actions: List[dict]) -> List[ActionResponse]:
+        """
+        Make several turns in a row. Stops after the first failed turn or when game is over.
+        Returns responses of made turns
+        """
+        responses = []
+        for action_data in actions:
+            response = self.make_turn(dict(action_data))
+            responses.append(response)
+            if response.state != ActionResponse.SUCCESS or self.is_game_over():
+                break
+        return responses
+
+    def iter_turn(self, action_data: dict, response: ActionResponse = None, seed: int = None) -> Iterator[TurnEvent]:
+        """
+        Make game turn step by step, yielding results as soon as they are known: hero action first,
+        then action of every unit, then new moves of hero. Results are also collected in <response>.
+        State version is closed, when generator is exhausted or closed.
+        Random generator of the game is reseeded with <seed> (new one, if it's not passed), which is written
+        to turn log with the action
+        """
+        if response is None:
+            response = ActionResponse(action_data['action'])
+        if seed is None:
+            seed = self.rng.getrandbits(62)
+        self.rng.seed(seed)
+        self.turn += 1
+        record = make_record(self.turn, action_data, seed)
+        self.turn_log.append(record)
+        self._in_turn = True
+        completed = False
+        try:
+            yield from self._iter_turn(action_data, response)
+            completed = True
+        finally:
+            self._in_turn = False
+            if not completed:
+                # turn, broken by unexpected error or left unfinished, can't be replayed,
+                # so the state it left is saved by snapshot instead
+                self.turn_log.remove(record)
+                self.turn -= 1
+                self.snapshot_turn = None
+            self.commit_changes()
+            self.dirty = True
+
+    def _iter_turn(self, action_data: dict, response: ActionResponse) -> Iterator[TurnEvent]:
         # hero performs actions first
         try:
-            action_data['source'] = self._hero
-            action: Action = ActionManager.get_action(self, action_data)
-            action_result = action.execute()
+            with phase('hero_action'):
+                action_data['source'] = self._hero
+                action: Action = ActionManager.get_action(self, action_data)
+                action_result = action.execute()
             response.hero_actions.update(action_result)
-            if response.name in ['exit', 'sanctuary', 'shop']:
-                # actions that shouldn't be followed by units' actions
-                return response
         except RuntimeError as err:
+            # if fails then return failure and units doesnt act
             response.state = ActionResponse.FAILED
-            return response
-        # if fails then return failure and units doesnt act
-        for unit in self.units.values():
-            # units choose from available actions
-            available_actions = ActionManager.available_actions(self, unit)
-            chosen_action = ActionManager.get_action(self, unit.choose_action(available_actions))
+            yield TurnEvent('hero', {'action': response.name, 'state': response.state, 'error': str(err)})
+            return
+        yield TurnEvent('hero', {'action': response.name, 'state': response.state, 'actions': action_result})
+        if response.name in ['exit', 'sanctuary', 'shop']:
+            # actions that shouldn't be followed by units' actions
+            return
+        with phase('plan_units'):
+            action_requests = TurnPlanner(self).plan()
+        for action_request in action_requests:
+            unit = action_request['source']
             try:
-                response.units_actions[unit.pk].update(chosen_action.execute())
+                with phase('unit_action'):
+                    chosen_action = ActionManager.get_action(self, action_request)
+                    unit_result = chosen_action.execute()
+                response.units_actions[unit.pk].update(unit_result)
                 if self.is_game_over():
                     response.state = ActionResponse.GAME_OVER
+                yield TurnEvent('unit', {'unit': unit.pk, 'actions': unit_result, 'state': response.state})
             except RuntimeError as err:
-                print('Unit action failed', err)
-        self.update_moves()
-        return response
+                logger.debug('Action of unit %s failed: %s', unit.pk, err)
+        with phase('update_moves'):
+            self.update_moves()
+        yield TurnEvent('moves', {'moves': self._hero.moves, 'attack_hexes': self._hero.attack_hexes,
+                                  'state': response.state})
 
     def is_game_over(self) -> bool:
         return self._hero.health <= 0
 
     def exit_round(self):
-        """Finish current round"""
+        """Finish current round. New round is saved by autosave (see GameManager.publish)"""
         self._game.round += 1
-        self._game.save()
-        self.hero.keep_unsaved_abilities()
+        self.dirty = True
+        if self.hero.keep_unsaved_abilities():
+            self._abilities_changed = True
         self.start_round()
     # endregion round managing
 
+    # region state versions
+    def commit_changes(self):
+        """Close current state version, remembering hexes, units and hero fields changed in it"""
+        hero_state = self._hero_state()
+        units_states = {pk: unit.runtime_state() for pk, unit in self.units.items()}
+        self.state_version += 1
+        self._changes.append(StateChanges(
+            version=self.state_version,
+            hexes_mask=self._board.pop_changes_mask(),
+            units={pk for pk, state in units_states.items() if self._committed_units.get(pk) != state},
+            removed_units=set(self._committed_units) - set(units_states),
+            hero_fields={key for key, value in hero_state.items() if self._committed_hero.get(key) != value},
+        ))
+        if len(self._changes) == self._changes.maxlen:
+            self._changes_base_version = self._changes[0].version - 1
+        self._committed_hero = hero_state
+        self._committed_units = units_states
+
+    def reset_changes(self):
+        """Start new state version, which can't be described as changes of previous ones, like new round"""
+        self._board.pop_changes_mask()
+        self._changes.clear()
+        self.state_version += 1
+        self._changes_base_version = self.state_version
+        self._committed_hero = self._hero_state()
+        self._committed_units = {pk: unit.runtime_state() for pk, unit in self.units.items()}
+
+    def _hero_state(self) -> dict:
+        """Fields of hero, which changes are tracked"""
+        return {**self.hero.runtime_state(), **self.hero.abilities_state()}
+
+    def get_changes(self, since_version: int) -> Optional[StateChanges]:
+        """
+        Changes made after <since_version> up to current version.
+        None if they are not known, so full state is needed
+        """
+        if not self._changes_base_version <= since_version <= self.state_version:
+            return None
+        changes = StateChanges(self.state_version, 0, set(), set(), set())
+        for version_changes in self._changes:
+            if version_changes.version > since_version:
+                changes = changes._replace(hexes_mask=changes.hexes_mask | version_changes.hexes_mask)
+                changes.units.update(version_changes.units)
+                changes.removed_units.update(version_changes.removed_units)
+                changes.hero_fields.update(version_changes.hero_fields)
+        changes.units.difference_update(changes.removed_units)
+        return changes
+    # endregion state versions
+
     # region game api
     def get_object_by_position(self, hex_id: str) -> BaseGameObject:
         """Get object position. If no such hex, KeyError raised"""
@@ -231,14 +550,10 @@ class GameInstance:
         self._board.place_game_object(game_object, new_position)
 
     def add_ability(self, ability_type: str, code_name: str):
-        """Add spell/skill/item to hero"""
-        abilities_map = {
-            'spell': SpellModel,
-            'skill': SkillModel,
-            'item': ItemModel
-        }
-        ability = abilities_map[ability_type].objects.get(code_name=code_name)
-        self.hero.add_ability(ability_type, ability)
+        """Add spell/skill/item to hero, if he doesn't have it yet"""
+        ability = Handbook.instance().get_ability(ability_type, code_name)
+        if not self.hero.has_ability(ability_type, ability):
+            self.hero.add_ability(ability_type, ability)
 
     def deal_damage(self, target_hex: str, damage: int) -> int:
         """Deal <damage> to object in <target_hex>"""
@@ -256,13 +571,37 @@ class GameInstance:
 
     def destroy_unit(self, target: BaseUnitObject):
         """Remove unit from game. Called on units death"""
-        target.position.slot = slotEmpty
+        self._board.remove_game_object(target)
         if isinstance(target, Unit):
             del self.units[target.pk]
 
     def distance(self, source: Hex, target_hex: str) -> int:
         """Get distance between two hexes. If no target_hex on board, then exception raised"""
-        return self._board.distance(source, self._board[target_hex])
+        return self._board.get_distance(source, self._board[target_hex])
+
+    def get_distances(self, source: Hex, targets: Iterable[Hex]) -> List[int]:
+        """Get distances from <source> to each of <targets> hexes"""
+        return self._board.geometry.distances_from(source.index, (target.index for target in targets))
+
+    def iter_hexes_intersection(self, hex_a: Hex, range_a: int, hex_b: Hex, range_b: int) -> Iterator[Hex]:
+        """Iterate over hexes, which are both in <range_a> away from <hex_a> and in <range_b> away from <hex_b>"""
+        board = self._board
+        return board.iter_mask(board.get_disk_mask(hex_a, range_a) & board.get_disk_mask(hex_b, range_b))
+
+    def has_line_of_sight(self, source: Hex, target_hex: str) -> bool:
+        """Whether there are no obstacles between <source> and <target_hex>"""
+        return self._board.has_line_of_sight(source, self._board[target_hex])
+
+    def iter_visible_hexes(self, start_hex: Hex, _range: int, **kwargs) -> Iterator[Hex]:
+        """
+        Iterate over hexes in <_range> away from <start_hex>, which are not hidden behind obstacles.
+        Can specify allowed or restricted hex occupation in kwargs
+        """
+        return self._board.iter_visible(start_hex, _range, **kwargs)
+
+    def iter_line(self, start_hex: Hex, dq: int, dr: int, length: int) -> Iterator[Hex]:
+        """Iterate over up to <length> hexes, starting from <start_hex> and stepping by (<dq>, <dr>)"""
+        return (self._board.get_by_index(index) for index in self._board.get_line(start_hex, dq, dr, length))
 
     def get_hexes_in_range(self, start_hex: Hex, _range: int, **kwargs) -> Dict[str, Hex]:
         """
@@ -271,7 +610,18 @@ class GameInstance:
         """
         return self._board.get_hexes_in_range(start_hex, _range, **kwargs)
 
+    def iter_hexes_in_range(self, start_hex: Hex, _range: int, **kwargs) -> Iterator[Hex]:
+        """
+        Iterate over hexes in <_range> away from <start_hex>, without building intermediate dicts.
+        Can specify allowed or restricted hex occupation in kwargs
+        """
+        return self._board.iter_hexes_in_range(start_hex, _range, **kwargs)
+
     def get_hex(self, hex_id: str, default_value=None) -> Hex:
         """Get hex by it's id"""
         return self._board.get(hex_id, default_value)
+
+    def get_hex_at(self, q: int, r: int) -> Hex:
+        """Get hex by it's axial coordinates. None if there is no such hex"""
+        return self._board.get_at(q, r)
     # endregion game api
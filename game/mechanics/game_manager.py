@@ -1,13 +1,46 @@
-from typing import Dict
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from socket import gethostname
+from threading import RLock
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
 
 from ..models import GameModel
 from django.contrib.auth.models import User
+from game.mechanics.actors import GameActors, MailboxFull
+from game.mechanics.autosave import AutosaveManager
 from game.mechanics.game_instance import GameInstance
+from game.mechanics.handbook import Handbook
+from game.mechanics.instrumentation import phase
+from game.mechanics.session_store import BaseSessionStore, SessionRecord
 
 
 class GameManager(object):
     """
     Singleton class to manage game instances
+
+    Loaded game instances are cached in LRU order. Cache is bounded by number of games and their summary weight
+    (see GameInstance.weight), games idle for longer than idle timeout are evicted too.
+    Evicted games are saved by their actors, so they can be loaded back from db later. Until then they can be
+    taken back to cache by their requests.
+    Limits are taken from GAME_MANAGER setting.
+
+    Snapshots of changed games are published to session store (GAME_SESSION_STORE setting), shared by
+    worker processes. If game was changed by another process, cached instance is restored from the snapshot,
+    instead of being reloaded from db. Game requests should be handled inside <lock_game>.
+
+    Requests for live games are run by per-game actors (see GameActors), so requests for the same game are
+    processed one by one in order of arrival, while different games are processed in parallel.
+    Options of actors are taken from GAME_ACTORS setting.
+    Db queries of requests are made by separate bounded pool (see <run_db>) outside of actors, so workers of actors
+    are busy with game logic only and db stalls don't hold up other games.
+
+    Published games, changed since last save, are saved in background by AutosaveManager.
     """
     __instance = None
 
@@ -23,27 +56,181 @@ class GameManager(object):
             raise Exception("This class is a singleton!")
         else:
             GameManager.__instance = self
-        self.game_instances: Dict[str, GameInstance] = {}
+        options = getattr(settings, 'GAME_MANAGER', {})
+        self.max_games: int = options.get('MAX_GAMES', 1000)
+        self.max_weight: int = options.get('MAX_WEIGHT', 200000)
+        self.idle_timeout: float = options.get('IDLE_TIMEOUT', 30 * 60)
+        # 0 to make db queries in caller thread
+        self.db_workers: int = options.get('DB_WORKERS', 4)
+        self._db_executor: Optional[ThreadPoolExecutor] = None
+
+        self.game_instances: Dict[str, GameInstance] = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._weights: Dict[str, int] = {}
+        self._weight = 0
+        # evicted games, which are not saved by their actors yet (see <_on_evicted>)
+        self._evicting: Dict[str, GameInstance] = {}
+        self._lock = RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'restores': 0}
+
+        store_settings = getattr(settings, 'GAME_SESSION_STORE', {})
+        store_class = import_string(store_settings.get('BACKEND', 'game.mechanics.session_store.LocalMemoryStore'))
+        self.store: BaseSessionStore = store_class(**store_settings.get('OPTIONS', {}))
+        self.autosave = AutosaveManager.instance()
+        actors_settings = getattr(settings, 'GAME_ACTORS', {})
+        self.actors = GameActors(workers=actors_settings.get('WORKERS', 8),
+                                 mailbox_size=actors_settings.get('MAILBOX_SIZE', 100),
+                                 timeout=actors_settings.get('TIMEOUT', 30),
+                                 inline=actors_settings.get('INLINE', False))
+
+    @property
+    def owner(self) -> str:
+        """Name of current worker process in session store"""
+        return f'{gethostname()}:{os.getpid()}'
+
+    def lock_game(self, game_id: str):
+        """Lock game across all threads and processes for the time of request"""
+        return self.store.lock(str(game_id))
+
+    def run_db(self, func: Callable, *args):
+        """Run function, making db queries, in bounded pool of db threads and wait for result"""
+        if not self.db_workers:
+            return func(*args)
+        return self._get_db_executor().submit(self._run_db, func, args).result()
 
-    def new_game(self, user: User, hero: dict) -> int:
-        """Create new game and bind user to it. Returns game id"""
+    def _get_db_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._db_executor is None:
+                # single thread is still needed for deferred saves of evicted games (see <_close_evicted>)
+                self._db_executor = ThreadPoolExecutor(max_workers=self.db_workers or 1, thread_name_prefix='game-db')
+            return self._db_executor
+
+    @staticmethod
+    def _run_db(func: Callable, args: tuple):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    def prefetch_game(self, game_id: str) -> bool:
+        """
+        Load game from db into cache, if it's not there. Called before game request is passed to game actor,
+        so actor gets the game from cache. Handbook is checked for changes of other processes here too, as actor
+        doesn't query db. Returns False if game doesn't exist
+        """
+        game_id = str(game_id)
+        handbook = Handbook.instance()
+        if handbook.check_due:
+            # handbook could be changed by another process
+            self.run_db(handbook.check_shared_version)
+        if game_id in self.game_instances or game_id in self._evicting:
+            # evicted game is either taken back by actor or saved before actor loads it
+            return True
+        with phase('load_game'):
+            game_instance = self.run_db(self._load, game_id)
+        if game_instance is None:
+            return False
+        evicted = []
+        with self._lock:
+            # game could be loaded by concurrent request
+            if game_id not in self.game_instances:
+                evicted = self._put(game_id, game_instance)
+        self._close_evicted(evicted)
+        return True
+
+    def _load(self, game_id: str) -> Optional[GameInstance]:
+        try:
+            return self._load_game(game_id)
+        except GameModel.DoesNotExist:
+            return None
+
+    def _load_game(self, game_id: str) -> GameInstance:
+        """Load game from db. Saved game, like evicted one, is restored to the state it was saved in"""
+        # changes of closed game may be not written yet
+        self.autosave.wait_saved(game_id)
+        game_instance = GameInstance.load(game_id)
+        if game_instance and game_instance.has_saved_state:
+            game_instance.load_state()
+        return game_instance
+
+    def new_game(self, user: User, hero: dict) -> GameInstance:
+        """Create new game and bind user to it. Returns game instance"""
         game_id, game_instance = GameInstance.new(user, hero)
-        self.game_instances[game_id] = game_instance
+        self._close_evicted(self._put(str(game_id), game_instance))
         return game_instance
 
-    def get_game(self, game_id: int) -> GameInstance:
+    def get_game(self, game_id: str) -> GameInstance:
         """Get loaded game or query already existing game from db"""
-        if game_id in self.game_instances:
-            return self.game_instances[game_id]
-        game_instance = GameInstance.load(game_id)
-        if game_instance:
-            self.game_instances[game_id] = game_instance
-            return game_instance
+        game_id = str(game_id)
+        evicted = []
+        with self._lock:
+            if game_id in self.game_instances:
+                self.stats['hits'] += 1
+                game_instance = self.game_instances[game_id]
+                self.game_instances.move_to_end(game_id)
+                self._last_access[game_id] = monotonic()
+                self._update_weight(game_id, game_instance.weight)
+                evicted = self._evict()
+            elif game_id in self._evicting:
+                # game is not saved yet, so it's taken back instead of loading from db
+                self.stats['hits'] += 1
+                game_instance = self._evicting.pop(game_id)
+                evicted = self._put(game_id, game_instance)
+            else:
+                self.stats['misses'] += 1
+                game_instance = None
+        self._close_evicted(evicted)
+        if game_instance is None:
+            with phase('load_game'):
+                game_instance = self._load_game(game_id)
+            if not game_instance:
+                return
+            self._close_evicted(self._put(game_id, game_instance))
+        with phase('sync_game'):
+            self._sync(game_id, game_instance)
+        return game_instance
+
+    def _sync(self, game_id: str, game_instance: GameInstance):
+        """Restore game instance from session store, if the game was changed by another process"""
+        meta = self.store.get_meta(game_id)
+        if meta is None or meta.version == game_instance.snapshot_version:
+            return
+        record = self.store.get(game_id)
+        game_instance.restore_snapshot(record.snapshot)
+        game_instance.snapshot_version = record.version
+        self.stats['restores'] += 1
+
+    def publish(self, game_id: str):
+        """
+        Publish snapshot of the game to session store, so other processes could continue it.
+        Changed game is scheduled for autosave
+        """
+        game_id = str(game_id)
+        game_instance = self.game_instances.get(game_id)
+        if game_instance is None or game_instance.hero.position is None:
+            return
+        if game_instance.dirty and not game_instance.is_game_over():
+            self.autosave.schedule(game_instance)
+        meta = self.store.get_meta(game_id)
+        version = max(meta.version if meta else 0, game_instance.snapshot_version) + 1
+        self.store.set(game_id, SessionRecord(version, self.owner, game_instance.dump_snapshot()))
+        game_instance.snapshot_version = version
+
+    def close_game(self, game_id: str) -> bool:
+        """Remove game instance from manager without saving it"""
+        game_instance = self._take(str(game_id))
+        self.store.delete(str(game_id))
+        if game_instance is None:
+            return False
+        game_instance.before_closed()
+        return True
 
     def delete_game(self, game_id: str) -> bool:
-        if game_id in self.game_instances:
-            _game = self.game_instances[game_id]._game
-            del self.game_instances[game_id]
+        game_instance = self._take(str(game_id))
+        self.store.delete(str(game_id))
+        self.autosave.discard(game_id)
+        if game_instance:
+            _game = game_instance._game
         else:
             _game = GameModel.objects.filter(pk=game_id)
             if not _game:
@@ -54,6 +241,100 @@ class GameManager(object):
         print(f'Deleted {del_count} objects: {del_objects}')
         return bool(del_count)
 
+    def get_stats(self) -> dict:
+        """Counters of cache usage"""
+        with self._lock:
+            return {**self.stats, 'games': len(self.game_instances), 'weight': self._weight}
+
+    def _put(self, game_id: str, game_instance: GameInstance) -> List[Tuple[str, GameInstance]]:
+        """
+        Add game instance to cache and evict games over the limits.
+        Returns evicted games, which must be passed to <_close_evicted> outside of the lock
+        """
+        with self._lock:
+            self._pop(game_id)
+            self.game_instances[game_id] = game_instance
+            self._last_access[game_id] = monotonic()
+            self._update_weight(game_id, game_instance.weight)
+            return self._evict()
+
+    def _update_weight(self, game_id: str, weight: int):
+        """Weight of game changes every round, so it's refreshed on each access"""
+        self._weight += weight - self._weights.get(game_id, 0)
+        self._weights[game_id] = weight
+
+    def _pop(self, game_id: str) -> GameInstance:
+        """Remove game instance from cache. Returns removed instance or None"""
+        with self._lock:
+            game_instance = self.game_instances.pop(game_id, None)
+            if game_instance is not None:
+                del self._last_access[game_id]
+                self._weight -= self._weights.pop(game_id)
+            return game_instance
+
+    def _take(self, game_id: str) -> Optional[GameInstance]:
+        """Remove game instance from cache or from evicted games, so it's not saved by eviction"""
+        with self._lock:
+            return self._pop(game_id) or self._evicting.pop(game_id, None)
+
+    def _evict(self) -> List[Tuple[str, GameInstance]]:
+        """
+        Remove idle games and least recently used games over the limits from cache.
+        Returns evicted games, which must be passed to <_close_evicted> outside of the lock
+        """
+        evicted = []
+        with self._lock:
+            expire_time = monotonic() - self.idle_timeout
+            while self.game_instances:
+                game_id = next(iter(self.game_instances))
+                # most recently used game is never evicted
+                if len(self.game_instances) == 1 or (
+                        self._last_access[game_id] > expire_time
+                        and len(self.game_instances) <= self.max_games
+                        and self._weight <= self.max_weight):
+                    break
+                game_instance = self._pop(game_id)
+                self._evicting[game_id] = game_instance
+                evicted.append((game_id, game_instance))
+                self.stats['evictions'] += 1
+        return evicted
+
+    def _close_evicted(self, evicted: List[Tuple[str, GameInstance]]):
+        """
+        Pass evicted games to their actors, so they are saved after requests, which are processed already.
+        Called outside of the lock, as saving makes db and session store queries.
+        If mailbox of the game is full, it's saved by db pool. It's never saved in caller thread, as caller can
+        hold lock of its own game, and taking lock of another game could deadlock with other processes
+        """
+        for game_id, game_instance in evicted:
+            try:
+                self.actors.submit(game_id, self._on_evicted, game_id, game_instance)
+            except MailboxFull:
+                self._get_db_executor().submit(self._run_db, self._on_evicted, (game_id, game_instance))
+
+    def _on_evicted(self, game_id: str, game_instance: GameInstance):
+        """Save evicted game, so it could be loaded again. Skipped if the game was taken back to cache"""
+        with self.lock_game(game_id):
+            with self._lock:
+                if self._evicting.get(game_id) is not game_instance:
+                    return
+            try:
+                if game_instance.hero.position and not game_instance.is_game_over():
+                    game_instance.before_closed()
+                    # not waited for, loading of the game waits for pending writes (see <get_game>)
+                    self.autosave.schedule(game_instance)
+                    self.autosave.flush([game_instance._game.pk])
+                # snapshot is not needed anymore, if no other process changed the game after this one
+                meta = self.store.get_meta(game_id)
+                if meta is not None and meta.owner == self.owner and meta.version == game_instance.snapshot_version:
+                    self.store.delete(game_id)
+            except Exception as err:
+                print(f'Failed to save evicted game {game_id}: {err}')
+            finally:
+                with self._lock:
+                    if self._evicting.get(game_id) is game_instance:
+                        del self._evicting[game_id]
+
     @staticmethod
     def get_games_by_user(user: User) -> list:
         """Get list of games of given user"""
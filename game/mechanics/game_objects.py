@@ -1,7 +1,7 @@
-from typing import List, TYPE_CHECKING, Dict, Tuple
+from typing import Dict, List, TYPE_CHECKING, Optional
 
 from game.mechanics.constants import slotObstacle, slotHero, slotUnit
-from game.models import HeroModel, BaseUnitModel, AbilityModel
+from game.models import HeroModel, BaseUnitModel, AbilityModel, UnitModel
 
 if TYPE_CHECKING:
     from django.db import models
@@ -9,37 +9,61 @@ if TYPE_CHECKING:
 
 
 class BaseGameObject:
+    __slots__ = ('position',)
+
     def __init__(self, **kwargs):
         self.position: Hex = kwargs.get('position', None)
 
 
 class Obstacle(BaseGameObject):
+    __slots__ = ()
+
     def __str__(self):
         return slotObstacle
 
 
 class InteractiveGameObject(BaseGameObject):
+    __slots__ = ('_object',)
+
     def __init__(self, object_model: 'models.Model', **kwargs):
         super().__init__(**kwargs)
         self._object: models.Model = object_model
 
 
 class BaseUnitObject(InteractiveGameObject):
+    """
+    Runtime representation of unit.
+    Stats are copied from unit model once on creation, so turns don't touch model instances.
+    They are written back to model only on <write_back>. Learnt abilities are written on save of the game
+    (see write_abilities)
+    """
+    __slots__ = ('name', 'health', 'damage', 'attack_range', 'move_range', 'armor', 'img_path', 'spell_names',
+                 'actions', 'moves', 'attack_hexes', 'moves_origin', 'moves_area', 'enemy_target',
+                 'unsaved_abilities')
+
     def __init__(self, object_model: BaseUnitModel, **kwargs):
         super().__init__(object_model, **kwargs)
-        self.moves: list = []
-        self.attack_hexes: list = []
-        self.enemy_target: str = slotHero
-        self.actions = [
+        self.name: str = object_model.name
+        self.health: int = object_model.health
+        self.damage: int = object_model.damage
+        self.attack_range: int = object_model.attack_range
+        self.move_range: int = object_model.move_range
+        self.armor: int = object_model.armor
+        self.img_path: str = object_model.img_path
+        self.spell_names: List[str] = [spell.code_name for spell in object_model.spells.all()]
+        self.actions: List[str] = [
             'move',
             'attack',
-            *[spell.code_name for spell in self._object.spells.all()],
+            *self.spell_names,
         ]
-        self.ability_map = {
-            'spell': self._object.spells,
-            'skill': self._object.skills,
-            'item': self._object.items
-        }
+
+        self.moves: list = []
+        self.attack_hexes: list = []
+        # (position index, move range, attack range), which <moves> and <attack_hexes> were found for,
+        # and bitset of hexes, which changes can affect them
+        self.moves_origin: Optional[tuple] = None
+        self.moves_area: int = 0
+        self.enemy_target: str = slotHero
         self.unsaved_abilities = {
             'spell': [],
             'skill': [],
@@ -47,28 +71,12 @@ class BaseUnitObject(InteractiveGameObject):
         }
 
     @property
-    def name(self):
-        return self._object.name
-
-    @property
-    def health(self):
-        return self._object.health
-
-    @property
-    def damage(self):
-        return self._object.damage
-
-    @property
-    def attack_range(self):
-        return self._object.attack_range
-
-    @property
-    def move_range(self):
-        return self._object.move_range
-
-    @property
-    def armor(self):
-        return self._object.armor
+    def ability_map(self):
+        return {
+            'spell': self._object.spells,
+            'skill': self._object.skills,
+            'item': self._object.items
+        }
 
     @property
     def skills(self):
@@ -78,66 +86,123 @@ class BaseUnitObject(InteractiveGameObject):
     def spells(self):
         return self._object.spells
 
-    @property
-    def img_path(self):
-        return self._object.img_path
-
     def has_spell(self, spell_code_name):
-        return bool(self.spells.filter(code_name=spell_code_name))
-
-    def choose_action(self, available_actions: 'Dict[str, List[Hex]]'):
-        action_name, target_hex = self._get_best_action(available_actions)
-        action_request = {'action': action_name, 'source': self, 'target_hex': target_hex}
-        print(f'unit {self._object.name} chooses action {action_request}')
-        return action_request
-
-    def _get_best_action(self, available_actions: 'Dict[str, List[Hex]]') -> Tuple[str, str]:
-        best_action: str = list(available_actions.keys())[0]
-        best_target: Hex = available_actions[best_action][0]
-        for action, action_targets in available_actions.items():
-            for target in action_targets:
-                if str(target.slot) == self.enemy_target:
-                    best_action, best_target = action, target
-        return best_action, best_target.id
+        return spell_code_name in self.spell_names
+
+    def runtime_state(self) -> dict:
+        """Values of unit, that differ from it's model during the game"""
+        return {
+            'health': self.health,
+            'position': self.position.id if self.position else None,
+            'moves': self.moves,
+            'attack_hexes': self.attack_hexes,
+        }
+
+    def write_back(self):
+        """Write runtime stats back to unit model"""
+        self._object.health = self.health
 
     def add_ability(self, ability_type: str, ability: AbilityModel):
-        self.ability_map[ability_type].add(ability)
         self.unsaved_abilities[ability_type].append(ability)
+        if ability_type == 'spell':
+            self.spell_names.append(ability.code_name)
+            self.actions.append(ability.code_name)
 
     def remove_unsaved_abilities(self):
         for ability_type in self.unsaved_abilities:
-            if self.unsaved_abilities[ability_type]:
-                [self._object.spells.remove(ability) for ability in self.unsaved_abilities[ability_type]]
+            for ability in self.unsaved_abilities[ability_type]:
+                if ability_type == 'spell':
+                    self.spell_names.remove(ability.code_name)
+                    self.actions.remove(ability.code_name)
+            self.unsaved_abilities[ability_type].clear()
 
-    def keep_unsaved_abilities(self):
+    def keep_unsaved_abilities(self) -> bool:
+        """Keep abilities, learnt in current round. Returns whether there were any"""
+        kept = any(self.unsaved_abilities.values())
         for ability_type in self.unsaved_abilities:
             self.unsaved_abilities[ability_type].clear()
+        return kept
 
     def receive_damage(self, damage):
-        self._object.health -= damage
+        self.health -= damage
 
     def set_health(self, health):
-        self._object.health = health
+        self.health = health
 
 
 class Hero(BaseUnitObject):
+    """Hero keeps ids of his skills and items too, so he can be serialized from handbook without queries"""
+    __slots__ = ('skill_ids', 'item_ids', 'weapon_id', 'suit_id')
 
     def __init__(self, object_model: HeroModel, **kwargs):
         super().__init__(object_model, **kwargs)
         self.enemy_target: str = slotUnit
+        self.skill_ids: List[int] = [skill.pk for skill in object_model.skills.all()]
+        self.item_ids: List[int] = [item.pk for item in object_model.items.all()]
+        self.weapon_id: Optional[int] = object_model.weapon_id
+        self.suit_id: Optional[int] = object_model.suit_id
+
+    def add_ability(self, ability_type: str, ability: AbilityModel):
+        super().add_ability(ability_type, ability)
+        if ability_type == 'skill':
+            self.skill_ids.append(ability.pk)
+        elif ability_type == 'item':
+            self.item_ids.append(ability.pk)
+
+    def remove_unsaved_abilities(self):
+        for skill in self.unsaved_abilities['skill']:
+            self.skill_ids.remove(skill.pk)
+        for item in self.unsaved_abilities['item']:
+            self.item_ids.remove(item.pk)
+        super().remove_unsaved_abilities()
+
+    def has_ability(self, ability_type: str, ability: AbilityModel) -> bool:
+        if ability_type == 'spell':
+            return ability.code_name in self.spell_names
+        return ability.pk in (self.skill_ids if ability_type == 'skill' else self.item_ids)
+
+    def abilities_state(self) -> dict:
+        """Abilities of hero, which can be learnt during the game"""
+        return {'spells': list(self.spell_names), 'skills': list(self.skill_ids), 'items': list(self.item_ids)}
+
+    def restore_abilities(self, abilities: Dict[str, List[AbilityModel]],
+                          unsaved_abilities: Dict[str, List[AbilityModel]]):
+        """
+        Set abilities of hero, restored from game state. Hero model is not changed, as abilities are written to it
+        on save of the game
+        """
+        self.spell_names = [spell.code_name for spell in abilities['spell']]
+        self.actions = ['move', 'attack', *self.spell_names]
+        self.skill_ids = [skill.pk for skill in abilities['skill']]
+        self.item_ids = [item.pk for item in abilities['item']]
+        self.unsaved_abilities = {ability_type: list(unsaved_abilities[ability_type])
+                                  for ability_type in self.unsaved_abilities}
 
     def __str__(self):
         return slotHero
 
 
 class Unit(BaseUnitObject):
+    """
+    Unit in game. Many units can be created from the same unit model, which is used as a template only,
+    so unit's own pk is passed separately
+    """
+    __slots__ = ('pk', 'level')
+
+    def __init__(self, object_model: UnitModel, pk: int = None, **kwargs):
+        super().__init__(object_model, **kwargs)
+        self.pk: int = object_model.pk if pk is None else pk
+        self.level: int = object_model.level
+
     def __str__(self):
         return slotUnit
 
-    @property
-    def pk(self):
-        return self._object.pk
+    def runtime_state(self) -> dict:
+        return {'pk': self.pk, **super().runtime_state()}
 
-    @property
-    def level(self):
-        return self._object.level
+
+def write_abilities(hero_model: HeroModel, abilities: Dict[str, List[int]]):
+    """Set abilities of hero model to ones with given pks by ability type"""
+    hero_model.spells.set(abilities['spell'])
+    hero_model.skills.set(abilities['skill'])
+    hero_model.items.set(abilities['item'])
@@ -1,8 +1,10 @@
-from random import shuffle
+import random
+from random import Random
 from typing import TYPE_CHECKING, Dict, List
 from game.mechanics.constants import slotStructure
 from game.mechanics.game_objects import InteractiveGameObject
-from game.models import GameStructureModel, SpellModel, SkillModel
+from game.mechanics.handbook import Handbook
+from game.models import GameStructureModel, AbilityModel
 
 if TYPE_CHECKING:
     from game.mechanics.game_instance import GameInstance
@@ -11,17 +13,28 @@ if TYPE_CHECKING:
 class BaseStructure(InteractiveGameObject):
     """Base structure class"""
     structure_name: str
+    items_attributes = ['code_name', 'name', 'cost', 'description', 'img_path']
 
     def __init__(self, object_model):
         super().__init__(object_model)
         self.position = ''
+        # structure model is shared between games, so assortment is kept in structure itself
+        self.assortment = []
 
     def __str__(self):
         return slotStructure
 
-    @property
-    def assortment(self):
-        return self._object.assortment
+    def dump_assortment(self) -> List[dict]:
+        """Types and pks of abilities in assortment, enough to restore it with <restore_assortment>"""
+        return [{'type': entry['type'], 'pk': entry['pk']} for entry in self.assortment]
+
+    def restore_assortment(self, assortment: List[dict]):
+        handbook = Handbook.instance()
+        self.assortment = [self._stock_entry(entry['type'], handbook.get_ability_by_pk(entry['type'], entry['pk']))
+                           for entry in assortment]
+
+    def _stock_entry(self, ability_type: str, ability: AbilityModel) -> dict:
+        return {'type': ability_type, 'pk': ability.pk, **{key: getattr(ability, key) for key in self.items_attributes}}
 
 
 class Exit(BaseStructure):
@@ -31,22 +44,13 @@ class Exit(BaseStructure):
 
 class Sanctuary(BaseStructure):
     """Structure where spells and skills can be learnt"""
-    def generate_assortment(self):
-        """Generates assortment of skills and spells"""
-        items_attributes = ['code_name', 'name', 'cost', 'description', 'img_path']
-        stock = []
-        for _spell in SpellModel.objects.all():
-            stock.append({
-                'type': 'spell',
-                **{key: getattr(_spell, key) for key in items_attributes}
-            })
-        for _skill in SkillModel.objects.all():
-            stock.append({
-                'type': 'skill',
-                **{key: getattr(_skill, key) for key in items_attributes}
-            })
-        shuffle(stock)
-        self._object.assortment = stock[:self._object.assortment_range]
+    def generate_assortment(self, rng: Random = None):
+        """Generates assortment of skills and spells. Global random generator is used, if <rng> is not passed"""
+        handbook = Handbook.instance()
+        stock = [self._stock_entry('spell', _spell) for _spell in handbook.spells]
+        stock += [self._stock_entry('skill', _skill) for _skill in handbook.skills]
+        (rng or random).shuffle(stock)
+        self.assortment = stock[:self._object.assortment_range]
 
 
 class StructuresManager:
@@ -57,7 +61,7 @@ class StructuresManager:
 
     @classmethod
     def place_structures(cls, game: 'GameInstance', available_hexes: List[str], exit_position: str):
-        for structure_model in GameStructureModel.objects.all():
+        for structure_model in Handbook.instance().structures:
             if game.round % structure_model.round_frequency == 0:
                 position = exit_position if structure_model.code_name == 'exit' else available_hexes.pop()
                 structure = cls.build(game, structure_model, position)
@@ -0,0 +1,224 @@
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# distance to indexes, which are not hexes of the board
+NO_HEX = 255
+
+# small shift of rays start, so they never pass exactly through the corner between hexes
+RAY_NUDGE = (1e-6, 2e-6)
+
+# axial offsets of neighbors of a hex
+NEIGHBOR_OFFSETS = ((1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1))
+
+
+def round_axial(q: float, r: float) -> Tuple[int, int]:
+    """Axial coordinates of hex, containing point with given fractional axial coordinates"""
+    s = -q - r
+    rounded_q, rounded_r, rounded_s = round(q), round(r), round(s)
+    q_diff, r_diff, s_diff = abs(rounded_q - q), abs(rounded_r - r), abs(rounded_s - s)
+    if q_diff > r_diff and q_diff > s_diff:
+        rounded_q = -rounded_r - rounded_s
+    elif r_diff > s_diff:
+        rounded_r = -rounded_q - rounded_s
+    return rounded_q, rounded_r
+
+
+class HexGeometry:
+    """
+    Precomputed geometry of hexagonal board of given radius
+
+    Hexes are addressed by the same indexes, as in Board storage. Distances from a hex to all other hexes
+    are kept in a row of bytes, built once on first use, so distance of a pair of hexes is a single lookup.
+    Disks, rings, lines and rays between hexes are kept as tuples of indexes and as bitsets, which can be
+    intersected with occupancy bitsets of Board.
+    Geometry doesn't depend on the content of the board, so single instance per radius is shared by all boards
+    (see <get_geometry>). Lazily filled tables only get new immutable values, so sharing is safe between threads.
+    """
+    def __init__(self, radius: int):
+        if radius > NO_HEX // 2:
+            raise ValueError(f'Board radius {radius} is too big')
+        self.radius = radius
+        self.offset = radius - 1
+        self.width = max(2 * radius - 1, 0)
+        self.size = self.width ** 2
+        # axial coordinates of every index. None for indexes out of board
+        self.coordinates: List[Optional[Tuple[int, int]]] = [None] * self.size
+        for q in range(-self.offset, self.offset + 1):
+            for r in range(max(-self.offset, -q - self.offset), min(self.offset, -q + self.offset) + 1):
+                self.coordinates[self.index_of(q, r)] = (q, r)
+        self.indexes: Tuple[int, ...] = tuple(index for index, coordinates in enumerate(self.coordinates)
+                                              if coordinates is not None)
+        # hex ids, bitset of all hexes and indexes of neighbors of every hex
+        self.ids: List[Optional[str]] = [None] * self.size
+        self.index_by_id: Dict[str, int] = {}
+        self.mask = 0
+        self.neighbors: List[Tuple[int, ...]] = [()] * self.size
+        for index in self.indexes:
+            q, r = self.coordinates[index]
+            self.ids[index] = f'{q};{r}'
+            self.index_by_id[self.ids[index]] = index
+            self.mask |= 1 << index
+            neighbors = (self.index_of(q + dq, r + dr) for dq, dr in NEIGHBOR_OFFSETS)
+            self.neighbors[index] = tuple(neighbor for neighbor in neighbors if neighbor >= 0)
+
+        self._distance_rows: List[Optional[bytes]] = [None] * self.size
+        # keys are (origin index, range)
+        self._disks: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        self._disk_masks: Dict[Tuple[int, int], int] = {}
+        self._rings: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        # keys are (start index, q step, r step, length)
+        self._lines: Dict[Tuple[int, int, int, int], Tuple[int, ...]] = {}
+        # keys are (source index, target index)
+        self._rays: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        self._between_masks: Dict[Tuple[int, int], int] = {}
+
+    def index_of(self, q: int, r: int) -> int:
+        """Index of hex with given axial coordinates. Returns -1 if hex is out of board"""
+        if max(abs(q), abs(r), abs(q + r)) > self.offset:
+            return -1
+        return (q + self.offset) * self.width + r + self.offset
+
+    # region distances
+    def get_distance_row(self, source: int) -> bytes:
+        """Distances from <source> to every index. NO_HEX for indexes out of board"""
+        row = self._distance_rows[source]
+        if row is None:
+            source_q, source_r = self.coordinates[source]
+            distances = bytearray([NO_HEX]) * self.size
+            for index in self.indexes:
+                q, r = self.coordinates[index]
+                distances[index] = max(abs(q - source_q), abs(r - source_r), abs(q + r - source_q - source_r))
+            row = self._distance_rows[source] = bytes(distances)
+        return row
+
+    def distance(self, index_a: int, index_b: int) -> int:
+        """Distance between two hexes"""
+        return self.get_distance_row(index_a)[index_b]
+
+    def distances_from(self, source: int, targets: Iterable[int]) -> List[int]:
+        """Distances from <source> to each of <targets>"""
+        row = self.get_distance_row(source)
+        return [row[target] for target in targets]
+
+    def pairwise_distances(self, indexes: Sequence[int]) -> List[List[int]]:
+        """Matrix of distances between every pair of <indexes>"""
+        return [self.distances_from(source, indexes) for source in indexes]
+    # endregion distances
+
+    # region areas
+    def get_disk(self, source: int, _range: int) -> Tuple[int, ...]:
+        """Indexes of hexes in <_range> away from <source>, including <source> itself"""
+        key = (source, _range)
+        disk = self._disks.get(key)
+        if disk is None:
+            row = self.get_distance_row(source)
+            disk = self._disks[key] = tuple(index for index in self._iter_area(source, _range)
+                                            if row[index] <= _range)
+        return disk
+
+    def get_disk_mask(self, source: int, _range: int) -> int:
+        """Bitset of hexes in <_range> away from <source>, including <source> itself"""
+        key = (source, _range)
+        mask = self._disk_masks.get(key)
+        if mask is None:
+            mask = 0
+            for index in self.get_disk(source, _range):
+                mask |= 1 << index
+            self._disk_masks[key] = mask
+        return mask
+
+    def get_ring(self, source: int, _range: int) -> Tuple[int, ...]:
+        """Indexes of hexes exactly <_range> away from <source>"""
+        key = (source, _range)
+        ring = self._rings.get(key)
+        if ring is None:
+            row = self.get_distance_row(source)
+            ring = self._rings[key] = tuple(index for index in self.get_disk(source, _range)
+                                            if row[index] == _range)
+        return ring
+
+    def get_ring_mask(self, source: int, _range: int) -> int:
+        """Bitset of hexes exactly <_range> away from <source>"""
+        mask = self.get_disk_mask(source, _range)
+        if _range > 0:
+            mask &= ~self.get_disk_mask(source, _range - 1)
+        return mask
+
+    def get_line(self, start: int, dq: int, dr: int, length: int) -> Tuple[int, ...]:
+        """
+        Indexes of up to <length> hexes, starting from <start> and stepping by (<dq>, <dr>).
+        Line is cut by the edge of the board
+        """
+        key = (start, dq, dr, length)
+        line = self._lines.get(key)
+        if line is None:
+            q, r = self.coordinates[start]
+            indexes = []
+            for i in range(length):
+                index = self.index_of(q + dq * i, r + dr * i)
+                if index < 0:
+                    break
+                indexes.append(index)
+            line = self._lines[key] = tuple(indexes)
+        return line
+
+    def get_line_mask(self, start: int, dq: int, dr: int, length: int) -> int:
+        """Bitset of hexes of <get_line>"""
+        mask = 0
+        for index in self.get_line(start, dq, dr, length):
+            mask |= 1 << index
+        return mask
+
+    def get_ray(self, source: int, target: int) -> Tuple[int, ...]:
+        """
+        Indexes of hexes on the straight line from <source> to <target>, including both of them.
+        Line, passing exactly between two hexes, is nudged to the same side for all rays
+        """
+        key = (source, target)
+        ray = self._rays.get(key)
+        if ray is None:
+            source_q, source_r = self.coordinates[source]
+            target_q, target_r = self.coordinates[target]
+            steps = self.distance(source, target)
+            ray = [source]
+            for i in range(1, steps + 1):
+                q, r = round_axial(source_q + RAY_NUDGE[0] + (target_q - source_q) * i / steps,
+                                   source_r + RAY_NUDGE[1] + (target_r - source_r) * i / steps)
+                ray.append(self.index_of(q, r))
+            ray = self._rays[key] = tuple(ray)
+        return ray
+
+    def get_between_mask(self, source: int, target: int) -> int:
+        """Bitset of hexes on the ray from <source> to <target>, excluding both of them"""
+        key = (source, target)
+        mask = self._between_masks.get(key)
+        if mask is None:
+            mask = 0
+            for index in self.get_ray(source, target)[1:-1]:
+                mask |= 1 << index
+            self._between_masks[key] = mask
+        return mask
+
+    def _iter_area(self, source: int, _range: int) -> Iterable[int]:
+        """Indexes of board in the square of axial coordinates around <source>, ordered as disk offsets"""
+        source_q, source_r = self.coordinates[source]
+        for q in range(max(source_q - _range, -self.offset), min(source_q + _range, self.offset) + 1):
+            for r in range(max(source_r - _range, -self.offset), min(source_r + _range, self.offset) + 1):
+                if self.coordinates[(q + self.offset) * self.width + r + self.offset] is not None:
+                    yield (q + self.offset) * self.width + r + self.offset
+    # endregion areas
+
+
+_geometries: Dict[int, HexGeometry] = {}
+_geometries_lock = Lock()
+
+
+def get_geometry(radius: int) -> HexGeometry:
+    """Geometry of board of given radius, shared by all boards of that radius"""
+    geometry = _geometries.get(radius)
+    if geometry is None:
+        with _geometries_lock:
+            geometry = _geometries.get(radius)
+            if geometry is None:
+                geometry = _geometries[radius] = HexGeometry(radius)
+    return geometry
@@ -0,0 +1,269 @@
+from collections import defaultdict
+from threading import RLock
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core import serializers
+from django.db import models
+from django.db.models import F
+
+from game.models import UnitModel, SpellModel, SkillModel, ItemModel, GameStructureModel, AbilityModel, \
+    EffectModel, SpellEffectModel, ItemEffectModel, SkillEffectModel, HandbookVersionModel
+
+
+def set_prefetched(instance: models.Model, relation: str, objects: Iterable[models.Model]):
+    """
+    Attach <objects> to many-to-many or reverse foreign key <relation> of <instance>, as if they were prefetched.
+    Then relation can be read without queries, even if instance is not saved
+    """
+    queryset = getattr(instance, relation).model._default_manager.all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[relation] = queryset
+
+
+def get_shared_version() -> int:
+    """Version of handbook models, shared by worker processes"""
+    return HandbookVersionModel.objects.order_by('pk').values_list('version', flat=True).first() or 0
+
+
+def increment_shared_version():
+    """Increase shared version of handbook models, so other processes reload them"""
+    if not HandbookVersionModel.objects.update(version=F('version') + 1):
+        HandbookVersionModel.objects.create(version=1)
+
+
+def read_fixture(fixture_path: str) -> Dict[type, Dict[int, serializers.base.DeserializedObject]]:
+    """Deserialize objects of json fixture without saving them. Returns map of model to objects by their pk"""
+    objects = defaultdict(dict)
+    with open(fixture_path) as fixture:
+        for deserialized in serializers.deserialize('json', fixture, ignorenonexistent=True):
+            objects[type(deserialized.object)][deserialized.object.pk] = deserialized
+    return objects
+
+
+class Handbook:
+    """
+    Singleton process-wide cache of handbook models: unit templates, spells with their effects, skills, items
+    and game structures.
+    Loaded on first access and reloaded on next access after <invalidate>, which is called on any change
+    of handbook models (see game.signals). Every reload increments <version>, which can be used as a key
+    of caches, derived from handbook.
+    Changes increase shared version in db too. Other processes compare it with version of their handbook with
+    <check_shared_version> every CHECK_INTERVAL of GAME_HANDBOOK setting, so they don't query db on every access.
+    Cached model instances are shared between all games and must be used as read-only templates.
+    """
+    __instance = None
+
+    @staticmethod
+    def instance():
+        """Static access method"""
+        if Handbook.__instance is None:
+            Handbook()
+        return Handbook.__instance
+
+    def __init__(self):
+        if Handbook.__instance is not None:
+            raise Exception("This class is a singleton!")
+        else:
+            Handbook.__instance = self
+        self._version = 0
+        self._lock = RLock()
+        self._loaded = False
+        options = getattr(settings, 'GAME_HANDBOOK', {})
+        self.check_interval: float = options.get('CHECK_INTERVAL', 5)
+        # shared version of loaded models, None if they are not loaded from db
+        self._shared_version: Optional[int] = None
+        self._checked = 0.0
+
+        self._units_by_level: Dict[int, UnitModel] = {}
+        self._spells: Dict[str, SpellModel] = {}
+        self._spell_effects: Dict[str, Dict[str, float]] = {}
+        self._skills: Dict[str, SkillModel] = {}
+        self._items: Dict[str, ItemModel] = {}
+        self._items_by_name: Dict[str, ItemModel] = {}
+        self._abilities_by_pk: Dict[str, Dict[int, AbilityModel]] = {'spell': {}, 'skill': {}, 'item': {}}
+        self._structures: Dict[str, GameStructureModel] = {}
+
+    def load(self):
+        """Load all handbook models from db"""
+        with self._lock:
+            # version is read before models, so changes made while they are loaded are not missed
+            shared_version = get_shared_version()
+            self._set_models(
+                units=UnitModel.objects.prefetch_related('spells').order_by('pk'),
+                spells=SpellModel.objects.prefetch_related('spelleffectmodel_set__effect').order_by('pk'),
+                items=ItemModel.objects.prefetch_related('itemeffectmodel_set__effect').order_by('pk'),
+                skills=SkillModel.objects.prefetch_related('skilleffectmodel_set__effect').order_by('pk'),
+                structures=GameStructureModel.objects.order_by('pk'),
+            )
+            self._shared_version = shared_version
+            self._checked = monotonic()
+
+    def load_fixture(self, fixture_path: str):
+        """
+        Load handbook models from json fixture instead of db. Used to run games without db (see simulation).
+        Relations of models are attached as prefetched, so they are read without queries too
+        """
+        objects = read_fixture(fixture_path)
+        effects = {pk: deserialized.object for pk, deserialized in objects[EffectModel].items()}
+        abilities = {}
+        for model, effect_model, relation, ability_field in [
+                (SpellModel, SpellEffectModel, 'spelleffectmodel_set', 'spell_id'),
+                (ItemModel, ItemEffectModel, 'itemeffectmodel_set', 'item_id'),
+                (SkillModel, SkillEffectModel, 'skilleffectmodel_set', 'skill_id')]:
+            abilities[model] = {pk: deserialized.object for pk, deserialized in sorted(objects[model].items())}
+            ability_effects = defaultdict(list)
+            for deserialized in objects[effect_model].values():
+                ability_effect = deserialized.object
+                ability_effect.effect = effects[ability_effect.effect_id]
+                ability_effects[getattr(ability_effect, ability_field)].append(ability_effect)
+            for pk, ability in abilities[model].items():
+                set_prefetched(ability, relation, ability_effects[pk])
+        units = []
+        for pk, deserialized in sorted(objects[UnitModel].items()):
+            for relation, model in [('spells', SpellModel), ('skills', SkillModel), ('items', ItemModel)]:
+                set_prefetched(deserialized.object, relation,
+                               [abilities[model][ability_pk] for ability_pk in deserialized.m2m_data.get(relation, [])])
+            units.append(deserialized.object)
+        with self._lock:
+            self._set_models(
+                units=units,
+                spells=abilities[SpellModel].values(),
+                items=abilities[ItemModel].values(),
+                skills=abilities[SkillModel].values(),
+                structures=[deserialized.object for pk, deserialized in sorted(objects[GameStructureModel].items())],
+            )
+            self._shared_version = None
+
+    def _set_models(self, units: Iterable[UnitModel], spells: Iterable[SpellModel], items: Iterable[ItemModel],
+                    skills: Iterable[SkillModel], structures: Iterable[GameStructureModel]):
+        """Fill cache with given models, ordered by pk"""
+        with self._lock:
+            units_by_level = {}
+            # first unit of the level is used as its template
+            for unit in reversed(list(units)):
+                units_by_level[unit.level] = unit
+            spells = {spell.code_name: spell for spell in spells}
+            spell_effects = {code_name: {item.effect.code_name: item.value for item in spell.spelleffectmodel_set.all()}
+                             for code_name, spell in spells.items()}
+            items = list(items)
+            skills = list(skills)
+
+            self._units_by_level = units_by_level
+            self._spells = spells
+            self._spell_effects = spell_effects
+            self._skills = {skill.code_name: skill for skill in skills if skill.code_name}
+            self._items = {item.code_name: item for item in items if item.code_name}
+            self._items_by_name = {item.name: item for item in items}
+            self._abilities_by_pk = {
+                'spell': {spell.pk: spell for spell in spells.values()},
+                'skill': {skill.pk: skill for skill in skills},
+                'item': {item.pk: item for item in items},
+            }
+            self._structures = {structure.code_name: structure for structure in structures}
+            self._loaded = True
+            self._version += 1
+
+    def invalidate(self):
+        """Mark cache as outdated. It will be reloaded on next access"""
+        with self._lock:
+            self._loaded = False
+
+    def notify_changed(self):
+        """Invalidate cache of this process and, with shared version, caches of other processes"""
+        increment_shared_version()
+        self.invalidate()
+
+    @property
+    def check_due(self) -> bool:
+        """Whether it's time to <check_shared_version>"""
+        return self._shared_version is not None and monotonic() - self._checked >= self.check_interval
+
+    def check_shared_version(self):
+        """Invalidate cache, if handbook models were changed by another process since they were loaded"""
+        shared_version = get_shared_version()
+        with self._lock:
+            self._checked = monotonic()
+            if self._shared_version is not None and shared_version != self._shared_version:
+                self._loaded = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    @property
+    def version(self) -> int:
+        """Version of loaded handbook"""
+        self._ensure_loaded()
+        return self._version
+
+    def get_unit_template(self, level: int) -> UnitModel:
+        """Unit model of given level"""
+        self._ensure_loaded()
+        if level not in self._units_by_level:
+            raise UnitModel.DoesNotExist(f'No unit of level {level}')
+        return self._units_by_level[level]
+
+    def get_spell_effects(self, code_name: str) -> Dict[str, float]:
+        """Map of effects code names to their values for given spell"""
+        self._ensure_loaded()
+        if code_name not in self._spell_effects:
+            raise SpellModel.DoesNotExist(f'No spell {code_name}')
+        return self._spell_effects[code_name]
+
+    def get_ability(self, ability_type: str, code_name: str) -> AbilityModel:
+        """Spell/skill/item by it's code name"""
+        self._ensure_loaded()
+        abilities_map = {
+            'spell': (self._spells, SpellModel),
+            'skill': (self._skills, SkillModel),
+            'item': (self._items, ItemModel),
+        }
+        abilities, model = abilities_map[ability_type]
+        if code_name not in abilities:
+            raise model.DoesNotExist(f'No {ability_type} {code_name}')
+        return abilities[code_name]
+
+    def get_ability_by_pk(self, ability_type: str, pk: int) -> AbilityModel:
+        """Spell/skill/item by it's pk"""
+        self._ensure_loaded()
+        abilities = self._abilities_by_pk[ability_type]
+        if pk not in abilities:
+            raise {'spell': SpellModel, 'skill': SkillModel, 'item': ItemModel}[ability_type].DoesNotExist(
+                f'No {ability_type} {pk}')
+        return abilities[pk]
+
+    def get_item_by_name(self, name: str) -> ItemModel:
+        """Item by it's name"""
+        self._ensure_loaded()
+        if name not in self._items_by_name:
+            raise ItemModel.DoesNotExist(f'No item {name}')
+        return self._items_by_name[name]
+
+    def get_structure(self, code_name: str) -> GameStructureModel:
+        """Game structure by it's code name"""
+        self._ensure_loaded()
+        if code_name not in self._structures:
+            raise GameStructureModel.DoesNotExist(f'No structure {code_name}')
+        return self._structures[code_name]
+
+    @property
+    def spells(self) -> List[SpellModel]:
+        self._ensure_loaded()
+        return list(self._spells.values())
+
+    @property
+    def skills(self) -> List[SkillModel]:
+        self._ensure_loaded()
+        return list(self._skills.values())
+
+    @property
+    def structures(self) -> List[GameStructureModel]:
+        self._ensure_loaded()
+        return list(self._structures.values())
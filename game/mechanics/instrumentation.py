@@ -0,0 +1,215 @@
+import bisect
+import json
+import random
+from contextlib import contextmanager
+from threading import Lock, local
+from time import monotonic, perf_counter
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+# upper bounds of histogram buckets, in milliseconds. Last bucket is unbounded
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+BUCKET_LABELS = [f'<={bound}' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}']
+
+
+class _NullContext:
+    """Context manager, which does nothing. Returned for phases of requests, which are not sampled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class Histogram:
+    """Distribution of phase durations with total number of db queries"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.queries = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds: float, queries: int):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.queries += queries
+        self.buckets[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket, containing <p> percentile, in milliseconds"""
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'queries_per_call': self.queries / self.count if self.count else 0.0,
+            'buckets': {label: count for label, count in zip(BUCKET_LABELS, self.buckets) if count},
+        }
+
+
+class Trace:
+    """
+    Timings of phases of single sampled request.
+    Phases can be nested, db queries are counted for every phase they are made in
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.started = perf_counter()
+        self.queries = 0
+        # (phase name, seconds, queries)
+        self.phases: List[tuple] = []
+        # [phase name, start time, queries] of phases in progress
+        self._stack: List[list] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        frame = [name, perf_counter(), 0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.phases.append((name, perf_counter() - frame[1], frame[2]))
+
+    def __call__(self, execute, sql, params, many, context):
+        """Db execute wrapper, which counts queries"""
+        self.queries += 1
+        for frame in self._stack:
+            frame[2] += 1
+        return execute(sql, params, many, context)
+
+
+class Instrumentation(object):
+    """
+    Singleton class to measure duration and db queries of request phases
+
+    Request is wrapped into <trace>, and its parts into <phase>. Only part of requests is sampled, as set by
+    SAMPLE_RATE of GAME_INSTRUMENTATION setting. Phases of requests, which are not sampled, and phases outside
+    of any request cost a single attribute lookup. Durations are aggregated into histograms, which are
+    available with <get_stats> and printed every LOG_INTERVAL seconds, if it's set.
+    """
+    __instance = None
+
+    @staticmethod
+    def instance():
+        """Static access method"""
+        if Instrumentation.__instance is None:
+            Instrumentation()
+        return Instrumentation.__instance
+
+    def __init__(self):
+        if Instrumentation.__instance is not None:
+            raise Exception("This class is a singleton!")
+        else:
+            Instrumentation.__instance = self
+        options = getattr(settings, 'GAME_INSTRUMENTATION', {})
+        self.sample_rate: float = options.get('SAMPLE_RATE', 0.01)
+        self.count_queries: bool = options.get('COUNT_QUERIES', True)
+        self.log_interval: float = options.get('LOG_INTERVAL', 0)
+
+        self._local = local()
+        self._lock = Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self.stats = {'traces': 0, 'sampled': 0}
+        self._last_log = monotonic()
+
+    @contextmanager
+    def trace(self, name: str):
+        """Trace request with given name, if it's sampled. Nested traces are parts of the outer one"""
+        if getattr(self._local, 'trace', None) is not None:
+            yield
+            return
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        with self._lock:
+            self.stats['traces'] += 1
+        if not sampled:
+            yield
+            return
+        current = self._local.trace = Trace(name)
+        try:
+            if self.count_queries:
+                with connection.execute_wrapper(current):
+                    yield
+            else:
+                yield
+        finally:
+            self._local.trace = None
+            self._record(current, perf_counter() - current.started)
+
+    def phase(self, name: str):
+        """Context manager to measure phase of traced request"""
+        current: Optional[Trace] = getattr(self._local, 'trace', None)
+        if current is None:
+            return NULL_CONTEXT
+        return current.phase(name)
+
+    def bind(self, func: Callable) -> Callable:
+        """Wrap <func>, so phases of current trace are measured, when it's called in another thread"""
+        current: Optional[Trace] = getattr(self._local, 'trace', None)
+        if current is None:
+            return func
+
+        def bound(*args, **kwargs):
+            self._local.trace = current
+            try:
+                if self.count_queries:
+                    with connection.execute_wrapper(current):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                self._local.trace = None
+        return bound
+
+    def get_stats(self) -> dict:
+        """Histograms of requests and phases"""
+        with self._lock:
+            return {**self.stats, 'sample_rate': self.sample_rate,
+                    'histograms': {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())}}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.stats = {'traces': 0, 'sampled': 0}
+
+    def _record(self, trace: Trace, seconds: float):
+        with self._lock:
+            self.stats['sampled'] += 1
+            self._histogram(trace.name).add(seconds, trace.queries)
+            for name, phase_seconds, queries in trace.phases:
+                self._histogram(f'{trace.name}.{name}').add(phase_seconds, queries)
+            log = self.log_interval and monotonic() - self._last_log >= self.log_interval
+            if log:
+                self._last_log = monotonic()
+        if log:
+            print('instrumentation', json.dumps(self.get_stats()))
+
+    def _histogram(self, name: str) -> Histogram:
+        """Histogram with given name. Called under lock"""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        return histogram
+
+
+def phase(name: str):
+    """Shortcut for <Instrumentation.phase>"""
+    return Instrumentation.instance().phase(name)
@@ -0,0 +1,109 @@
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from game.mechanics.board import Board, Hex
+from game.mechanics.constants import slotObstacle, slotStructure
+
+# distance of hexes, from which target can't be reached
+UNREACHABLE = -1
+
+# slots, which can't be passed through. Units are not listed, because they move every turn
+DEFAULT_BLOCKING_SLOTS = (slotObstacle, slotStructure)
+
+
+class Pathfinder:
+    """
+    Distance fields and paths on the board
+
+    Distance field is a list of path lengths from every hex of the board to target hex, indexed by hex index.
+    Fields are built by BFS and cached by target and bitset of blocked hexes, so they are recomputed only
+    when target moves or blocking hexes change. Having the field, distance of any hex to the target is
+    a list lookup, which keeps units AI cost flat with number of units.
+    """
+    def __init__(self, board: Board, cache_size: int = 16):
+        self._board = board
+        self.cache_size = cache_size
+        self._fields: 'OrderedDict[Tuple[int, int], List[int]]' = OrderedDict()
+
+    def get_distance_field(self, target: Hex, blocking_slots: Sequence[str] = DEFAULT_BLOCKING_SLOTS) -> List[int]:
+        """
+        Path lengths from every hex to <target>, walking around hexes with <blocking_slots>.
+        Target itself is never blocked. Returned list is shared, so it must not be changed
+        """
+        blocked_mask = self._board.get_slots_mask(blocking_slots) & ~(1 << target.index)
+        key = (target.index, blocked_mask)
+        field = self._fields.get(key)
+        if field is not None:
+            self._fields.move_to_end(key)
+            return field
+
+        field = [UNREACHABLE] * self._board.storage_size
+        field[target.index] = 0
+        queue = deque([target.index])
+        while queue:
+            index = queue.popleft()
+            distance = field[index] + 1
+            for neighbor in self._board.get_neighbor_indexes(index):
+                if field[neighbor] == UNREACHABLE and not blocked_mask >> neighbor & 1:
+                    field[neighbor] = distance
+                    queue.append(neighbor)
+
+        self._fields[key] = field
+        if len(self._fields) > self.cache_size:
+            self._fields.popitem(last=False)
+        return field
+
+    def get_path_length(self, source: Hex, target: Hex,
+                        blocking_slots: Sequence[str] = DEFAULT_BLOCKING_SLOTS) -> int:
+        """Length of shortest path between hexes. UNREACHABLE if there is no path"""
+        return self.get_distance_field(target, blocking_slots)[source.index]
+
+    def get_best_step(self, source: Hex, target: Hex, candidates: Iterable[Hex],
+                      blocking_slots: Sequence[str] = DEFAULT_BLOCKING_SLOTS) -> Optional[Hex]:
+        """
+        Hex from <candidates>, which is closest to <target> by path.
+        None if no candidate is closer to target than <source>
+        """
+        field = self.get_distance_field(target, blocking_slots)
+        best_step, best_distance = None, field[source.index]
+        for candidate in candidates:
+            distance = field[candidate.index]
+            if distance != UNREACHABLE and (best_distance == UNREACHABLE or distance < best_distance):
+                best_step, best_distance = candidate, distance
+        return best_step
+
+    def find_path(self, source: Hex, target: Hex,
+                  blocking_slots: Sequence[str] = DEFAULT_BLOCKING_SLOTS) -> Optional[List[Hex]]:
+        """
+        Shortest path from <source> to <target> by A*, including both of them.
+        Used for single pairs of hexes, when building distance field is not worth it. None if there is no path
+        """
+        board = self._board
+        blocked_mask = board.get_slots_mask(blocking_slots) & ~(1 << target.index)
+        # distance to target is the heuristic
+        heuristic = board.geometry.get_distance_row(target.index)
+        came_from = {source.index: None}
+        costs = {source.index: 0}
+        queue = [(heuristic[source.index], 0, source.index)]
+        while queue:
+            _, cost, index = heappop(queue)
+            if index == target.index:
+                path = []
+                while index is not None:
+                    path.append(board.get_by_index(index))
+                    index = came_from[index]
+                return path[::-1]
+            if cost > costs[index]:
+                continue
+            for neighbor in board.get_neighbor_indexes(index):
+                if blocked_mask >> neighbor & 1 or costs.get(neighbor, cost + 2) <= cost + 1:
+                    continue
+                costs[neighbor] = cost + 1
+                came_from[neighbor] = index
+                heappush(queue, (cost + 1 + heuristic[neighbor], cost + 1, neighbor))
+        return None
+
+    def clear(self):
+        """Forget cached distance fields"""
+        self._fields.clear()
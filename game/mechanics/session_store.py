@@ -0,0 +1,272 @@
+"""
+Session stores keep snapshots of live games, so a game started in one worker process
+can be continued by any other one. See GameManager
+"""
+import fcntl
+import mmap
+import os
+import socket
+import socketserver
+import struct
+from collections import namedtuple
+from contextlib import contextmanager
+from threading import Lock, RLock, local
+from typing import Dict, Optional
+from weakref import WeakValueDictionary
+
+SessionRecord = namedtuple('SessionRecord', ['version', 'owner', 'snapshot'])
+
+# version of snapshot, length of owner name
+_record_header = struct.Struct('<QH')
+
+
+def pack_record(record: SessionRecord) -> bytes:
+    """Serialize session record to bytes"""
+    owner = record.owner.encode()
+    return _record_header.pack(record.version, len(owner)) + owner + record.snapshot
+
+
+def unpack_record(data, with_snapshot: bool = True) -> SessionRecord:
+    """Deserialize session record. Without snapshot only header of the record is read"""
+    version, owner_length = _record_header.unpack_from(data)
+    owner_end = _record_header.size + owner_length
+    owner = bytes(data[_record_header.size:owner_end]).decode()
+    snapshot = bytes(data[owner_end:]) if with_snapshot else b''
+    return SessionRecord(version, owner, snapshot)
+
+
+class BaseSessionStore:
+    """Base class for session stores"""
+
+    def get(self, game_id: str) -> Optional[SessionRecord]:
+        """Get record of the game. None if there is no such game in store"""
+        raise NotImplementedError
+
+    def get_meta(self, game_id: str) -> Optional[SessionRecord]:
+        """Get record of the game without snapshot. Used to check versions cheaply"""
+        return self.get(game_id)
+
+    def set(self, game_id: str, record: SessionRecord):
+        """Save record of the game"""
+        raise NotImplementedError
+
+    def delete(self, game_id: str):
+        """Remove record of the game"""
+        raise NotImplementedError
+
+    def lock(self, game_id: str):
+        """Context manager holding exclusive lock of the game across all users of the store"""
+        raise NotImplementedError
+
+
+class LocalMemoryStore(BaseSessionStore):
+    """Store in memory of current process. Shares games between threads only"""
+
+    def __init__(self):
+        self._records: Dict[str, SessionRecord] = {}
+        # lock of the game lives while it's held or waited for
+        self._locks: Dict[str, RLock] = WeakValueDictionary()
+        self._locks_guard = Lock()
+
+    def get(self, game_id: str) -> Optional[SessionRecord]:
+        return self._records.get(game_id)
+
+    def get_meta(self, game_id: str) -> Optional[SessionRecord]:
+        record = self._records.get(game_id)
+        return record._replace(snapshot=b'') if record is not None else None
+
+    def set(self, game_id: str, record: SessionRecord):
+        self._records[game_id] = record
+
+    def delete(self, game_id: str):
+        self._records.pop(game_id, None)
+
+    @contextmanager
+    def lock(self, game_id: str):
+        with self._locks_guard:
+            game_lock = self._locks.get(game_id)
+            if game_lock is None:
+                game_lock = self._locks[game_id] = RLock()
+        with game_lock:
+            yield
+
+
+class FileStore(BaseSessionStore):
+    """
+    Store in files of local directory, shared by all processes on the host.
+    Records are written atomically and read through mmap, games are locked with flock
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file_path(self, game_id: str, extension: str) -> str:
+        # game ids are used as file names, so only numeric ids are allowed
+        return os.path.join(self.path, f'{int(game_id)}.{extension}')
+
+    def get(self, game_id: str) -> Optional[SessionRecord]:
+        try:
+            with open(self._file_path(game_id, 'game'), 'rb') as game_file:
+                with mmap.mmap(game_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return unpack_record(data)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_meta(self, game_id: str) -> Optional[SessionRecord]:
+        try:
+            with open(self._file_path(game_id, 'game'), 'rb') as game_file:
+                header = game_file.read(_record_header.size)
+                owner_length = _record_header.unpack(header)[1]
+                return unpack_record(header + game_file.read(owner_length), with_snapshot=False)
+        except (FileNotFoundError, struct.error):
+            return None
+
+    def set(self, game_id: str, record: SessionRecord):
+        file_path = self._file_path(game_id, 'game')
+        tmp_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as tmp_file:
+            tmp_file.write(pack_record(record))
+        os.replace(tmp_path, file_path)
+
+    def delete(self, game_id: str):
+        # lock file is kept, as other processes can hold or wait for lock of it's inode
+        try:
+            os.remove(self._file_path(game_id, 'game'))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, game_id: str):
+        with open(self._file_path(game_id, 'lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# region socket store
+CMD_GET, CMD_META, CMD_SET, CMD_DELETE, CMD_LOCK, CMD_UNLOCK = range(1, 7)
+STATUS_OK, STATUS_NOT_FOUND = 0, 1
+
+# command, length of game id, length of payload
+_request_header = struct.Struct('<BHI')
+# status, length of payload
+_response_header = struct.Struct('<BI')
+
+
+def _receive(sock: socket.socket, size: int) -> bytes:
+    """Read exactly <size> bytes from socket"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Session store connection closed')
+        data.extend(chunk)
+    return bytes(data)
+
+
+class SessionStoreRequestHandler(socketserver.BaseRequestHandler):
+    """Handles connection of single SocketStore client. Locks, taken by client, are released on disconnect"""
+
+    def handle(self):
+        store: LocalMemoryStore = self.server.store
+        held_locks = {}
+        try:
+            while True:
+                command, id_length, payload_length = _request_header.unpack(
+                    _receive(self.request, _request_header.size))
+                game_id = _receive(self.request, id_length).decode()
+                payload = _receive(self.request, payload_length)
+
+                status, response = STATUS_OK, b''
+                if command in (CMD_GET, CMD_META):
+                    record = store.get(game_id)
+                    if record is None:
+                        status = STATUS_NOT_FOUND
+                    else:
+                        response = pack_record(record if command == CMD_GET else record._replace(snapshot=b''))
+                elif command == CMD_SET:
+                    store.set(game_id, unpack_record(payload))
+                elif command == CMD_DELETE:
+                    store.delete(game_id)
+                elif command == CMD_LOCK:
+                    game_lock = store.lock(game_id)
+                    game_lock.__enter__()
+                    held_locks.setdefault(game_id, []).append(game_lock)
+                elif command == CMD_UNLOCK and held_locks.get(game_id):
+                    held_locks[game_id].pop().__exit__(None, None, None)
+                self.request.sendall(_response_header.pack(status, len(response)) + response)
+        except ConnectionError:
+            pass
+        finally:
+            for game_locks in held_locks.values():
+                for game_lock in reversed(game_locks):
+                    game_lock.__exit__(None, None, None)
+
+
+class SessionStoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Session store server, listening unix socket. Stands in for redis on a single host.
+    Run it with `manage.py run_session_store`
+    """
+    daemon_threads = True
+
+    def __init__(self, address: str):
+        if os.path.exists(address):
+            os.remove(address)
+        super().__init__(address, SessionStoreRequestHandler)
+        self.store = LocalMemoryStore()
+
+
+class SocketStore(BaseSessionStore):
+    """Client of SessionStoreServer. Every thread uses it's own connection"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self._local = local()
+
+    def _connection(self) -> socket.socket:
+        if getattr(self._local, 'connection', None) is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(self.address)
+            self._local.connection = connection
+        return self._local.connection
+
+    def _request(self, command: int, game_id: str, payload: bytes = b'') -> Optional[bytes]:
+        game_id = game_id.encode()
+        connection = self._connection()
+        try:
+            connection.sendall(_request_header.pack(command, len(game_id), len(payload)) + game_id + payload)
+            status, length = _response_header.unpack(_receive(connection, _response_header.size))
+            response = _receive(connection, length)
+        except OSError:
+            # connection is broken, next request will reconnect
+            connection.close()
+            self._local.connection = None
+            raise
+        return response if status == STATUS_OK else None
+
+    def get(self, game_id: str) -> Optional[SessionRecord]:
+        response = self._request(CMD_GET, game_id)
+        return unpack_record(response) if response is not None else None
+
+    def get_meta(self, game_id: str) -> Optional[SessionRecord]:
+        response = self._request(CMD_META, game_id)
+        return unpack_record(response, with_snapshot=False) if response is not None else None
+
+    def set(self, game_id: str, record: SessionRecord):
+        self._request(CMD_SET, game_id, pack_record(record))
+
+    def delete(self, game_id: str):
+        self._request(CMD_DELETE, game_id)
+
+    @contextmanager
+    def lock(self, game_id: str):
+        self._request(CMD_LOCK, game_id)
+        try:
+            yield
+        finally:
+            self._request(CMD_UNLOCK, game_id)
+# endregion socket store
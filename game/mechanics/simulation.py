@@ -0,0 +1,162 @@
+import math
+import os
+import random
+from collections import namedtuple
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from game.mechanics.actions import ActionResponse
+from game.mechanics.constants import BOARD_RADIUS, slotUnit
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.handbook import Handbook, read_fixture, set_prefetched
+from game.models import GameModel, HeroModel
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'test_fixture.json')
+
+GameResult = namedtuple('GameResult', ['seed', 'turns', 'rounds', 'game_over', 'latencies'])
+
+# hero models of fixture with pks of their spells, used as templates of simulated heroes. Filled in worker process
+_hero_templates: Dict[int, Tuple[HeroModel, List[int]]] = {}
+
+
+# region hero policies
+def random_policy(game: GameInstance, rng: random.Random) -> dict:
+    """Hero does random available action"""
+    choices = [('move', hex_id) for hex_id in game.hero.moves]
+    choices += [('attack', _hex.id) for _hex in _attack_targets(game)]
+    exit_hex = _exit_in_reach(game)
+    if exit_hex is not None:
+        choices.append(('exit', exit_hex))
+    if not choices:
+        return {'action': 'idle', 'target_hex': game.hero.position.id}
+    action, target_hex = rng.choice(choices)
+    return {'action': action, 'target_hex': target_hex}
+
+
+def aggressive_policy(game: GameInstance, rng: random.Random) -> dict:
+    """Hero attacks the weakest unit in range, otherwise goes to the closest unit. Leaves round, when all are dead"""
+    targets = _attack_targets(game)
+    if targets:
+        target = min(targets, key=lambda _hex: (_hex.slot.health, _hex.index))
+        return {'action': 'attack', 'target_hex': target.id}
+    hero_position = game.hero.position
+    if game.units:
+        distances = game.pathfinder.get_distance_field(hero_position)
+        reachable = [unit for unit in game.units.values() if distances[unit.position.index] >= 0]
+        goal = min(reachable, key=lambda unit: distances[unit.position.index]).position if reachable else None
+    else:
+        exit_hex = _exit_in_reach(game)
+        if exit_hex is not None:
+            return {'action': 'exit', 'target_hex': exit_hex}
+        goal = game.structures['exit'].position if 'exit' in game.structures else None
+    moves = [game.get_hex(hex_id) for hex_id in game.hero.moves]
+    step = game.pathfinder.get_best_step(hero_position, goal, moves) if goal is not None else None
+    if step is None:
+        return {'action': 'idle', 'target_hex': hero_position.id}
+    return {'action': 'move', 'target_hex': step.id}
+
+
+def _attack_targets(game: GameInstance) -> list:
+    return [_hex for _hex in map(game.get_hex, game.hero.attack_hexes) if str(_hex.slot) == slotUnit]
+
+
+def _exit_in_reach(game: GameInstance) -> Optional[str]:
+    exit_structure = game.structures.get('exit')
+    if exit_structure is None or game.distance(game.hero.position, exit_structure.position.id) > game.hero.move_range:
+        return None
+    return exit_structure.position.id
+
+
+POLICIES: Dict[str, Callable[[GameInstance, random.Random], dict]] = {
+    'random': random_policy,
+    'aggressive': aggressive_policy,
+}
+# endregion hero policies
+
+
+def init_worker(fixture_path: str = DEFAULT_FIXTURE):
+    """Load handbook and hero templates from fixture, so games are played without db"""
+    import django
+    django.setup()
+    Handbook.instance().load_fixture(fixture_path)
+    for pk, deserialized in read_fixture(fixture_path)[HeroModel].items():
+        _hero_templates[pk] = (deserialized.object, deserialized.m2m_data.get('spells', []))
+
+
+def build_game(seed: int, hero_pk: int = None, radius: int = BOARD_RADIUS) -> GameInstance:
+    """Create game, which is not bound to db. Hero is copied from fixture hero or created as new one"""
+    handbook = Handbook.instance()
+    hero_model = HeroModel(pk=seed + 1, name='Simulated',
+                           suit=handbook.get_item_by_name('Cuirass'), weapon=handbook.get_item_by_name('Sword'))
+    spells = []
+    if hero_pk is not None:
+        template, spell_pks = _hero_templates[hero_pk]
+        for field in ['name', 'health', 'damage', 'attack_range', 'move_range', 'armor']:
+            setattr(hero_model, field, getattr(template, field))
+        spells = [handbook.get_ability_by_pk('spell', pk) for pk in spell_pks]
+    set_prefetched(hero_model, 'spells', spells)
+    set_prefetched(hero_model, 'skills', [])
+    set_prefetched(hero_model, 'items', [])
+    return GameInstance(GameModel(pk=seed + 1, hero=hero_model), radius)
+
+
+def simulate_game(seed: int, policy: str = 'aggressive', max_turns: int = 200, hero_pk: int = None) -> GameResult:
+    """Play single game with given hero policy, until hero dies or <max_turns> are made"""
+    rng = random.Random(seed)
+    choose_action = POLICIES[policy]
+    game = build_game(seed, hero_pk)
+    # board generation and units placement use random generator of the game
+    game.rng.seed(seed)
+    game.start_round()
+    latencies = []
+    game_over = False
+    for _ in range(max_turns):
+        action_data = choose_action(game, rng)
+        started = perf_counter()
+        response = game.make_turn(action_data)
+        latencies.append(perf_counter() - started)
+        if response.state == ActionResponse.GAME_OVER or game.is_game_over():
+            game_over = True
+            break
+    return GameResult(seed, len(latencies), game.round, game_over, latencies)
+
+
+def _simulate_game(args: tuple) -> GameResult:
+    return simulate_game(*args)
+
+
+def run_simulation(games: int, processes: int = None, policy: str = 'aggressive', max_turns: int = 200,
+                   first_seed: int = 0, hero_pk: int = None, fixture_path: str = DEFAULT_FIXTURE) -> dict:
+    """Play <games> games with consecutive seeds in pool of processes. Returns summary report"""
+    tasks = [(seed, policy, max_turns, hero_pk) for seed in range(first_seed, first_seed + games)]
+    started = perf_counter()
+    with Pool(processes, initializer=init_worker, initargs=(fixture_path,)) as pool:
+        results = list(pool.imap_unordered(_simulate_game, tasks, chunksize=max(1, games // (4 * (processes or 1)))))
+    elapsed = perf_counter() - started
+    return summarize(results, elapsed)
+
+
+def summarize(results: List[GameResult], elapsed: float) -> dict:
+    """Throughput, rounds reached and turn latency percentiles of simulated games"""
+    latencies = sorted(latency for result in results for latency in result.latencies)
+    rounds = [result.rounds for result in results]
+    turns = len(latencies)
+    return {
+        'games': len(results),
+        'turns': turns,
+        'elapsed': elapsed,
+        'turns_per_sec': turns / elapsed if elapsed else 0.0,
+        'games_over': sum(result.game_over for result in results),
+        'rounds_mean': sum(rounds) / len(rounds) if rounds else 0.0,
+        'rounds_max': max(rounds, default=0),
+        'latency_ms': {f'p{p}': percentile(latencies, p) * 1000 for p in (50, 90, 99)},
+    }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
@@ -0,0 +1,194 @@
+"""
+Compact binary encoding of game state (see GameInstance.dump_state).
+
+Layout: magic, format version, flags, then payload, optionally compressed with zlib:
+    round, board radius, hero health, hero position, number of made turns (since format version 2),
+    state version of the game (since format version 5, see GameInstance.state_version)
+    obstacles bitmap over board storage indexes (see Board.index_of)
+    units count, fixed-width unit records: pk, level, health, position
+    structures count, structure records: position, length of code name, code name
+    since format version 3:
+    for every ability type: count and pks of hero abilities, count and pks of abilities, not kept by hero yet
+    for every structure: assortment count, assortment records: ability type, pk
+    pks of abilities are 2 bytes wide in format version 3 and 4 bytes wide since format version 4
+Positions are board storage indexes. Old json states are decoded too.
+"""
+import json
+import struct
+import zlib
+
+from game.mechanics.constants import slotObstacle
+
+MAGIC = b'AC'
+FORMAT_VERSION = 5
+FLAG_COMPRESSED = 1
+NO_POSITION = 0xFFFF
+
+_header = struct.Struct('<2sBB')
+# round, board radius, hero health, hero position, turn, state version
+_game_record = struct.Struct('<IBiHII')
+# records of older format versions
+_game_records = {1: struct.Struct('<IBiH'), 2: struct.Struct('<IBiHI'), 3: struct.Struct('<IBiHI'),
+                 4: struct.Struct('<IBiHI'), FORMAT_VERSION: _game_record}
+_count = struct.Struct('<H')
+# pk, level, health, position
+_unit_record = struct.Struct('<HHiH')
+# position, length of code name
+_structure_record = struct.Struct('<HB')
+# index of ability type, pk
+_assortment_record = struct.Struct('<BI')
+# format of ability pks by format version
+_pk_formats = {3: 'H', 4: 'I', FORMAT_VERSION: 'I'}
+_assortment_records = {3: struct.Struct('<BH'), 4: _assortment_record, FORMAT_VERSION: _assortment_record}
+ABILITY_TYPES = ('spell', 'skill', 'item')
+
+
+class StateCodecError(ValueError):
+    """Raised on data, which is not an encoded game state"""
+    pass
+
+
+def _index(position: str, radius: int) -> int:
+    """Board storage index of hex with given id"""
+    if not position:
+        return NO_POSITION
+    q, r = map(int, position.split(';'))
+    offset, width = radius - 1, 2 * radius - 1
+    return (q + offset) * width + r + offset
+
+
+def _position(index: int, radius: int) -> str:
+    """Id of hex with given board storage index"""
+    offset, width = radius - 1, 2 * radius - 1
+    return f'{index // width - offset};{index % width - offset}'
+
+
+def encode_state(game_state: dict, radius: int, compress: bool = True) -> bytes:
+    """Encode game state dict. Data is compressed if <compress> and if it makes data smaller"""
+    hero = game_state.get('hero', {})
+    payload = bytearray(_game_record.pack(game_state['round'], radius, hero.get('health', 0),
+                                          _index(hero.get('position'), radius), game_state.get('turn', 0),
+                                          game_state.get('state_version', 0)))
+
+    offset, width = radius - 1, 2 * radius - 1
+    obstacles = 0
+    for _hex in game_state.get('hexes', []):
+        obstacles |= 1 << ((_hex['q'] + offset) * width + _hex['r'] + offset)
+    payload += obstacles.to_bytes((width * width + 7) // 8, 'little')
+
+    units = game_state.get('units', [])
+    payload += _count.pack(len(units))
+    for unit in units:
+        payload += _unit_record.pack(unit['pk'], unit['level'], unit['health'], _index(unit['position'], radius))
+
+    structures = game_state.get('structures', [])
+    payload += _count.pack(len(structures))
+    for structure in structures:
+        code_name = structure['code_name'].encode()
+        payload += _structure_record.pack(_index(structure['position'], radius), len(code_name)) + code_name
+
+    for key in ['abilities', 'unsaved_abilities']:
+        abilities = hero.get(key, {})
+        for ability_type in ABILITY_TYPES:
+            payload += _pack_pks(abilities.get(ability_type, []), _pk_formats[FORMAT_VERSION])
+    for structure in structures:
+        assortment = structure.get('assortment', [])
+        payload += _count.pack(len(assortment))
+        for entry in assortment:
+            payload += _assortment_record.pack(ABILITY_TYPES.index(entry['type']), entry['pk'])
+
+    flags = 0
+    if compress:
+        compressed = zlib.compress(bytes(payload))
+        if len(compressed) < len(payload):
+            payload, flags = compressed, FLAG_COMPRESSED
+    return _header.pack(MAGIC, FORMAT_VERSION, flags) + bytes(payload)
+
+
+def decode_state(data: bytes) -> dict:
+    """Decode game state, encoded by <encode_state>, or json state of old format"""
+    data = bytes(data)
+    if not data or data.lstrip().startswith(b'{'):
+        return json.loads(data.decode() or '{}')
+    if len(data) < _header.size:
+        raise StateCodecError('Data is too short')
+    magic, format_version, flags = _header.unpack_from(data)
+    if magic != MAGIC or format_version not in _game_records:
+        raise StateCodecError(f'Unknown state format {magic}.{format_version}')
+    payload = data[_header.size:]
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    game_record = _game_records[format_version]
+    _round, radius, hero_health, hero_position, *counters = game_record.unpack_from(payload)
+    game_state = {
+        'round': _round,
+        'turn': counters[0] if counters else 0,
+        'hero': {'health': hero_health},
+        'hexes': [],
+        'units': [],
+        'structures': [],
+    }
+    if len(counters) > 1:
+        game_state['state_version'] = counters[1]
+    if hero_position != NO_POSITION:
+        game_state['hero']['position'] = _position(hero_position, radius)
+    position = game_record.size
+
+    offset, width = radius - 1, 2 * radius - 1
+    bitmap_size = (width * width + 7) // 8
+    obstacles = int.from_bytes(payload[position:position + bitmap_size], 'little')
+    position += bitmap_size
+    while obstacles:
+        lowest_bit = obstacles & -obstacles
+        index = lowest_bit.bit_length() - 1
+        game_state['hexes'].append({'q': index // width - offset, 'r': index % width - offset, 'slot': slotObstacle})
+        obstacles ^= lowest_bit
+
+    units_count, = _count.unpack_from(payload, position)
+    position += _count.size
+    for _ in range(units_count):
+        pk, level, health, unit_position = _unit_record.unpack_from(payload, position)
+        position += _unit_record.size
+        game_state['units'].append({'pk': pk, 'level': level, 'health': health,
+                                    'position': _position(unit_position, radius)})
+
+    structures_count, = _count.unpack_from(payload, position)
+    position += _count.size
+    for _ in range(structures_count):
+        structure_position, name_length = _structure_record.unpack_from(payload, position)
+        position += _structure_record.size
+        code_name = payload[position:position + name_length].decode()
+        position += name_length
+        game_state['structures'].append({'code_name': code_name,
+                                         'position': _position(structure_position, radius)})
+    if format_version < 3:
+        return game_state
+
+    pk_format = _pk_formats[format_version]
+    assortment_record = _assortment_records[format_version]
+    for key in ['abilities', 'unsaved_abilities']:
+        abilities = game_state['hero'][key] = {}
+        for ability_type in ABILITY_TYPES:
+            abilities[ability_type], position = _unpack_pks(payload, position, pk_format)
+    for structure in game_state['structures']:
+        assortment_count, = _count.unpack_from(payload, position)
+        position += _count.size
+        structure['assortment'] = []
+        for _ in range(assortment_count):
+            type_index, pk = assortment_record.unpack_from(payload, position)
+            position += assortment_record.size
+            structure['assortment'].append({'type': ABILITY_TYPES[type_index], 'pk': pk})
+    return game_state
+
+
+def _pack_pks(pks: list, pk_format: str) -> bytes:
+    return _count.pack(len(pks)) + struct.pack(f'<{len(pks)}{pk_format}', *pks)
+
+
+def _unpack_pks(payload: bytes, position: int, pk_format: str) -> tuple:
+    """List of pks, packed by <_pack_pks>, and position after it"""
+    count, = _count.unpack_from(payload, position)
+    position += _count.size
+    return (list(struct.unpack_from(f'<{count}{pk_format}', payload, position)),
+            position + struct.calcsize(pk_format) * count)
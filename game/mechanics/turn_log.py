@@ -0,0 +1,67 @@
+"""
+Append-only log of game turns
+
+Every turn is recorded with action request of hero and seed of game random generator at the start of the turn,
+so the turn is replayed exactly. Full snapshots of the game are taken every SNAPSHOT_INTERVAL turns
+(see GameInstance.dump_save), game is reconstructed from the nearest snapshot by replaying the turns after it.
+Records are written by autosave in batches.
+"""
+import json
+from collections import namedtuple
+from typing import Iterable, List, Optional, Tuple
+
+from django.db.models import Q
+
+from game.models import GameSnapshotModel, TurnRecordModel
+
+# turns between snapshots of the game
+SNAPSHOT_INTERVAL = 50
+# fields of action request, which are not part of the action itself
+NOT_LOGGED_FIELDS = ('source', 'game_id', 'version')
+
+TurnRecord = namedtuple('TurnRecord', ['turn', 'action', 'seed'])
+
+
+def make_record(turn: int, action_data: dict, seed: int) -> TurnRecord:
+    return TurnRecord(turn, {key: value for key, value in action_data.items() if key not in NOT_LOGGED_FIELDS}, seed)
+
+
+def build_turn_models(game_id: int, records: Iterable[TurnRecord]) -> List[TurnRecordModel]:
+    return [TurnRecordModel(game_id=game_id, turn=record.turn, action=json.dumps(record.action), seed=record.seed)
+            for record in records]
+
+
+def build_snapshot_model(game_id: int, turn: int, state_data: bytes) -> GameSnapshotModel:
+    return GameSnapshotModel(game_id=game_id, turn=turn, state_data=state_data)
+
+
+def delete_turns_after(snapshots: Iterable[Tuple[int, int]]):
+    """
+    Delete turns, made after snapshots, passed as (game id, turn of snapshot). Turns after the snapshot are written
+    with it, so this removes only turns, which are not part of the game anymore, like turns, which failed to replay
+    """
+    condition = Q()
+    for game_id, turn in snapshots:
+        condition |= Q(game_id=game_id, turn__gt=turn)
+    if condition:
+        TurnRecordModel.objects.filter(condition).delete()
+
+
+def load_turns(game_id: int, after_turn: int, until_turn: int = None) -> List[TurnRecord]:
+    """Turns of the game, made after <after_turn> up to <until_turn> inclusive, in order"""
+    records = TurnRecordModel.objects.filter(game_id=game_id, turn__gt=after_turn)
+    if until_turn is not None:
+        records = records.filter(turn__lte=until_turn)
+    return [TurnRecord(turn, json.loads(action), seed)
+            for turn, action, seed in records.order_by('turn').values_list('turn', 'action', 'seed')]
+
+
+def load_snapshot(game_id: int, until_turn: int = None) -> Optional[Tuple[int, bytes]]:
+    """Turn and state data of the latest snapshot of the game, taken not later than <until_turn>"""
+    snapshots = GameSnapshotModel.objects.filter(game_id=game_id)
+    if until_turn is not None:
+        snapshots = snapshots.filter(turn__lte=until_turn)
+    snapshot = snapshots.order_by('-turn', '-pk').values_list('turn', 'state_data').first()
+    if snapshot is None:
+        return None
+    return snapshot[0], bytes(snapshot[1])
@@ -0,0 +1,186 @@
+"""
+Streaming of game turns over persistent connection
+
+Client connects by TCP and exchanges json messages, one per line. First message authenticates the connection
+with api token: {"token": "..."}, server replies with {"event": "auth", "user": <user id>}.
+After that every message is a hero action with the same fields, as for GameAction view: game_id, action,
+target_hex and optional version. Server replies with a stream of events, as the turn is resolved:
+{"event": "hero", ...} with result of hero action, {"event": "unit", "unit": <pk>, ...} for every unit action,
+{"event": "moves", ...} with new moves of hero and finally {"event": "done", ...} with changes of the game
+since the version, known by client (or full state, see serialize_game_changes).
+Errors are sent as {"event": "error", "detail": "..."}.
+"""
+import json
+import socket
+import socketserver
+from queue import Empty, Queue
+from typing import Iterator, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from game.mechanics.actions import ActionResponse
+from game.mechanics.game_manager import GameManager
+from game.mechanics.instrumentation import Instrumentation, phase
+from game.serializers import parse_version, serialize_game_changes
+
+# events, which finish the reply to a message
+FINAL_EVENTS = ('done', 'error')
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, cls=DjangoJSONEncoder).encode() + b'\n'
+
+
+class TurnStreamRequestHandler(socketserver.StreamRequestHandler):
+    """Handles connection of single client. Turns are made by game actors, like requests of GameAction view"""
+
+    def handle(self):
+        gm = GameManager.instance()
+        try:
+            user = self._authenticate(gm)
+            if user is None:
+                return
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    action_data = json.loads(line)
+                except ValueError:
+                    action_data = None
+                if not isinstance(action_data, dict) or 'game_id' not in action_data or 'action' not in action_data:
+                    self.send({'event': 'error', 'detail': 'Bad action message'})
+                    continue
+                try:
+                    parse_version(action_data.get('version'))
+                except ValidationError:
+                    self.send({'event': 'error', 'detail': 'Bad version'})
+                    continue
+                self._handle_action(gm, str(action_data['game_id']), action_data)
+        except ConnectionError:
+            pass
+        finally:
+            close_old_connections()
+
+    def send(self, message: dict):
+        self.wfile.write(encode_message(message))
+        self.wfile.flush()
+
+    def _authenticate(self, gm: GameManager):
+        """User of the token, passed in the first message. None if authentication failed"""
+        try:
+            key = json.loads(self.rfile.readline())['token']
+            token = gm.run_db(lambda: Token.objects.select_related('user').get(key=key))
+        except (ValueError, KeyError, TypeError, Token.DoesNotExist):
+            self.send({'event': 'error', 'detail': 'Invalid token'})
+            return None
+        self.send({'event': 'auth', 'user': token.user_id})
+        return token.user
+
+    def _handle_action(self, gm: GameManager, game_id: str, action_data: dict):
+        """
+        Make turn by game actor and send its events. Events are passed from actor through the queue and are sent
+        by connection thread, so slow client doesn't hold up the actor and the game lock
+        """
+        with Instrumentation.instance().trace('turn_stream'):
+            events = Queue()
+            try:
+                if not gm.prefetch_game(game_id):
+                    self.send({'event': 'error', 'detail': f'Game {game_id} not found'})
+                    return
+                future = gm.actors.submit(game_id, self._stream_turn, gm, game_id, action_data, events)
+            except Exception as err:
+                # like MailboxFull
+                self.send({'event': 'error', 'detail': str(err)})
+                return
+            try:
+                for message in iter(lambda: events.get(timeout=gm.actors.timeout), None):
+                    self.send(message)
+                game_over = future.result()
+            except ConnectionError:
+                raise
+            except Empty:
+                self.send({'event': 'error', 'detail': 'Turn timed out'})
+                return
+            except Exception as err:
+                # failure of the action
+                self.send({'event': 'error', 'detail': str(err)})
+                return
+            if game_over:
+                gm.run_db(gm.delete_game, game_id)
+
+    @staticmethod
+    def _stream_turn(gm: GameManager, game_id: str, action_data: dict, events: Queue) -> bool:
+        """
+        Make turn, putting events into the queue as they are resolved, None is put after the last one.
+        Returns True if game is over
+        """
+        try:
+            with gm.lock_game(game_id):
+                game_instance = gm.get_game(game_id)
+                response = ActionResponse(action_data['action'])
+                for event in game_instance.iter_turn(action_data, response):
+                    events.put({'event': event.kind, **event.data})
+                gm.publish(game_id)
+                with phase('serialize'):
+                    changes = serialize_game_changes(game_instance, action_data.get('version'))
+                events.put({'event': 'done', 'state': response.state, **changes})
+            return response.state == ActionResponse.GAME_OVER
+        finally:
+            events.put(None)
+
+
+class TurnStreamServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Server of turn streams, listening tcp socket.
+    Run it with `manage.py run_turn_stream`
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int]):
+        super().__init__(address, TurnStreamRequestHandler)
+
+
+class TurnStreamClient:
+    """Client of TurnStreamServer, used by tests and tools"""
+
+    def __init__(self, address: Tuple[str, int], token: str, timeout: Optional[float] = 30):
+        self._socket = socket.create_connection(address, timeout)
+        self._file = self._socket.makefile('rwb')
+        reply = self._request({'token': token})
+        if reply['event'] != 'auth':
+            self.close()
+            raise PermissionError(reply.get('detail'))
+        self.user_id: int = reply['user']
+
+    def make_turn(self, action_data: dict) -> Iterator[dict]:
+        """Send hero action and iterate over events of the turn"""
+        event = self._request(action_data)
+        yield event
+        while event['event'] not in FINAL_EVENTS:
+            event = self._receive()
+            yield event
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, message: dict) -> dict:
+        self._file.write(encode_message(message))
+        self._file.flush()
+        return self._receive()
+
+    def _receive(self) -> dict:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('Turn stream connection closed')
+        return json.loads(line)
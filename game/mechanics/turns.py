@@ -1,24 +1,85 @@
-from game.mechanics.game_instance import GameInstance
+from typing import TYPE_CHECKING, List, Optional
 
+from game.mechanics.actions import ActionManager
+from game.mechanics.constants import slotEmpty, slotHero
+from game.mechanics.game_objects import BaseUnitObject
+from game.mechanics.pathfinding import UNREACHABLE
 
-class Turn:
-    def __init__(self, game_instance: GameInstance):
-        self.game = game_instance
-        self.hero_action = HeroAction(game_instance.hero)
-        self._unit_actions = [UnitAction(unit for unit in game_instance.units)]
+if TYPE_CHECKING:
+    from game.mechanics.game_instance import GameInstance
+    from game.mechanics.board import Hex
 
-    def execute(self):
-        self.hero_action.execute()
+# actions, which targets are found by planner itself. Targets of other actions (spells) are asked from actions
+PLANNED_ACTIONS = ('move', 'attack')
 
 
-class HeroAction:
-    def __init__(self, hero):
-        self.hero = hero
+class TurnPlanner:
+    """
+    Plans actions of all units for a turn at once
 
-    def execute(self):
-        self
+    State, shared by all units, is gathered once: hero position, distance field to hero and bitset of empty hexes.
+    Units, which can reach hero, attack him. Others move to the hexes with shortest path to hero.
+    Units closer to hero choose first. Hexes are reserved by planned moves, so no two units go to the same hex,
+    and hexes, left by moved units, become available for units planned after them.
+    Planned actions are returned in order they should be executed.
+    """
+    def __init__(self, game: 'GameInstance'):
+        self.game = game
+        self._board = game._board
 
+    def plan(self) -> List[dict]:
+        """Ordered list of action requests of all units"""
+        hero_position: 'Hex' = self.game.hero.position
+        hero_distances = self.game.pathfinder.get_distance_field(hero_position)
+        attacks, movers = [], []
+        for unit in self.game.units.values():
+            action_request = self._plan_attack(unit, hero_position)
+            if action_request is None:
+                movers.append(unit)
+            else:
+                attacks.append(action_request)
 
-class UnitAction:
-    def __init__(self, unit):
-        self.unit = unit
+        def hero_distance(unit: BaseUnitObject) -> int:
+            distance = hero_distances[unit.position.index]
+            return len(hero_distances) if distance == UNREACHABLE else distance
+
+        moves = []
+        free_mask = self._board.get_slots_mask([slotEmpty])
+        for unit in sorted(movers, key=hero_distance):
+            target = self._plan_move(unit, hero_distances, free_mask)
+            if target is None:
+                moves.append(self._request(unit, 'idle', unit.position))
+            else:
+                free_mask = free_mask & ~(1 << target.index) | 1 << unit.position.index
+                moves.append(self._request(unit, 'move', target))
+        return attacks + moves
+
+    def _plan_attack(self, unit: BaseUnitObject, hero_position: 'Hex') -> Optional[dict]:
+        """Request of action, which unit can attack hero with. Spells are preferred over simple attack"""
+        for action in reversed(unit.actions):
+            if action in PLANNED_ACTIONS:
+                continue
+            targets = ActionManager.get_action_class(action).available_targets(self.game, unit)
+            for target in targets:
+                if str(target.slot) == unit.enemy_target:
+                    return self._request(unit, action, target)
+        if unit.enemy_target == slotHero and 'attack' in unit.actions:
+            if self._board.get_distance(unit.position, hero_position) <= unit.attack_range:
+                return self._request(unit, 'attack', hero_position)
+        return None
+
+    def _plan_move(self, unit: BaseUnitObject, hero_distances: List[int], free_mask: int) -> Optional['Hex']:
+        """Free hex in unit's move range with the shortest path to hero. None if unit can't get closer"""
+        if 'move' not in unit.actions:
+            return None
+        best_target, best_distance = None, hero_distances[unit.position.index]
+        candidates = self._board.get_disk_mask(unit.position, unit.move_range) & free_mask
+        for target in self._board.iter_mask(candidates):
+            distance = hero_distances[target.index]
+            if distance != UNREACHABLE and (best_distance == UNREACHABLE or distance < best_distance):
+                best_target, best_distance = target, distance
+        return best_target
+
+    @staticmethod
+    def _request(unit: BaseUnitObject, action: str, target: 'Hex') -> dict:
+        return {'action': action, 'source': unit, 'target_hex': target.id}
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.8 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamemodel',
+            name='state_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.8 on 2026-10-18 10:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_gamemodel_state_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamemodel',
+            name='turn',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TurnRecordModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turn', models.IntegerField()),
+                ('action', models.TextField()),
+                ('seed', models.BigIntegerField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turns', to='game.GameModel')),
+            ],
+            options={
+                'unique_together': {('game', 'turn')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GameSnapshotModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turn', models.IntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('state_data', models.BinaryField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='game.GameModel')),
+            ],
+            options={
+                'index_together': {('game', 'turn')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.8 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_turn_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HandbookVersionModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -96,6 +96,14 @@ class GameStructureModel(HandbookModel):
     assortment = []
 
 
+class HandbookVersionModel(models.Model):
+    """
+    Version of handbook models, shared by worker processes. It's increased on every change of handbook models,
+    so every process reloads its handbook cache (see game.mechanics.handbook)
+    """
+    version = models.IntegerField(default=0)
+
+
 class BaseUnitModel(models.Model):
     """Base model for units, heroes etc"""
     health = models.IntegerField(default=50)
@@ -146,4 +154,34 @@ class GameModel(models.Model):
     hero = models.ForeignKey(HeroModel, on_delete=models.CASCADE, null=True, blank=True)
     round = models.IntegerField(default=1)  # round in the game
     # jsoned state of game. Need to save board state, shops assortment and so on
+    # Old format, read only if there is no <state_data>
     state = models.TextField(default='{}')
+    # state of game in compact binary format (see game.mechanics.state_codec). It's the latest snapshot of the game,
+    # turns made after it are replayed from turn log
+    state_data = models.BinaryField(null=True, blank=True)
+    turn = models.IntegerField(default=0)  # number of turns made in the game
+
+
+class TurnRecordModel(models.Model):
+    """Record of append-only log of game turns"""
+    game = models.ForeignKey(GameModel, on_delete=models.CASCADE, related_name='turns')
+    turn = models.IntegerField()
+    # jsoned action request of hero
+    action = models.TextField()
+    # seed of game random generator at the start of the turn, so turn is replayed exactly
+    seed = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('game', 'turn')
+
+
+class GameSnapshotModel(models.Model):
+    """Full state of the game after given turn. Game is reconstructed from snapshot by replaying later turns"""
+    game = models.ForeignKey(GameModel, on_delete=models.CASCADE, related_name='snapshots')
+    turn = models.IntegerField()
+    created = models.DateTimeField(default=now)
+    state_data = models.BinaryField()
+
+    class Meta:
+        # state can be reset without turns, like on start of the round, so there can be several snapshots of a turn
+        index_together = ('game', 'turn')
@@ -1,9 +1,32 @@
+from typing import Dict, Optional
+
 from rest_framework.fields import DictField, ListField
 
+from game.mechanics.handbook import Handbook
 from game.models import HeroModel, ItemModel, GameModel, UnitModel, SpellModel, GameStructureModel, SkillModel
 from rest_framework import serializers
 from django.contrib.auth.models import User
 
+# serialized handbook models, cached for handbook version
+_fragments: Dict[tuple, dict] = {}
+_fragments_version = None
+
+
+def get_handbook_fragment(serializer_class: serializers.Serializer.__class__, instance) -> dict:
+    """
+    Get serialized handbook model instance. Cached until handbook is reloaded.
+    Returned dict is shared, so it must not be changed
+    """
+    global _fragments_version
+    version = Handbook.instance().version
+    if version != _fragments_version:
+        _fragments.clear()
+        _fragments_version = version
+    key = (serializer_class, instance.pk)
+    if key not in _fragments:
+        _fragments[key] = serializer_class(instance).data
+    return _fragments[key]
+
 
 class ItemSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -95,6 +118,45 @@ class StructureSerializer(serializers.HyperlinkedModelSerializer):
     #     return f'{structure.position.q};{structure.position.r}'
 
 
+def serialize_hero(hero) -> dict:
+    """
+    Serialize runtime hero the same way as HeroSerializer does, but spells, skills and items are taken from
+    cached handbook fragments, so no queries are made
+    """
+    return {
+        'name': hero.name,
+        'damage': hero.damage,
+        'move_range': hero.move_range,
+        'attack_range': hero.attack_range,
+        'armor': hero.armor,
+        **serialize_hero_abilities(hero),
+        'img_path': hero.img_path,
+        'suit': _serialize_ability(ItemSerializer, 'item', hero.suit_id) if hero.suit_id else None,
+        'weapon': _serialize_ability(ItemSerializer, 'item', hero.weapon_id) if hero.weapon_id else None,
+        **hero.runtime_state(),
+    }
+
+
+def serialize_hero_abilities(hero) -> dict:
+    """Serialized spells, skills and items of runtime hero (see Hero.abilities_state)"""
+    handbook = Handbook.instance()
+    return {
+        'skills': [_serialize_ability(SkillSerializer, 'skill', pk) for pk in hero.skill_ids],
+        'spells': [get_handbook_fragment(SpellSerializer, handbook.get_ability('spell', code_name))
+                   for code_name in hero.spell_names],
+        'items': [_serialize_ability(ItemSerializer, 'item', pk) for pk in hero.item_ids],
+    }
+
+
+def _serialize_ability(serializer_class, ability_type: str, pk: int) -> dict:
+    return get_handbook_fragment(serializer_class, Handbook.instance().get_ability_by_pk(ability_type, pk))
+
+
+def serialize_unit(unit) -> dict:
+    """Serialize runtime unit. Fields of unit template are taken from cached handbook fragment"""
+    return {**get_handbook_fragment(UnitSerializer, unit._object), **unit.runtime_state()}
+
+
 class GameInstanceSerializer(serializers.Serializer):
     board = serializers.SerializerMethodField('game_board')
     round = serializers.SerializerMethodField('game_round')
@@ -103,23 +165,18 @@ class GameInstanceSerializer(serializers.Serializer):
     # game = GameSerializer(read_only=True)
     units = serializers.SerializerMethodField('game_units')
     structures = serializers.SerializerMethodField('game_structures')
+    version = serializers.SerializerMethodField('game_version')
 
     def game_hero(self, game):
-        hero = HeroSerializer(game.hero._object).data
-        hero['position'] = game.hero.position.id
-        return hero
+        return serialize_hero(game.hero)
 
     def game_units(self, game):
-        units = {pk: UnitSerializer(unit._object).data for pk, unit in game.units.items()}
-        for pk, unit in units.items():
-            unit['position'] = game.units[pk].position.id
-        return units
+        return {pk: serialize_unit(unit) for pk, unit in game.units.items()}
 
     def game_structures(self, game):
-        structures = {pk: StructureSerializer(structure._object).data for pk, structure in game.structures.items()}
-        for pk, structure in structures.items():
-            structure['position'] = game.structures[pk].position.id
-        return structures
+        return {pk: {**get_handbook_fragment(StructureSerializer, structure._object),
+                     'position': structure.position.id}
+                for pk, structure in game.structures.items()}
 
     def game_board(self, game):
         return game._board.get_state()
@@ -129,3 +186,58 @@ class GameInstanceSerializer(serializers.Serializer):
 
     def game_pk(self, game):
         return game._game.pk
+
+    def game_version(self, game):
+        return game.state_version
+
+
+class GameDeltaSerializer(serializers.Serializer):
+    """
+    Changes of game state since version, known by client. Serialized from GameInstance.get_changes result,
+    game instance itself is passed in context
+    """
+    version = serializers.IntegerField()
+    hexes = serializers.SerializerMethodField('changed_hexes')
+    units = serializers.SerializerMethodField('changed_units')
+    removed_units = serializers.SerializerMethodField()
+    hero = serializers.SerializerMethodField('changed_hero')
+
+    def changed_hexes(self, changes):
+        return {_hex.id: _hex.as_dict() for _hex in self.context['game']._board.iter_mask(changes.hexes_mask)}
+
+    def changed_units(self, changes):
+        units = self.context['game'].units
+        return {pk: serialize_unit(units[pk]) for pk in changes.units}
+
+    def get_removed_units(self, changes):
+        return sorted(changes.removed_units)
+
+    def changed_hero(self, changes):
+        hero = self.context['game'].hero
+        hero_state = hero.runtime_state()
+        if not changes.hero_fields.isdisjoint(hero.abilities_state()):
+            hero_state.update(serialize_hero_abilities(hero))
+        return {field: hero_state[field] for field in changes.hero_fields}
+
+
+def parse_version(value) -> Optional[int]:
+    """State version, known by client. ValidationError is raised, if it's passed, but is not an integer"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({'version': 'A valid integer is required.'})
+
+
+def serialize_game_changes(game_instance, since_version: int = None) -> dict:
+    """
+    Changes of the game since <since_version> as <delta>, if they are known, otherwise full state of the game.
+    <since_version> is validated with <parse_version>
+    """
+    changes = None
+    if since_version is not None:
+        changes = game_instance.get_changes(parse_version(since_version))
+    if changes is None:
+        return dict(GameInstanceSerializer(game_instance).data)
+    return {'delta': GameDeltaSerializer(changes, context={'game': game_instance}).data}
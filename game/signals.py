@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from game.mechanics.handbook import Handbook
+from game.models import UnitModel, SpellModel, SkillModel, ItemModel, GameStructureModel, EffectModel, \
+    SpellEffectModel, SkillEffectModel, ItemEffectModel
+
+handbook_models = [UnitModel, SpellModel, SkillModel, ItemModel, GameStructureModel, EffectModel,
+                   SpellEffectModel, SkillEffectModel, ItemEffectModel]
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_handbook(sender, **kwargs):
+    """Reload handbook caches of all processes after any handbook model is changed, e.g. in admin"""
+    if sender in handbook_models:
+        Handbook.instance().notify_changed()
+
+
+@receiver(m2m_changed, sender=UnitModel.spells.through)
+@receiver(m2m_changed, sender=UnitModel.skills.through)
+@receiver(m2m_changed, sender=UnitModel.items.through)
+def invalidate_handbook_relations(sender, **kwargs):
+    """Reload handbook caches of all processes after unit templates' abilities are changed"""
+    Handbook.instance().notify_changed()
@@ -80,6 +80,9 @@ class ActionsTestCase(TestCase):
         # hit unit out of distance
         action = RangeAttack(self.game, {'source': self.game.hero, 'target_hex': '0;0'})
         self.assertRaises(RuntimeError, action.execute)
+        # target behind obstacle 1;3
+        action = RangeAttack(self.game, {'source': self.game.hero, 'target_hex': '2;3'})
+        self.assertRaises(RuntimeError, action.execute)
 
     def test_path_of_fire(self):
         # one unit hit
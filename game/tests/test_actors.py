@@ -0,0 +1,75 @@
+"""Tests for per-game actors"""
+
+from threading import Barrier, Event
+from time import sleep
+
+from django.test import SimpleTestCase
+
+from game.mechanics.actors import ActorTimeout, GameActors, MailboxFull
+
+
+class GameActorsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.actors = GameActors(workers=4, mailbox_size=10, timeout=5)
+
+    def tearDown(self):
+        self.actors.shutdown()
+
+    def test_same_game_in_order(self):
+        processed = []
+
+        def handler(number):
+            # later requests would overtake slow earlier ones, if they were run in parallel
+            sleep(0.001 * (5 - number))
+            processed.append(number)
+            return number
+        futures = [self.actors.submit('1', handler, number) for number in range(5)]
+        self.assertEqual([future.result(5) for future in futures], list(range(5)))
+        self.assertEqual(processed, list(range(5)))
+        self.assertEqual(self.actors.get_stats()['processed'], 5)
+
+    def test_games_in_parallel(self):
+        # both handlers wait for each other, so they pass only if run at the same time
+        barrier = Barrier(2, timeout=5)
+        futures = [self.actors.submit(game_id, barrier.wait) for game_id in ['1', '2']]
+        for future in futures:
+            future.result(5)
+
+    def test_exception(self):
+        def handler():
+            raise ValueError('failed')
+        with self.assertRaises(ValueError):
+            self.actors.call('1', handler)
+        self.assertEqual(self.actors.call('1', lambda: 'next'), 'next')
+
+    def test_mailbox_full(self):
+        release = Event()
+        futures = [self.actors.submit('1', release.wait, 5)]
+        # first request may be taken by worker already
+        with self.assertRaises(MailboxFull):
+            for _ in range(self.actors.mailbox_size + 1):
+                futures.append(self.actors.submit('1', release.wait, 5))
+        self.assertEqual(self.actors.get_stats()['rejected'], 1)
+        release.set()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(self.actors.get_stats()['queued'], 0)
+
+    def test_timeout(self):
+        self.actors.timeout = 0.01
+        release = Event()
+        running = self.actors.submit('1', release.wait, 5)
+        made = []
+        # waiting request is cancelled, so it's not made later
+        with self.assertRaises(ActorTimeout):
+            self.actors.call('1', made.append, 1)
+        release.set()
+        running.result(5)
+        self.actors.timeout = 5
+        self.actors.call('1', lambda: None)
+        self.assertEqual(made, [])
+
+    def test_inline(self):
+        self.actors.inline = True
+        self.assertEqual(self.actors.call('1', lambda value: value * 2, 21), 42)
@@ -0,0 +1,175 @@
+"""Tests for background saving of games"""
+
+from django.test import TestCase
+
+from game.mechanics.autosave import AutosaveManager
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.state_codec import decode_state
+from game.mechanics.turn_log import TurnRecord
+from game.models import GameModel, GameSnapshotModel, TurnRecordModel
+
+
+class AutosaveTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.autosave = AutosaveManager.instance()
+        self.autosave.inline = True
+        self.autosave.flush()
+        self.autosave.stats = {'scheduled': 0, 'coalesced': 0, 'written': 0, 'batches': 0, 'failures': 0,
+                               'dropped': 0, 'stale': 0}
+        self.game = GameInstance(GameModel.objects.get(pk=2))
+        self.game.load_state()
+
+    def tearDown(self):
+        self.autosave.inline = False
+
+    def test_coalesced(self):
+        self.game.hero.receive_damage(10)
+        self.autosave.schedule(self.game)
+        self.game.hero.receive_damage(10)
+        self.autosave.schedule(self.game)
+        # select of saved turns, updates of games and heroes, insert of snapshots and cleanup of turns after them,
+        # wrapped in transaction
+        with self.assertNumQueries(7):
+            self.autosave.flush()
+        self.assertEqual(self.autosave.get_stats(), {'scheduled': 2, 'coalesced': 1, 'written': 1, 'batches': 1,
+                                                     'failures': 0, 'dropped': 0, 'stale': 0, 'pending': 0,
+                                                     'in_flight': 0})
+        game_model = GameModel.objects.get(pk=2)
+        self.assertEqual(game_model.hero.health, 47)
+        self.assertEqual(decode_state(game_model.state_data)['hero']['health'], 47)
+
+    def test_batched(self):
+        other_game = GameInstance(GameModel.objects.get(pk=1))
+        other_game.load_state()
+        self.autosave.schedule(self.game)
+        self.autosave.schedule(other_game)
+        # select of saved turns, updates of games and heroes, insert of snapshots and cleanup of turns after them,
+        # wrapped in transaction
+        with self.assertNumQueries(7):
+            self.autosave.flush()
+        self.assertEqual(self.autosave.stats['written'], 2)
+
+    def test_turn_log(self):
+        # state after loading is snapshotted with the first save
+        self.autosave.save(self.game)
+        self.assertEqual(GameSnapshotModel.objects.filter(game_id=2).count(), 1)
+        state_data = GameModel.objects.get(pk=2).state_data
+        self.game.make_turn({'action': 'idle', 'target_hex': self.game.hero.position.id})
+        self.autosave.schedule(self.game)
+        self.game.make_turn({'action': 'idle', 'target_hex': self.game.hero.position.id})
+        self.autosave.schedule(self.game)
+        # only turns are written, without snapshot
+        with self.assertNumQueries(6):
+            self.autosave.flush()
+        game_model = GameModel.objects.get(pk=2)
+        self.assertEqual(game_model.turn, 2)
+        self.assertEqual(bytes(game_model.state_data), bytes(state_data))
+        self.assertEqual(list(TurnRecordModel.objects.filter(game_id=2).values_list('turn', flat=True)), [1, 2])
+        self.assertEqual(GameSnapshotModel.objects.filter(game_id=2).count(), 1)
+
+    def test_failed_turns_not_replayed(self):
+        hero_hex = self.game.hero.position.id
+        with self.assertRaises(KeyError):
+            self.game.make_turn({'action': 'move', 'target_hex': '100;100'})
+        self.assertEqual((self.game.turn, self.game.turn_log), (0, []))
+        self.autosave.save(self.game)
+        self.game.make_turn({'action': 'idle', 'target_hex': hero_hex})
+        self.autosave.save(self.game)
+        # turn, which can't be replayed, is left in the log by other process
+        TurnRecordModel.objects.create(game_id=2, turn=2, action='{"action": "move", "target_hex": "100;100"}',
+                                       seed=0)
+        GameModel.objects.filter(pk=2).update(turn=2)
+        state = {**self.game.dump_state(), 'turn': 2}
+
+        game = GameInstance.load(2)
+        game.load_state()
+        # number of the broken turn is skipped
+        self.assertEqual(game.dump_state(), state)
+        # state is snapshotted after the broken turn
+        self.autosave.save(game)
+        self.assertEqual(GameSnapshotModel.objects.filter(game_id=2).latest('turn').turn, 2)
+        game = GameInstance.load(2)
+        game.load_state()
+        self.assertEqual(game.dump_state(), state)
+        self.assertFalse(game.dirty)
+
+    def test_older_record_skipped(self):
+        self.autosave.schedule(self.game)
+        older = self.autosave._pending.pop(2)
+        # game is continued by another process from the snapshot of this one and saved first
+        other = GameInstance.load(2)
+        other.restore_snapshot(self.game.dump_snapshot())
+        other.make_turns([{'action': 'idle'}] * 2)
+        self.autosave.save(other)
+        self.autosave._write([older])
+        game_model = GameModel.objects.get(pk=2)
+        self.assertEqual(game_model.turn, 2)
+        self.assertEqual(bytes(game_model.state_data), bytes(other._game.state_data))
+        self.assertEqual(list(TurnRecordModel.objects.filter(game_id=2).values_list('turn', flat=True)), [1, 2])
+        self.assertEqual(self.autosave.stats['stale'], 1)
+
+    def test_hero_abilities(self):
+        game = GameInstance(GameModel.objects.get(pk=1))
+        game.load_state()
+        game.add_ability('spell', 'blink')
+        self.autosave.save(game)
+        self.assertEqual(list(GameModel.objects.get(pk=1).hero.spells.all()), [])
+        game.exit_round()
+        self.autosave.schedule(game)
+        game.make_turn({'action': 'idle'})
+        # abilities are kept in the record, coalesced with later changes
+        self.autosave.save(game)
+        hero_model = GameModel.objects.get(pk=1).hero
+        self.assertEqual(list(hero_model.spells.values_list('code_name', flat=True)), ['blink'])
+
+    def test_state_taken_on_schedule(self):
+        self.autosave.schedule(self.game)
+        self.game.hero.receive_damage(10)
+        self.autosave.flush()
+        self.assertEqual(GameModel.objects.get(pk=2).hero.health, 67)
+
+    def test_save(self):
+        self.game.hero.receive_damage(10)
+        self.autosave.save(self.game)
+        self.assertFalse(self.autosave.is_pending(2))
+        self.assertEqual(GameModel.objects.get(pk=2).hero.health, 57)
+
+    def test_discard(self):
+        self.autosave.schedule(self.game)
+        self.autosave.discard(2)
+        with self.assertNumQueries(0):
+            self.autosave.flush()
+
+    def break_record(self, game_id: int):
+        """Make pending record of the game fail on write"""
+        record = self.autosave._pending[game_id]
+        self.autosave._pending[game_id] = record._replace(turns=[TurnRecord(1, {'action': object()}, 0)])
+
+    def test_failed_game_retried(self):
+        other_game = GameInstance(GameModel.objects.get(pk=1))
+        other_game.load_state()
+        other_game.hero.receive_damage(5)
+        self.autosave.schedule(other_game)
+        self.autosave.schedule(self.game)
+        self.break_record(2)
+        self.autosave.flush()
+        # other game of the batch is written anyway
+        self.assertEqual(GameModel.objects.get(pk=1).hero.health, 45)
+        self.assertEqual(self.autosave.stats['written'], 1)
+        self.assertTrue(self.autosave.is_pending(2))
+        for _ in range(self.autosave.max_attempts - 1):
+            self.autosave.flush()
+        self.assertFalse(self.autosave.is_pending(2))
+        self.assertEqual(self.autosave.stats['failures'], self.autosave.max_attempts)
+        self.assertEqual(self.autosave.stats['dropped'], 1)
+
+    def test_deleted_game_dropped(self):
+        self.autosave.schedule(self.game)
+        self.break_record(2)
+        GameModel.objects.get(pk=2).hero.delete()
+        self.autosave.flush()
+        self.assertFalse(self.autosave.is_pending(2))
+        self.assertEqual(self.autosave.stats['failures'], 0)
+        self.assertEqual(self.autosave.stats['dropped'], 1)
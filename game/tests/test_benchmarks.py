@@ -0,0 +1,40 @@
+"""Tests for benchmark suite"""
+
+from django.test import TestCase
+
+from game.mechanics.benchmarks import BenchmarkResult, build_benchmark_game, compare, measure, run_benchmarks
+from game.mechanics.handbook import Handbook
+from game.mechanics.simulation import init_worker
+
+
+class BenchmarksTestCase(TestCase):
+
+    def tearDown(self):
+        Handbook.instance().invalidate()
+
+    def test_measure(self):
+        calls = []
+        result = measure(lambda: calls.append(1), setup=lambda: calls.append(0), repeat=2)
+        self.assertGreater(result.calls, 0)
+        self.assertGreaterEqual(result.seconds, 0)
+        # setup is called before every call
+        self.assertEqual(calls[:4], [0, 1, 0, 1])
+
+    def test_compare(self):
+        results = [BenchmarkResult('slow', 1.5, 1), BenchmarkResult('fast', 0.5, 1),
+                   BenchmarkResult('same', 1.1, 1), BenchmarkResult('new', 1.0, 1)]
+        baseline = {'slow': 1.0, 'fast': 1.0, 'same': 1.0}
+        statuses = {comparison.name: comparison.status for comparison in compare(results, baseline, 0.2)}
+        self.assertEqual(statuses, {'slow': 'regression', 'fast': 'improvement', 'same': 'ok', 'new': 'new'})
+
+    def test_build_game(self):
+        init_worker()
+        game = build_benchmark_game(6, 10)
+        self.assertEqual(len(game.units), 10)
+        for unit in game.units.values():
+            self.assertGreater(game.distance(game.hero.position, unit.position.id), 1)
+
+    def test_run_filtered(self):
+        with self.assertNumQueries(0):
+            results = run_benchmarks(radii=[5], units=[3], name_filter='make_turn', repeat=1)
+        self.assertEqual([result.name for result in results], ['make_turn[r=5,units=3]'])
@@ -19,6 +19,12 @@ class BoardTestCase(TestCase):
         hexes_count = 3 * self.board.radius ** 2 - 3 * self.board.radius + 1
         self.assertEqual(len(self.board.items()), hexes_count)
 
+    def test_get_at(self):
+        self.assertIs(self.board.get_at(3, -5), self.board.get('3;-5'))
+        self.assertIsNone(self.board.get_at(3, 3))
+        self.assertEqual(self.board.index_of(3, 3), -1)
+        self.assertIsNone(self.board.get('3;3'))
+
     def test_load_state(self):
         load_hexes = [
             {'q': 1, 'r': 2, 'slot': slotObstacle},
@@ -119,6 +125,61 @@ class BoardTestCase(TestCase):
                 hexes_in_range = self.board.get_hexes_in_range(_data['hex'], _range[0])
                 self.assertTrue(len(hexes_in_range), _range[1])
 
+    def test_iter_hexes_in_range(self):
+        center_hex = self.board.get('0;0')
+        corner_hex = self.board.get(f'0;{self.board.radius - 1}')
+        for _range, count in [(0, 1), (1, 7), (2, 19), (5, 91), (11, 91)]:
+            self.assertEqual(len(list(self.board.iter_hexes_in_range(center_hex, _range))), count)
+        for _range, count in [(1, 4), (2, 9), (6, 47), (11, 91)]:
+            self.assertEqual(len(list(self.board.iter_hexes_in_range(corner_hex, _range))), count)
+        self.board.get('0;1').slot = Obstacle()
+        hex_ids = [_hex.id for _hex in self.board.iter_hexes_in_range(center_hex, 1, restricted=[slotObstacle])]
+        self.assertEqual(len(hex_ids), 6)
+        self.assertNotIn('0;1', hex_ids)
+        hex_ids = [_hex.id for _hex in self.board.iter_hexes_in_range(center_hex, 1, allowed=[slotObstacle])]
+        self.assertEqual(hex_ids, ['0;1'])
+
+    def test_iter_ring(self):
+        center_hex = self.board.get('0;0')
+        for _range in range(1, self.board.radius):
+            ring = list(self.board.iter_ring(center_hex, _range))
+            self.assertEqual(len(ring), 6 * _range)
+            self.assertTrue(all(self.board.distance(center_hex, _hex) == _range for _hex in ring))
+        corner_hex = self.board.get(f'0;{self.board.radius - 1}')
+        self.assertEqual(len(list(self.board.iter_ring(corner_hex, 1))), 3)
+
+    def test_occupancy(self):
+        hero = Hero(HeroModel.objects.first())
+        self.board.place_game_object(hero, '0;0')
+        self.board.get('1;0').slot = Obstacle()
+        self.assertEqual([_hex.id for _hex in self.board.iter_by_slots([slotHero])], ['0;0'])
+        self.assertEqual([_hex.id for _hex in self.board.iter_by_slots([slotObstacle, slotHero])], ['0;0', '1;0'])
+        self.assertEqual(len(list(self.board.iter_by_slots([slotEmpty]))), len(self.board.items()) - 2)
+
+        self.board.place_game_object(hero, '0;1')
+        self.assertEqual([_hex.id for _hex in self.board.iter_by_slots([slotHero])], ['0;1'])
+        self.board.remove_game_object(hero)
+        self.assertEqual(list(self.board.iter_by_slots([slotHero])), [])
+
+        self.board.add(Hex(1, 0))
+        self.assertEqual(list(self.board.iter_by_slots([slotObstacle])), [])
+        self.board.clear_board()
+        self.assertEqual(len(list(self.board.iter_by_slots([slotEmpty]))), len(self.board.items()))
+
+    def test_line_of_sight(self):
+        source = self.board.get('0;0')
+        self.board.get('1;0').slot = Obstacle()
+        self.assertFalse(self.board.has_line_of_sight(source, self.board.get('3;0')))
+        self.assertTrue(self.board.has_line_of_sight(source, self.board.get('1;0')))
+        self.assertTrue(self.board.has_line_of_sight(source, self.board.get('0;3')))
+        visible = {_hex.id for _hex in self.board.iter_visible(source, 3)}
+        self.assertNotIn('2;0', visible)
+        self.assertIn('1;0', visible)
+        self.assertNotIn('3;0', visible)
+        # obstacle removal changes visibility
+        self.board.get('1;0').slot = slotEmpty
+        self.assertIn('2;0', {_hex.id for _hex in self.board.iter_visible(source, 3)})
+
     def test_place_object(self):
         test_pk = 'test_pk'
         test_position = '3;-3'
@@ -162,3 +223,12 @@ class BoardTestCase(TestCase):
         state = self.board.get_state()
         self.assertEqual(state['radius'], self.board.radius)
         self.assertEqual(len(state['hexes']), len(self.board.items()))
+
+    def test_shared_topology(self):
+        other = Board(6)
+        self.assertIs(other.geometry, self.board.geometry)
+        self.assertIsNot(other.get('0;0'), self.board.get('0;0'))
+        self.board.get('0;0').slot = Obstacle()
+        self.assertEqual(other.get('0;0').slot, slotEmpty)
+        self.assertEqual(other.get_slots_mask([slotObstacle]), 0)
+        self.assertEqual(other.get_slots_mask([slotEmpty]), other.geometry.mask)
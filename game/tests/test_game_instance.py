@@ -5,7 +5,11 @@ from django.test import TestCase
 
 from game.mechanics.constants import slotUnit
 from game.mechanics.game_instance import GameInstance
-from game.models import GameModel
+from game.mechanics.game_objects import Obstacle
+from game.mechanics.game_sturctures import Sanctuary
+from game.mechanics.handbook import Handbook
+from game.mechanics.turn_log import SNAPSHOT_INTERVAL, build_turn_models
+from game.models import GameModel, HeroModel, TurnRecordModel, GameStructureModel
 
 
 class GameInstanceTestCase(TestCase):
@@ -36,3 +40,207 @@ class GameInstanceTestCase(TestCase):
         game_instance = GameInstance.load(1)
         self.assertEqual(game_instance._game.user, user)
         self.assertEqual(game_instance.hero.name, 'Genos')
+
+    def test_update_moves(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        units = {unit.position.id: unit for unit in game.units.values()}
+        moves = {position: unit.moves for position, unit in units.items()}
+        self.assertIn('-1;3', units['-1;4'].moves)
+
+        # hex out of ranges of all objects changed, nothing is recomputed
+        hero_moves = game.hero.moves
+        game.get_hex('-3;3').slot = Obstacle()
+        game.update_moves()
+        self.assertIs(game.hero.moves, hero_moves)
+        for position, unit in units.items():
+            self.assertIs(unit.moves, moves[position])
+
+        # hex in ranges of hero and unit at '-1;4' changed
+        game.move_object(units['0;4'], '-1;3')
+        game.update_moves()
+        self.assertIsNot(game.hero.moves, hero_moves)
+        self.assertNotIn('-1;3', game.hero.moves)
+        self.assertNotIn('-1;3', units['-1;4'].moves)
+        self.assertIsNot(units['0;4'].moves, moves['0;4'])
+        self.assertIs(units['0;0'].moves, moves['0;0'])
+
+    def test_save_state(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        game.hero.receive_damage(7)
+        unit = game.units[0]
+        unit.receive_damage(5)
+        # runtime stats don't touch models until saved
+        self.assertEqual(game.hero._object.health, 73)
+        self.assertEqual(unit._object.health, 25)
+        game.save_state()
+        self.assertEqual(HeroModel.objects.get(pk=2).health, 60)
+        # state is saved in binary format only
+        self.assertEqual(GameModel.objects.get(pk=2).state, '{}')
+
+        game = GameInstance.load(2)
+        self.assertEqual(game.hero.health, 60)
+        game.load_state()
+        self.assertEqual(game.hero.health, 60)
+        self.assertEqual(game.units[0].health, 20)
+
+    def test_snapshot_abilities(self):
+        other = GameInstance(GameModel.objects.get(pk=1))
+        self.game.start_round()
+        self.game.add_ability('spell', 'blink')
+        # game continued by another worker gets abilities, learnt in this one
+        other.restore_snapshot(self.game.dump_snapshot())
+        self.assertEqual(other.hero.spell_names, ['blink'])
+        self.assertIn('blink', other.hero.actions)
+        self.assertEqual([spell.code_name for spell in other.hero.unsaved_abilities['spell']], ['blink'])
+        other.before_closed()
+        self.assertEqual(list(HeroModel.objects.get(pk=1).spells.all()), [])
+
+        sanctuary = Sanctuary(GameStructureModel(code_name='sanctuary', assortment_range=2))
+        sanctuary.generate_assortment()
+        restored = Sanctuary(GameStructureModel(code_name='sanctuary'))
+        restored.restore_assortment(sanctuary.dump_assortment())
+        self.assertEqual(restored.assortment, sanctuary.assortment)
+
+    def test_units_approach_hero(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        field = game.pathfinder.get_distance_field(game.hero.position)
+        path_lengths = {pk: field[unit.position.index] for pk, unit in game.units.items()}
+        game.make_turn({'action': 'idle'})
+        for pk, unit in game.units.items():
+            self.assertLessEqual(field[unit.position.index], path_lengths[pk])
+
+    def test_get_changes(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        version = game.state_version
+        self.assertEqual(game.get_changes(version), (version, 0, set(), set(), set()))
+        self.assertIsNone(game.get_changes(version - 1))
+
+        game.make_turn({'action': 'move', 'target_hex': '1;2'})
+        changes = game.get_changes(version)
+        self.assertEqual(changes.version, version + 1)
+        changed_hexes = [_hex.id for _hex in game._board.iter_mask(changes.hexes_mask)]
+        self.assertIn('0;3', changed_hexes)
+        self.assertIn('1;2', changed_hexes)
+        self.assertIn('position', changes.hero_fields)
+        self.assertEqual('health' in changes.hero_fields, game.hero.health != 67)
+        self.assertEqual(game.get_changes(version + 1).hexes_mask, 0)
+
+        # unit killed
+        game.destroy_unit(game.units[3])
+        game.commit_changes()
+        self.assertEqual(game.get_changes(version).removed_units, {3})
+        self.assertNotIn(3, game.get_changes(version).units)
+
+        # changes of previous rounds are unknown
+        game.start_round()
+        self.assertIsNone(game.get_changes(version))
+
+    def test_iter_turn(self):
+        self.game.start_round()
+        version = self.game.state_version
+        events = list(self.game.iter_turn({'action': 'idle'}))
+        self.assertEqual([event.kind for event in events],
+                         ['hero'] + ['unit'] * len(self.game.units) + ['moves'])
+        self.assertEqual(self.game.state_version, version + 1)
+        # state version is closed even if turn is not iterated till the end
+        turn = self.game.iter_turn({'action': 'idle'})
+        self.assertEqual(next(turn).kind, 'hero')
+        turn.close()
+        self.assertEqual(self.game.state_version, version + 2)
+
+    def test_make_turns(self):
+        self.game.start_round()
+        version = self.game.state_version
+        responses = self.game.make_turns([{'action': 'idle'}, {'action': 'attack', 'target_hex': '0;0'},
+                                          {'action': 'idle'}])
+        # second action fails, so third one is not made
+        self.assertEqual([response.state for response in responses], ['success', 'failed'])
+        self.assertEqual(self.game.state_version, version + 2)
+
+    def test_replay_turns(self):
+        self.game.start_round()
+        state = self.game.dump_state()
+        self.game.make_turn({'action': 'idle'})
+        # hex to move to depends on random placement of units and obstacles
+        target_hex = self.game.hero.moves[0]
+        self.game.make_turns([{'action': 'move', 'target_hex': target_hex}, {'action': 'idle'}])
+        self.assertEqual([record.turn for record in self.game.turn_log], [1, 2, 3])
+        self.assertEqual(self.game.turn_log[1].action, {'action': 'move', 'target_hex': target_hex})
+
+        game = GameInstance(GameModel.objects.get(pk=1))
+        game.restore_state(state)
+        game.replay_turns(self.game.turn_log)
+        self.assertEqual(game.dump_state(), self.game.dump_state())
+        # random generators are in the same state too
+        self.assertEqual(game.rng.random(), self.game.rng.random())
+        self.assertEqual(game.turn_log, [])
+        # turns, which don't follow the state, are not replayed
+        self.assertEqual(game.replay_turns(self.game.turn_log), 0)
+
+    def test_replay_purchase(self):
+        GameStructureModel.objects.create(code_name='sanctuary', name='Sanctuary')
+        Handbook.instance().invalidate()
+        state = {'round': 1, 'hero': {'health': 50, 'position': '0;3'},
+                 'structures': [{'code_name': 'sanctuary', 'position': '0;2',
+                                 'assortment': [{'type': 'spell', 'pk': 3}]}]}
+        self.game.restore_state(state)
+        snapshot = self.game.dump_state()
+        # purchase is kept by runtime hero only
+        with self.assertNumQueries(0):
+            self.game.make_turn({'action': 'exit_sanctuary', 'purchase': 'blink'})
+        self.assertEqual(self.game.hero.spell_names, ['blink'])
+        self.assertEqual(list(HeroModel.objects.get(pk=1).spells.all()), [])
+
+        game = GameInstance(GameModel.objects.get(pk=1))
+        game.restore_state(snapshot)
+        self.assertEqual(game.hero.spell_names, [])
+        self.assertEqual(game.replay_turns(self.game.turn_log), 1)
+        self.assertEqual(game.dump_state(), self.game.dump_state())
+        self.assertEqual(game.hero.actions, ['move', 'attack', 'blink'])
+        # already learnt ability is not added again
+        game.add_ability('spell', 'blink')
+        self.assertEqual(game.hero.spell_names, ['blink'])
+
+    def test_abilities_written_on_save(self):
+        self.game.start_round()
+        self.game.add_ability('spell', 'blink')
+        # abilities, learnt in the round, are not kept until it's finished
+        self.game.save_state()
+        hero_model = HeroModel.objects.get(pk=1)
+        self.assertEqual(list(hero_model.spells.all()), [])
+        self.game.exit_round()
+        self.game.save_state()
+        self.assertEqual(list(hero_model.spells.values_list('code_name', flat=True)), ['blink'])
+        # hero of loaded game has them
+        game = GameInstance.load(1)
+        game.load_state()
+        self.assertEqual(game.hero.spell_names, ['blink'])
+        self.assertIsNone(game.dump_save()['hero_abilities'])
+
+    def test_snapshots(self):
+        self.game.start_round()
+        # state of new round can't be replayed
+        self.assertIsNotNone(self.game.dump_save()['state_data'])
+        for turn in range(1, SNAPSHOT_INTERVAL + 1):
+            self.game.make_turn({'action': 'idle'})
+            save = self.game.dump_save()
+            self.assertEqual([record.turn for record in save['turns']], [turn])
+            self.assertEqual(save['state_data'] is not None, turn == SNAPSHOT_INTERVAL)
+        self.assertEqual(save['snapshot_turn'], SNAPSHOT_INTERVAL)
+
+    def test_load_turns(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        game.save_state()
+        game.make_turns([{'action': 'idle'}, {'action': 'move', 'target_hex': '1;2'}])
+        TurnRecordModel.objects.bulk_create(build_turn_models(2, game.turn_log))
+
+        # game is recovered from snapshot and turns after it
+        loaded = GameInstance.load(2)
+        loaded.load_state()
+        self.assertEqual(loaded.turn, 2)
+        self.assertEqual(loaded.dump_state(), game.dump_state())
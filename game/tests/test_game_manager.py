@@ -0,0 +1,157 @@
+"""Tests for game manager"""
+
+from threading import Event, current_thread
+
+from django.test import TestCase
+
+from game.mechanics.actions import ActionResponse
+from game.mechanics.actors import MailboxFull
+from game.mechanics.game_manager import GameManager
+from game.models import GameModel
+
+
+class GameManagerTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.gm = GameManager.instance()
+        self.options = (self.gm.max_games, self.gm.max_weight, self.gm.idle_timeout, self.gm.db_workers)
+        self.gm.autosave.inline = True
+        self.gm.actors.inline = True
+        # test transaction is not visible in other threads
+        self.gm.db_workers = 0
+        for game_id in list(self.gm.game_instances):
+            self.gm.close_game(game_id)
+        self.gm.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'restores': 0}
+
+    def tearDown(self):
+        for game_id in list(self.gm.game_instances):
+            self.gm.close_game(game_id)
+        self.gm.max_games, self.gm.max_weight, self.gm.idle_timeout, self.gm.db_workers = self.options
+        self.gm.autosave.inline = False
+        self.gm.actors.inline = False
+
+    def test_get_game(self):
+        game = self.gm.get_game(2)
+        self.assertIs(self.gm.get_game('2'), game)
+        self.assertEqual(self.gm.get_stats(), {'hits': 1, 'misses': 1, 'evictions': 0, 'restores': 0, 'games': 1,
+                                               'weight': game.weight})
+        self.assertTrue(self.gm.close_game(2))
+        self.assertFalse(self.gm.close_game(2))
+        self.assertEqual(self.gm.get_stats()['weight'], 0)
+
+    def test_lru_eviction(self):
+        self.gm.max_games = 1
+        game = self.gm.get_game(2)
+        game.load_state()
+        game.hero.receive_damage(10)
+        self.gm.get_game(1)
+        self.assertEqual(list(self.gm.game_instances), ['1'])
+        self.assertEqual(self.gm.stats['evictions'], 1)
+        # evicted game was saved
+        self.assertEqual(GameModel.objects.get(pk=2).hero.health, 57)
+
+    def test_turn_after_lru_eviction(self):
+        self.gm.max_games = 1
+        state = self.gm.get_game(2).dump_state()
+        self.gm.get_game(1)
+        game = self.gm.get_game(2)
+        self.assertEqual(self.gm.stats['evictions'], 2)
+        # evicted game is loaded in the state it was saved in
+        self.assertEqual(game.dump_state(), state)
+        self.assertEqual(game.make_turn({'action': 'idle'}).state, ActionResponse.SUCCESS)
+
+    def test_turn_after_idle_eviction(self):
+        state = self.gm.get_game(2).dump_state()
+        self.gm.idle_timeout = -1
+        self.gm.get_game(1)
+        self.assertEqual(list(self.gm.game_instances), ['1'])
+        game = self.gm.get_game(2)
+        self.assertEqual(game.dump_state(), state)
+        self.assertEqual(game.make_turn({'action': 'idle'}).state, ActionResponse.SUCCESS)
+
+    def test_evicted_game_taken_back(self):
+        self.gm.actors.inline = False
+        self.gm.max_games = 1
+        game = self.gm.get_game(2)
+        # request of evicted game is still processed by its actor, so game is saved after it
+        release = Event()
+        running = self.gm.actors.submit('2', release.wait, 5)
+        self.gm.get_game(1)
+        self.assertEqual(list(self.gm.game_instances), ['1'])
+        self.assertIs(self.gm.get_game(2), game)
+        release.set()
+        running.result(5)
+        for game_id in ['1', '2']:
+            self.gm.actors.call(game_id, lambda: None)
+        self.assertEqual(self.gm.stats['evictions'], 2)
+        self.assertEqual(self.gm._evicting, {})
+        self.assertEqual(list(self.gm.game_instances), ['2'])
+
+    def test_evicted_game_with_full_mailbox(self):
+        self.gm.actors.inline = False
+        self.gm.max_games = 1
+        mailbox_size, self.gm.actors.mailbox_size = self.gm.actors.mailbox_size, 1
+        game = self.gm.get_game(2)
+        started, release = Event(), Event()
+        requests = [self.gm.actors.submit('2', lambda: started.set() or release.wait(5))]
+        # the first request is taken by worker, the second one fills the mailbox
+        self.assertTrue(started.wait(5))
+        requests.append(self.gm.actors.submit('2', release.wait, 5))
+        self.assertRaises(MailboxFull, self.gm.actors.submit, '2', release.wait, 5)
+        saved = Event()
+        threads = []
+        self.gm._on_evicted = lambda game_id, game_instance: (threads.append(current_thread().name), saved.set())
+        try:
+            self.gm.get_game(1)
+            # game is saved by db pool, not by caller, which can hold lock of its own game
+            self.assertTrue(saved.wait(5))
+        finally:
+            del self.gm._on_evicted
+            self.gm.actors.mailbox_size = mailbox_size
+            release.set()
+            for request in requests:
+                request.result(5)
+            evicting, self.gm._evicting = self.gm._evicting, {}
+        self.assertTrue(threads[0].startswith('game-db'))
+        self.assertEqual(evicting, {'2': game})
+
+    def test_idle_eviction(self):
+        self.gm.get_game(2)
+        self.gm.get_game(1)
+        self.gm.idle_timeout = -1
+        self.gm.get_game(1)
+        self.assertEqual(list(self.gm.game_instances), ['1'])
+        self.assertEqual(self.gm.stats['evictions'], 1)
+
+    def test_weight_eviction(self):
+        game = self.gm.get_game(2)
+        self.gm.max_weight = game.weight
+        self.gm.get_game(1)
+        self.assertEqual(list(self.gm.game_instances), ['1'])
+
+    def test_publish_schedules_autosave(self):
+        game = self.gm.get_game(2)
+        game.load_state()
+        game.make_turn({'action': 'idle'})
+        self.assertTrue(game.dirty)
+        self.gm.publish(2)
+        self.assertFalse(game.dirty)
+        self.assertTrue(self.gm.autosave.is_pending(2))
+        self.gm.autosave.flush()
+        self.assertFalse(self.gm.autosave.is_pending(2))
+        self.assertTrue(GameModel.objects.get(pk=2).state_data)
+
+    def test_prefetch_game(self):
+        self.assertTrue(self.gm.prefetch_game(2))
+        self.assertTrue(self.gm.prefetch_game('2'))
+        self.assertFalse(self.gm.prefetch_game(100))
+        with self.assertNumQueries(0):
+            self.gm.get_game(2)
+        self.assertEqual(self.gm.stats['hits'], 1)
+        self.assertEqual(self.gm.stats['misses'], 0)
+
+    def test_run_db(self):
+        self.assertEqual(self.gm.run_db(current_thread), current_thread())
+        self.gm.db_workers = 1
+        self.assertTrue(self.gm.run_db(lambda: current_thread().name).startswith('game-db'))
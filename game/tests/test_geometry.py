@@ -0,0 +1,59 @@
+from django.test import TestCase
+
+from ..mechanics.board import Board
+from ..mechanics.geometry import HexGeometry, get_geometry
+
+
+class HexGeometryTestCase(TestCase):
+
+    def setUp(self):
+        self.board = Board(5)
+        self.geometry = HexGeometry(5)
+
+    def test_distances(self):
+        hexes = self.board.values()
+        source = self.board.get('-2;3')
+        self.assertEqual(self.geometry.distances_from(source.index, (_hex.index for _hex in hexes)),
+                         [Board.distance(source, _hex) for _hex in hexes])
+
+    def test_pairwise_distances(self):
+        hexes = [self.board.get(hex_id) for hex_id in ['0;0', '1;-1', '-3;4', '4;0']]
+        matrix = self.geometry.pairwise_distances([_hex.index for _hex in hexes])
+        self.assertEqual(matrix, [[Board.distance(hex_a, hex_b) for hex_b in hexes] for hex_a in hexes])
+
+    def test_areas(self):
+        source = self.board.get('3;-1')
+        for _range in range(4):
+            disk = {self.board.get_by_index(index).id for index in self.geometry.get_disk(source.index, _range)}
+            self.assertEqual(disk, {_hex.id for _hex in self.board.values() if Board.distance(source, _hex) <= _range})
+            ring_mask = self.geometry.get_ring_mask(source.index, _range)
+            self.assertEqual({_hex.id for _hex in self.board.iter_mask(ring_mask)},
+                             {_hex.id for _hex in self.board.values() if Board.distance(source, _hex) == _range})
+
+    def test_ray(self):
+        ray = self.geometry.get_ray(self.board.get('0;0').index, self.board.get('3;-3').index)
+        self.assertEqual([self.board.get_by_index(index).id for index in ray], ['0;0', '1;-1', '2;-2', '3;-3'])
+        source, target = self.board.get('-3;1'), self.board.get('2;1')
+        ray = self.geometry.get_ray(source.index, target.index)
+        self.assertEqual(len(ray), Board.distance(source, target) + 1)
+        for index_a, index_b in zip(ray, ray[1:]):
+            self.assertEqual(self.geometry.distance(index_a, index_b), 1)
+        self.assertEqual(self.geometry.get_between_mask(source.index, target.index),
+                         sum(1 << index for index in ray[1:-1]))
+
+    def test_line(self):
+        start = self.board.get('0;1')
+        line = [self.board.get_by_index(index).id for index in self.geometry.get_line(start.index, 1, 0, 10)]
+        self.assertEqual(line, ['0;1', '1;1', '2;1', '3;1'])
+        self.assertEqual(self.geometry.get_line_mask(start.index, 0, 2, 3),
+                         1 << start.index | 1 << self.board.get('0;3').index)
+
+    def test_topology(self):
+        self.assertIs(get_geometry(5), get_geometry(5))
+        self.assertIsNot(get_geometry(5), get_geometry(4))
+        self.assertEqual(len(self.geometry.index_by_id), len(self.board))
+        self.assertEqual(bin(self.geometry.mask).count('1'), len(self.board))
+        for _hex in self.board.values():
+            self.assertEqual(self.geometry.ids[_hex.index], _hex.id)
+            self.assertEqual({self.board.get_by_index(index).id for index in self.geometry.neighbors[_hex.index]},
+                             {other.id for other in self.board.values() if Board.distance(_hex, other) == 1})
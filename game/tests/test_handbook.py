@@ -0,0 +1,60 @@
+"""Tests for handbook cache"""
+
+from django.test import TestCase
+
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.game_manager import GameManager
+from game.mechanics.handbook import Handbook, increment_shared_version
+from game.models import GameModel, SpellModel, UnitModel
+
+
+class HandbookTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.handbook = Handbook.instance()
+        self.handbook.load()
+
+    def test_loaded(self):
+        self.assertEqual(self.handbook.get_unit_template(2).name, 'Eagle')
+        self.assertEqual(self.handbook.get_spell_effects('path_of_fire'),
+                         {'path_length': 4.0, 'radius': 1.0, 'damage': 8.0})
+        self.assertEqual(self.handbook.get_item_by_name('Sword').pk, 1)
+        self.assertEqual(self.handbook.get_structure('exit').name, 'Exit')
+        self.assertRaises(UnitModel.DoesNotExist, self.handbook.get_unit_template, 100)
+        self.assertRaises(SpellModel.DoesNotExist, self.handbook.get_ability, 'spell', 'fireball')
+
+    def test_invalidate(self):
+        version = self.handbook.version
+        spell = SpellModel.objects.get(code_name='blink')
+        spell.name = 'Teleport'
+        spell.save()
+        self.assertEqual(self.handbook.get_ability('spell', 'blink').name, 'Teleport')
+        self.assertEqual(self.handbook.version, version + 1)
+
+    def test_changed_by_other_process(self):
+        self.assertFalse(self.handbook.check_due)
+        # other process changes spell, so signals of this process are not sent
+        SpellModel.objects.filter(code_name='blink').update(name='Teleport')
+        increment_shared_version()
+        self.assertEqual(self.handbook.get_ability('spell', 'blink').name, 'Blink')
+        gm = GameManager.instance()
+        options = (self.handbook.check_interval, gm.db_workers)
+        # test transaction is not visible in other threads
+        self.handbook.check_interval, gm.db_workers = 0, 0
+        try:
+            self.assertTrue(self.handbook.check_due)
+            # checked before request is passed to game actor
+            gm.prefetch_game(2)
+        finally:
+            gm.close_game(2)
+            self.handbook.check_interval, gm.db_workers = options
+        self.assertEqual(self.handbook.get_ability('spell', 'blink').name, 'Teleport')
+        self.assertFalse(self.handbook.check_due)
+
+    def test_no_queries_in_round(self):
+        game = GameInstance(GameModel.objects.get(pk=2))
+        game.load_state()
+        with self.assertNumQueries(0):
+            game.start_round()
+            game.make_turn({'action': 'idle'})
@@ -0,0 +1,63 @@
+"""Tests for request phases instrumentation"""
+
+from django.test import TestCase
+
+from game.mechanics.game_manager import GameManager
+from game.mechanics.instrumentation import Instrumentation, Histogram, NULL_CONTEXT
+from game.models import GameModel
+
+
+class InstrumentationTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.instrumentation = Instrumentation.instance()
+        self.sample_rate = self.instrumentation.sample_rate
+        self.instrumentation.sample_rate = 1
+        self.instrumentation.reset()
+
+    def tearDown(self):
+        self.instrumentation.sample_rate = self.sample_rate
+        self.instrumentation.reset()
+
+    def test_phases(self):
+        with self.instrumentation.trace('request'):
+            with self.instrumentation.phase('outer'):
+                with self.instrumentation.phase('inner'):
+                    list(GameModel.objects.all())
+                list(GameModel.objects.all())
+        histograms = self.instrumentation.get_stats()['histograms']
+        self.assertEqual(set(histograms), {'request', 'request.outer', 'request.inner'})
+        self.assertEqual(histograms['request']['queries_per_call'], 2)
+        self.assertEqual(histograms['request.outer']['queries_per_call'], 2)
+        self.assertEqual(histograms['request.inner']['queries_per_call'], 1)
+        self.assertLessEqual(histograms['request.inner']['max_ms'], histograms['request.outer']['max_ms'])
+
+    def test_not_sampled(self):
+        self.instrumentation.sample_rate = 0
+        self.assertIs(self.instrumentation.phase('outside'), NULL_CONTEXT)
+        with self.instrumentation.trace('request'):
+            self.assertIs(self.instrumentation.phase('inner'), NULL_CONTEXT)
+        stats = self.instrumentation.get_stats()
+        self.assertEqual((stats['traces'], stats['sampled'], stats['histograms']), (1, 0, {}))
+
+    def test_turn_phases(self):
+        gm = GameManager.instance()
+        with self.instrumentation.trace('turn'):
+            game = gm.get_game(2)
+            game.start_round()
+            game.make_turn({'action': 'idle', 'target_hex': game.hero.position.id})
+        gm.close_game(2)
+        histograms = self.instrumentation.get_stats()['histograms']
+        for name in ['turn.load_game', 'turn.hero_action', 'turn.plan_units', 'turn.update_moves']:
+            self.assertEqual(histograms[name]['count'], 1)
+        self.assertGreater(histograms['turn.load_game']['queries_per_call'], 0)
+        self.assertEqual(histograms['turn.update_moves']['queries_per_call'], 0)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for ms in [0.05, 0.3, 0.3, 2000]:
+            histogram.add(ms / 1000, 1)
+        self.assertEqual(histogram.percentile(50), 0.5)
+        self.assertEqual(histogram.percentile(100), 2000)
+        self.assertEqual(histogram.to_dict()['buckets'], {'<=0.1': 1, '<=0.5': 2, '>1000': 1})
@@ -0,0 +1,55 @@
+from django.test import TestCase
+
+from ..mechanics.board import Board
+from ..mechanics.game_objects import Obstacle
+from ..mechanics.pathfinding import Pathfinder, UNREACHABLE
+
+
+class PathfinderTestCase(TestCase):
+
+    def setUp(self):
+        self.board = Board(4)
+        self.pathfinder = Pathfinder(self.board)
+        # wall between 0;-2 and 0;2, which is passed around by the edge of the board
+        for hex_id in ['-1;0', '0;0', '1;0', '-2;1', '2;-1']:
+            self.board.get(hex_id).slot = Obstacle()
+
+    def test_distance_field(self):
+        target = self.board.get('0;2')
+        field = self.pathfinder.get_distance_field(target)
+        self.assertEqual(field[target.index], 0)
+        self.assertEqual(field[self.board.get('0;1').index], 1)
+        self.assertEqual(field[self.board.get('0;0').index], UNREACHABLE)
+        self.assertEqual(field[self.board.get('0;-2').index], 7)
+        self.assertEqual(Board.distance(self.board.get('0;-2'), target), 4)
+
+    def test_distance_field_cached(self):
+        target = self.board.get('0;2')
+        field = self.pathfinder.get_distance_field(target)
+        self.assertIs(self.pathfinder.get_distance_field(target), field)
+        self.board.get('0;-1').slot = Obstacle()
+        self.assertIsNot(self.pathfinder.get_distance_field(target), field)
+
+    def test_unreachable(self):
+        target = self.board.get('0;2')
+        for neighbor in self.board.get_neighbors(target):
+            neighbor.slot = Obstacle()
+        self.assertEqual(self.pathfinder.get_path_length(self.board.get('0;-2'), target), UNREACHABLE)
+        self.assertIsNone(self.pathfinder.find_path(self.board.get('0;-2'), target))
+
+    def test_find_path(self):
+        source, target = self.board.get('0;-2'), self.board.get('0;2')
+        path = self.pathfinder.find_path(source, target)
+        self.assertEqual(path[0], source)
+        self.assertEqual(path[-1], target)
+        self.assertEqual(len(path) - 1, self.pathfinder.get_path_length(source, target))
+        for hex_a, hex_b in zip(path, path[1:]):
+            self.assertEqual(Board.distance(hex_a, hex_b), 1)
+            self.assertNotIsInstance(hex_b.slot, Obstacle)
+
+    def test_best_step(self):
+        source, target = self.board.get('0;-2'), self.board.get('0;2')
+        candidates = list(self.board.iter_hexes_in_range(source, 1))
+        step = self.pathfinder.get_best_step(source, target, candidates)
+        self.assertEqual(self.pathfinder.get_path_length(step, target), 6)
+        self.assertIsNone(self.pathfinder.get_best_step(target, target, candidates))
@@ -0,0 +1,65 @@
+"""Tests for game serializers"""
+
+from django.test import TestCase
+
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.handbook import Handbook
+from game.models import GameModel
+from game.serializers import GameInstanceSerializer, HeroSerializer, UnitSerializer, serialize_game_changes
+
+
+class GameInstanceSerializerTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        Handbook.instance().invalidate()
+        self.game = GameInstance(GameModel.objects.get(pk=1))
+        self.game.start_round()
+
+    def test_hero_matches_model_serializer(self):
+        data = GameInstanceSerializer(self.game).data
+        expected = {**HeroSerializer(self.game.hero._object).data, **self.game.hero.runtime_state()}
+        self.assertDictEqual(dict(data['hero']), dict(expected))
+
+    def test_units_match_model_serializer(self):
+        data = GameInstanceSerializer(self.game).data
+        self.assertTrue(self.game.units)
+        for pk, unit in self.game.units.items():
+            expected = {**UnitSerializer(unit._object).data, **unit.runtime_state()}
+            self.assertDictEqual(dict(data['units'][pk]), dict(expected))
+
+    def test_hero_abilities_delta(self):
+        version = self.game.state_version
+        self.game.add_ability('spell', 'blink')
+        self.game.commit_changes()
+        hero = serialize_game_changes(self.game, version)['delta']['hero']
+        self.assertEqual(set(hero), {'spells'})
+        self.assertEqual([spell['code_name'] for spell in hero['spells']], ['blink'])
+        self.assertEqual(serialize_game_changes(self.game, self.game.state_version)['delta']['hero'], {})
+
+    def test_delta_after_restore(self):
+        game = GameInstance.load(2)
+        game.load_state()
+        game.make_turns([{'action': 'idle'}] * 3)
+        version = game.state_version
+        # instance of another process restores the snapshot, having its own versions made
+        other = GameInstance.load(2)
+        other.load_state()
+        other.restore_snapshot(game.dump_snapshot())
+        self.assertEqual(other.state_version, version)
+        delta = serialize_game_changes(other, version)['delta']
+        self.assertEqual((delta['hexes'], delta['units'], delta['hero']), ({}, {}, {}))
+        other.make_turn({'action': 'move', 'target_hex': other.hero.moves[0]})
+        hero = serialize_game_changes(other, version)['delta']['hero']
+        self.assertEqual(hero['position'], other.hero.position.id)
+        # instance, which versions are ahead of the snapshot, doesn't repeat them
+        ahead = other.state_version
+        game.restore_snapshot(other.dump_snapshot())
+        other.restore_snapshot(game.dump_snapshot())
+        self.assertGreater(other.state_version, ahead)
+        self.assertIn('hero', serialize_game_changes(other, version))
+
+    def test_no_queries_when_warm(self):
+        GameInstanceSerializer(self.game).data
+        with self.assertNumQueries(0):
+            GameInstanceSerializer(self.game).data
@@ -0,0 +1,97 @@
+"""Tests for session stores"""
+
+import os
+import tempfile
+import threading
+
+from django.test import TestCase, SimpleTestCase
+
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.game_manager import GameManager
+from game.mechanics.session_store import LocalMemoryStore, FileStore, SocketStore, SessionStoreServer, \
+    SessionRecord
+
+
+class SessionStoresTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.server = SessionStoreServer(os.path.join(self.tmp_dir.name, 'store.sock'))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.stores = [
+            LocalMemoryStore(),
+            FileStore(os.path.join(self.tmp_dir.name, 'games')),
+            SocketStore(self.server.server_address),
+        ]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_records(self):
+        record = SessionRecord(3, 'worker:1', b'snapshot')
+        for store in self.stores:
+            self.assertIsNone(store.get('1'))
+            self.assertIsNone(store.get_meta('1'))
+            store.set('1', record)
+            self.assertEqual(store.get('1'), record)
+            self.assertEqual(store.get_meta('1'), SessionRecord(3, 'worker:1', b''))
+            store.delete('1')
+            self.assertIsNone(store.get('1'))
+
+    def test_lock(self):
+        for store in self.stores:
+            events = []
+
+            def locked_append(value):
+                with store.lock('1'):
+                    events.append(value)
+
+            with store.lock('1'):
+                thread = threading.Thread(target=locked_append, args=('second',))
+                thread.start()
+                thread.join(0.2)
+                events.append('first')
+            thread.join()
+            self.assertEqual(events, ['first', 'second'])
+
+    def test_locks_released(self):
+        store = LocalMemoryStore()
+        with store.lock('1'):
+            self.assertEqual(list(store._locks), ['1'])
+        store.delete('1')
+        self.assertEqual(list(store._locks), [])
+
+        # lock is kept, while another process can wait for it
+        file_store = self.stores[1]
+        with file_store.lock('1'):
+            file_store.delete('1')
+        self.assertTrue(os.path.exists(file_store._file_path('1', 'lock')))
+
+
+class GameManagerSyncTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.gm = GameManager.instance()
+        self.gm.close_game('2')
+
+    def tearDown(self):
+        self.gm.close_game('2')
+
+    def test_restore_from_store(self):
+        game = self.gm.get_game('2')
+        game.load_state()
+        self.gm.publish('2')
+        version = game.snapshot_version
+
+        # another worker changes the game
+        other_game = GameInstance.load(2)
+        other_game.restore_snapshot(self.gm.store.get('2').snapshot)
+        other_game.move_object(other_game.hero, '1;2')
+        self.gm.store.set('2', SessionRecord(version + 1, 'other:1', other_game.dump_snapshot()))
+
+        self.assertIs(self.gm.get_game('2'), game)
+        self.assertEqual(game.hero.position.id, '1;2')
+        self.assertEqual(game.snapshot_version, version + 1)
@@ -0,0 +1,39 @@
+"""Tests for headless games simulation"""
+
+from django.test import TestCase
+
+from game.mechanics.handbook import Handbook
+from game.mechanics.simulation import init_worker, percentile, simulate_game, summarize
+
+
+class SimulationTestCase(TestCase):
+
+    def setUp(self):
+        init_worker()
+
+    def tearDown(self):
+        Handbook.instance().invalidate()
+
+    def test_no_queries(self):
+        with self.assertNumQueries(0):
+            for seed in range(3):
+                simulate_game(seed, 'aggressive', max_turns=50)
+                simulate_game(seed, 'random', max_turns=50, hero_pk=2)
+
+    def test_reproducible(self):
+        result = simulate_game(7, 'random', max_turns=30)
+        self.assertEqual(simulate_game(7, 'random', max_turns=30)[:4], result[:4])
+        self.assertEqual(result.turns, len(result.latencies))
+
+    def test_summarize(self):
+        results = [simulate_game(seed, 'aggressive', max_turns=20) for seed in range(4)]
+        report = summarize(results, 1.0)
+        self.assertEqual(report['games'], 4)
+        self.assertEqual(report['turns'], sum(result.turns for result in results))
+        self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['p99'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
@@ -0,0 +1,85 @@
+"""Tests for binary game state encoding"""
+
+import json
+import struct
+
+from django.test import TestCase
+
+from game.mechanics.state_codec import encode_state, decode_state, StateCodecError
+from game.models import GameModel
+
+
+class StateCodecTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.json_state = GameModel.objects.get(pk=2).state
+        self.game_state = json.loads(self.json_state)
+        self.game_state['round'] = 4
+        for pk, unit in enumerate(self.game_state['units']):
+            unit['pk'] = pk
+        self.game_state['hero']['abilities'] = {'spell': [1], 'skill': [], 'item': [2, 3]}
+        self.game_state['hero']['unsaved_abilities'] = {'spell': [], 'skill': [1], 'item': []}
+        for structure in self.game_state['structures']:
+            structure['assortment'] = [{'type': 'spell', 'pk': 2}, {'type': 'skill', 'pk': 1}]
+
+    def assertStatesEqual(self, decoded, expected):
+        sort_key = lambda _hex: (_hex['q'], _hex['r'])
+        self.assertEqual(decoded['round'], expected['round'])
+        self.assertEqual(decoded['hero'], expected['hero'])
+        self.assertEqual(sorted(decoded['hexes'], key=sort_key), sorted(expected['hexes'], key=sort_key))
+        self.assertEqual(decoded['units'], expected['units'])
+        self.assertEqual(decoded['structures'], expected['structures'])
+
+    def test_round_trip(self):
+        for compress in [True, False]:
+            data = encode_state(self.game_state, 6, compress=compress)
+            self.assertLess(len(data), len(self.json_state) // 4)
+            self.assertStatesEqual(decode_state(data), self.game_state)
+
+    def test_decode_version_1(self):
+        self.game_state['turn'] = 5
+        data = encode_state(self.game_state, 6, compress=False)
+        # version 1 has no turn and state version after header and round, radius, hero health, hero position
+        turn_offset = 4 + 11
+        decoded = decode_state(b'AC\x01\x00' + data[4:turn_offset] + data[turn_offset + 8:])
+        # abilities and assortments are added in version 3
+        for key in ['abilities', 'unsaved_abilities']:
+            del self.game_state['hero'][key]
+        for structure in self.game_state['structures']:
+            del structure['assortment']
+        self.assertStatesEqual(decoded, self.game_state)
+        self.assertEqual(decoded['turn'], 0)
+        self.assertEqual(decode_state(data)['turn'], 5)
+
+    def test_large_pks(self):
+        self.game_state['hero']['abilities']['item'] = [70000]
+        self.game_state['structures'][0]['assortment'] = [{'type': 'spell', 'pk': 100000}]
+        self.assertStatesEqual(decode_state(encode_state(self.game_state, 6)), self.game_state)
+
+    def test_decode_version_3(self):
+        self.game_state['structures'] = []
+        self.game_state['hero']['abilities'] = {'spell': [7], 'skill': [], 'item': []}
+        self.game_state['hero']['unsaved_abilities'] = {'spell': [], 'skill': [], 'item': []}
+        data = encode_state(self.game_state, 6, compress=False)
+        # version 3 has 2 bytes pks of abilities, which are at the end of the state without structures
+        abilities_size = 6 * 2 + 4
+        abilities = struct.pack('<HH5H', 1, 7, 0, 0, 0, 0, 0)
+        # and no state version after turn
+        version_offset = 4 + 15
+        decoded = decode_state(b'AC\x03\x00' + data[4:version_offset] + data[version_offset + 4:-abilities_size]
+                               + abilities)
+        self.assertStatesEqual(decoded, self.game_state)
+        self.assertNotIn('state_version', decoded)
+
+    def test_state_version(self):
+        self.game_state['state_version'] = 12
+        self.assertEqual(decode_state(encode_state(self.game_state, 6))['state_version'], 12)
+
+    def test_decode_json(self):
+        self.assertEqual(decode_state(self.json_state.encode()), json.loads(self.json_state))
+        self.assertEqual(decode_state(b''), {})
+
+    def test_decode_failed(self):
+        self.assertRaises(StateCodecError, decode_state, b'XX\x01\x00')
+        self.assertRaises(StateCodecError, decode_state, b'A')
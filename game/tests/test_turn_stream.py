@@ -0,0 +1,71 @@
+"""Tests for streaming of turns over persistent connection"""
+
+import threading
+from queue import Queue
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+
+from game.mechanics.game_manager import GameManager
+from game.mechanics.turn_stream import TurnStreamClient, TurnStreamRequestHandler, TurnStreamServer
+
+
+class TurnStreamTestCase(TransactionTestCase):
+    # server threads use their own db connections, so data must be committed
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.gm = GameManager.instance()
+        self.gm.autosave.inline = True
+        self.server = TurnStreamServer(('127.0.0.1', 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.token = Token.objects.create(user=User.objects.get(pk=1))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.gm.autosave.flush()
+        for game_id in list(self.gm.game_instances):
+            self.gm.close_game(game_id)
+        self.gm.autosave.inline = False
+
+    def test_stream_turn(self):
+        game = self.gm.get_game(2)
+        game.start_round()
+        self.gm.publish(2)
+        version = game.state_version
+        with TurnStreamClient(self.server.server_address, self.token.key) as client:
+            self.assertEqual(client.user_id, 1)
+            events = list(client.make_turn({'game_id': 2, 'action': 'idle', 'version': version}))
+            kinds = [event['event'] for event in events]
+            self.assertEqual(kinds[0], 'hero')
+            self.assertEqual(kinds[-2:], ['moves', 'done'])
+            self.assertEqual(set(kinds[1:-2]), {'unit'} if len(kinds) > 3 else set())
+            self.assertEqual({event['unit'] for event in events if event['event'] == 'unit'}, set(game.units))
+            self.assertEqual(events[-1]['delta']['version'], version + 1)
+            self.assertEqual(events[-2]['moves'], game.hero.moves)
+
+            # connection is kept for next turns
+            events = list(client.make_turn({'game_id': 2, 'action': 'idle'}))
+            self.assertIn('board', events[-1])
+            self.assertEqual(game.state_version, version + 2)
+
+    def test_events_queued(self):
+        game = self.gm.get_game(2)
+        game.start_round()
+        # turn is made without waiting for client, events are sent after the game is unlocked
+        events = Queue()
+        TurnStreamRequestHandler._stream_turn(self.gm, '2', {'game_id': 2, 'action': 'idle'}, events)
+        kinds = [message['event'] for message in iter(events.get_nowait, None)]
+        self.assertEqual(kinds[0], 'hero')
+        self.assertEqual(kinds[-2:], ['moves', 'done'])
+        self.assertTrue(events.empty())
+
+    def test_errors(self):
+        with self.assertRaises(PermissionError):
+            TurnStreamClient(self.server.server_address, 'wrong')
+        with TurnStreamClient(self.server.server_address, self.token.key) as client:
+            self.assertEqual([event['event'] for event in client.make_turn({'action': 'idle'})], ['error'])
+            events = list(client.make_turn({'game_id': 100, 'action': 'idle'}))
+            self.assertEqual(events, [{'event': 'error', 'detail': 'Game 100 not found'}])
@@ -0,0 +1,43 @@
+"""Tests for units turn planning"""
+
+from django.test import TestCase
+
+from game.mechanics.board import Board
+from game.mechanics.game_instance import GameInstance
+from game.mechanics.turns import TurnPlanner
+from game.models import GameModel
+
+
+class TurnPlannerTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.game = GameInstance(GameModel.objects.get(pk=2))
+        self.game.load_state()
+
+    def test_plan(self):
+        plan = TurnPlanner(self.game).plan()
+        self.assertCountEqual([request['source'] for request in plan], self.game.units.values())
+        hero = self.game.hero
+        for request in plan:
+            unit = request['source']
+            if Board.distance(unit.position, hero.position) <= unit.attack_range:
+                self.assertEqual(request['action'], 'attack')
+                self.assertEqual(request['target_hex'], hero.position.id)
+        # attacks go first
+        actions = [request['action'] for request in plan]
+        self.assertEqual(actions, sorted(actions, key=lambda action: action != 'attack'))
+
+    def test_no_move_conflicts(self):
+        hero_position = self.game._board.get('0;-3')
+        self.game.move_object(self.game.hero, hero_position.id)
+        plan = TurnPlanner(self.game).plan()
+        targets = [request['target_hex'] for request in plan if request['action'] == 'move']
+        self.assertTrue(targets)
+        self.assertEqual(len(targets), len(set(targets)))
+        # every move gets unit closer to hero
+        field = self.game.pathfinder.get_distance_field(hero_position)
+        for request in plan:
+            if request['action'] == 'move':
+                unit = request['source']
+                self.assertLess(field[self.game._board[request['target_hex']].index], field[unit.position.index])
@@ -0,0 +1,53 @@
+"""Tests for game api views"""
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from game.mechanics.game_manager import GameManager
+
+
+class GameBatchActionTestCase(TestCase):
+    fixtures = ['test_fixture.json']
+
+    def setUp(self):
+        self.gm = GameManager.instance()
+        # test transaction is not visible in other threads
+        self.options = (self.gm.actors.inline, self.gm.db_workers, self.gm.autosave.inline)
+        self.gm.actors.inline, self.gm.db_workers, self.gm.autosave.inline = True, 0, True
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=1))
+
+    def tearDown(self):
+        for game_id in list(self.gm.game_instances):
+            self.gm.close_game(game_id)
+        self.gm.actors.inline, self.gm.db_workers, self.gm.autosave.inline = self.options
+
+    def test_batch(self):
+        game = self.gm.get_game(2)
+        game.start_round()
+        version = game.state_version
+        actions = [{'action': 'idle'}, {'action': 'idle'}, {'action': 'attack', 'target_hex': '0;0'},
+                   {'action': 'idle'}]
+        response = self.client.post('/game/batch/', {'game_id': 2, 'version': version, 'actions': actions},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([step['state'] for step in response.data['steps']], ['success', 'success', 'failed'])
+        self.assertEqual(response.data['completed'], 2)
+        self.assertEqual(response.data['delta']['version'], version + 3)
+        self.assertEqual(game.state_version, version + 3)
+
+    def test_bad_actions(self):
+        for actions in [None, [], ['idle'], [{'action': 'idle'}] * 51]:
+            response = self.client.post('/game/batch/', {'game_id': 2, 'actions': actions}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_version(self):
+        game = self.gm.get_game(2)
+        game.start_round()
+        version = game.state_version
+        for url, data in [('/game/', {'action': 'idle'}), ('/game/batch/', {'actions': [{'action': 'idle'}]})]:
+            response = self.client.post(url, {'game_id': 2, 'version': 'latest', **data}, format='json')
+            self.assertEqual(response.status_code, 400)
+        # turn is not made
+        self.assertEqual(game.state_version, version)
@@ -1,13 +1,41 @@
+from typing import Callable, Optional, Tuple
+
 from django.contrib.auth.models import User
 
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from game.serializers import UserSerializer, GameInstanceSerializer
+from rest_framework.exceptions import APIException, NotFound, Throttled, ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from game.serializers import UserSerializer, GameInstanceSerializer, parse_version, serialize_game_changes
 from .mechanics.actions import ActionResponse
+from .mechanics.actors import ActorTimeout, MailboxFull
 from .mechanics.game_manager import GameManager
+from .mechanics.instrumentation import Instrumentation
+
+
+class ServiceUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Service temporarily unavailable, try again later.'
+    default_code = 'service_unavailable'
+
+
+def call_actor(game_id: str, handler: Callable, *args, prefetch: bool = True):
+    """
+    Run handler by actor of the game. Too many waiting requests for the game are throttled, requests, which are
+    not processed in time, are answered with 503.
+    Game is loaded from db before, unless <prefetch> is False, so db stalls don't hold actor workers
+    """
+    gm = GameManager.instance()
+    if prefetch and not gm.prefetch_game(game_id):
+        raise NotFound(f'Game {game_id} not found')
+    try:
+        return gm.actors.call(game_id, handler, *args)
+    except MailboxFull as err:
+        raise Throttled(detail=str(err))
+    except ActorTimeout as err:
+        raise ServiceUnavailable(detail=str(err))
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -27,7 +55,7 @@ class GameViewSet(viewsets.ViewSet):
     def list_by_user(self, request):
         """List games, created by current user.
         Pass auth token to query's header to define required user"""
-        user_games = self.gm.get_games_by_user(request.user)
+        user_games = self.gm.run_db(lambda: list(self.gm.get_games_by_user(request.user).select_related('hero')))
         games_info = [{
             'game_id': _game.pk,
             'created': _game.created.strftime('%d %b %y %H:%M'),
@@ -41,50 +69,69 @@ class GameViewSet(viewsets.ViewSet):
     def load_state(self, request):
         """List games, created by current user.
         Pass auth token to query's header to define required user"""
-        game_instance = self.gm.get_game(str(request.data['game_id']))
-        game_instance.load_state()
-        serializer = GameInstanceSerializer(game_instance)
-        return Response(serializer.data)
+        return Response(call_actor(str(request.data['game_id']), self._load_state, str(request.data['game_id'])))
+
+    def _load_state(self, game_id: str) -> dict:
+        with self.gm.lock_game(game_id):
+            game_instance = self.gm.get_game(game_id)
+            game_instance.load_state()
+            self.gm.publish(game_id)
+            return GameInstanceSerializer(game_instance).data
 
     @action(detail=False, methods=['post'])
     def save_state(self, request):
         """List games, created by current user.
         Pass auth token to query's header to define required user"""
-        game_instance = self.gm.get_game(str(request.data['game_id']))
-        game_instance.save_state()
+        game_id = str(request.data['game_id'])
+        call_actor(game_id, self._save_state, game_id)
+        # write is waited for outside of game actor
+        self.gm.autosave.wait_saved(game_id)
         return Response({'saved': True})
 
+    def _save_state(self, game_id: str):
+        with self.gm.lock_game(game_id):
+            game_instance = self.gm.get_game(game_id)
+            self.gm.autosave.schedule(game_instance)
+
     @action(detail=False, methods=['post'])
     def close_game(self, request, pk=None):
         """Removes initialized game_instance from game_manager"""
         # need to pass not game_id but uuid. It removes bug, when same game initialized in two browser tabs
         # also need to handle case when browser tab is closed
         print(f'trying to close game {request.data["game_id"]}')
-        removed = str(request.data['game_id']) in self.gm.game_instances
-        if removed:
-            self.gm.game_instances[str(request.data['game_id'])].before_closed()
-            del self.gm.game_instances[str(request.data['game_id'])]
+        game_id = str(request.data['game_id'])
+        removed = call_actor(game_id, self.gm.close_game, game_id, prefetch=False)
         return Response({'removed': removed})
 
     def create(self, request):
         """Create new game for current user"""
-        game_instance = self.gm.new_game(request.user, request.data['hero'])
+        game_instance = self.gm.run_db(self.gm.new_game, request.user, request.data['hero'])
         game_instance.start_round()
+        self.gm.publish(game_instance._game.pk)
         serializer = GameInstanceSerializer(game_instance)
         return Response(serializer.data)
 
     def retrieve(self, request, pk=None):
         """Get game by given id"""
         print(f'trying to load game {pk}')
-        game_instance = self.gm.get_game(str(pk))
-        game_instance.start_round()
-        serializer = GameInstanceSerializer(game_instance)
-        return Response(serializer.data)
+        with Instrumentation.instance().trace('retrieve'):
+            return Response(call_actor(str(pk), self._retrieve, str(pk)))
+
+    def _retrieve(self, game_id: str) -> dict:
+        instrumentation = Instrumentation.instance()
+        with self.gm.lock_game(game_id):
+            with instrumentation.phase('get_game'):
+                game_instance = self.gm.get_game(game_id)
+            game_instance.start_round()
+            self.gm.publish(game_id)
+            with instrumentation.phase('serialize'):
+                return GameInstanceSerializer(game_instance).data
 
     def destroy(self, request, pk=None):
         """Delete game by given id"""
         print(f'deleting game {pk}')
-        deleted = self.gm.delete_game(str(pk))
+        call_actor(str(pk), self.gm.close_game, str(pk), prefetch=False)
+        deleted = self.gm.run_db(self.gm.delete_game, str(pk))
         return Response({'deleted': deleted})
 
 
@@ -98,11 +145,89 @@ class GameAction(APIView):
     def post(self, request):
         """
         Handle actions
+        If client passes <version> of game state it knows, only changes since that version are returned in <delta>.
+        Full state is returned if changes are unknown for server
         """
-        print('request data', request.data)
-        game_instance = self.gm.get_game(str(request.data['game_id']))
-        action_response: ActionResponse = game_instance.make_turn(request.data)
-        response_data = {**GameInstanceSerializer(game_instance).data, 'action_data': action_response.to_dict()}
-        if action_response.state == ActionResponse.GAME_OVER:
-            self.gm.delete_game(str(request.data['game_id']))
-        return Response(response_data)
+        game_id = str(request.data['game_id'])
+        version = parse_version(request.data.get('version'))
+        with Instrumentation.instance().trace('game_action'):
+            response_data, game_over = call_actor(game_id, self._make_turn, game_id, request.data, version)
+            if game_over:
+                self.gm.run_db(self.gm.delete_game, game_id)
+            return Response(response_data)
+
+    def _make_turn(self, game_id: str, action_data: dict, version: Optional[int]) -> Tuple[dict, bool]:
+        instrumentation = Instrumentation.instance()
+        with self.gm.lock_game(game_id):
+            with instrumentation.phase('get_game'):
+                game_instance = self.gm.get_game(game_id)
+            with instrumentation.phase('make_turn'):
+                action_response: ActionResponse = game_instance.make_turn(action_data)
+            self.gm.publish(game_id)
+            with instrumentation.phase('serialize'):
+                response_data = serialize_game_changes(game_instance, version)
+            response_data['action_data'] = action_response.to_dict()
+        return response_data, action_response.state == ActionResponse.GAME_OVER
+
+
+class GameBatchAction(APIView):
+    """
+    View for several game actions in a row, like queued moves of hero
+    """
+    permission_classes = (IsAuthenticated,)
+    gm = GameManager.instance()
+    max_actions = 50
+
+    def post(self, request):
+        """
+        Handle ordered list of <actions>, each with the same fields as action of GameAction.
+        Actions are made until the first failure or game over. Results of made actions are returned in <steps>,
+        game state is returned once, as delta since <version> if it's passed
+        """
+        game_id = str(request.data['game_id'])
+        actions = request.data.get('actions')
+        if not isinstance(actions, list) or not actions or not all(isinstance(item, dict) for item in actions):
+            raise ValidationError({'actions': 'Non-empty list of actions is required'})
+        if len(actions) > self.max_actions:
+            raise ValidationError({'actions': f'No more than {self.max_actions} actions are allowed'})
+        version = parse_version(request.data.get('version'))
+        with Instrumentation.instance().trace('game_batch_action'):
+            response_data, game_over = call_actor(game_id, self._make_turns, game_id, actions, version)
+            if game_over:
+                self.gm.run_db(self.gm.delete_game, game_id)
+            return Response(response_data)
+
+    def _make_turns(self, game_id: str, actions: list, version: Optional[int]) -> Tuple[dict, bool]:
+        instrumentation = Instrumentation.instance()
+        with self.gm.lock_game(game_id):
+            with instrumentation.phase('get_game'):
+                game_instance = self.gm.get_game(game_id)
+            with instrumentation.phase('make_turn'):
+                responses = game_instance.make_turns(actions)
+            self.gm.publish(game_id)
+            with instrumentation.phase('serialize'):
+                response_data = serialize_game_changes(game_instance, version)
+        response_data['steps'] = [response.to_dict() for response in responses]
+        response_data['completed'] = sum(response.state != ActionResponse.FAILED for response in responses)
+        return response_data, responses[-1].state == ActionResponse.GAME_OVER
+
+
+class StatsView(APIView):
+    """
+    Internal statistics of the server: request phases histograms, games cache, autosave and actors counters.
+    DELETE resets histograms
+    """
+    permission_classes = (IsAdminUser,)
+    gm = GameManager.instance()
+
+    def get(self, request):
+        return Response({
+            'instrumentation': Instrumentation.instance().get_stats(),
+            'game_manager': self.gm.get_stats(),
+            'autosave': self.gm.autosave.get_stats(),
+            'actors': self.gm.actors.get_stats(),
+        })
+
+    def delete(self, request):
+        Instrumentation.instance().reset()
+        return Response({'reset': True})